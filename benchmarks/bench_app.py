@@ -0,0 +1,151 @@
+# Drives /query and /order through create_app with concurrent simulated users over a synthetic catalog,
+# and reports throughput, request latency percentiles and the per-stage latencies the app records.
+import argparse
+import json
+import os
+import pathlib
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from falcon import testing
+
+from main import BACKENDS, create_app, create_components
+from services.agent.menu_index import MenuIndex
+from services.eats.fill_api import generate_catalog, write_catalog
+from services.eats.mock_eats_api import MockEatsAPI
+from services.metrics import QUANTILES, metrics
+from stores.order_journal import OrderJournal
+
+ADDRESS = "delivery address is 321 W 54th Street, Apt 2E, New York, NY 10019"
+PREFERENCES = [
+    "something with calamari",
+    "I'd like sushi tonight",
+    "I'm craving pizza with mushrooms",
+    "I want a burger with bacon and cheddar",
+    "What are some good Italian restaurants nearby?",
+    "Something vegetarian with avocado, no pork",
+]
+BUDGETS = ["limit the order under 20$", "My budget is 30 dollars", "no more than 25 bucks", "around 40"]
+CC_DETAILS = {"cc_number": "1231231", "cvv": "123", "expiry": "12/23"}
+
+def percentile(latencies, q):
+    return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+class LoadTest:
+    def __init__(self, client: testing.TestClient, seed: int):
+        self.client = client
+        self.seed = seed
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _post(self, endpoint: str, user_id: str, payload: dict):
+        start = timer()
+        resp = self.client.simulate_post(endpoint, cookies={"user_id": user_id}, json=payload)
+        elapsed = timer() - start
+        with self._lock:
+            self.latencies[endpoint].append(elapsed)
+            if resp.status_code != 200:
+                self.errors[endpoint] += 1
+        return resp
+
+    def conversation(self, n: int) -> None:
+        rng = random.Random(self.seed * 1000003 + n)
+        user_id = str(uuid.uuid4())
+        response = None
+        for text in (rng.choice(PREFERENCES), ADDRESS, rng.choice(BUDGETS)):
+            resp = self._post("/query", user_id, {"input": text})
+            if resp.status_code != 200:
+                return
+            response = json.loads(resp.text)
+            with self._lock:
+                self.statuses[response["status"]] += 1
+        if response.get("order"):
+            self._post("/order", user_id, {"order": response["order"], "cc_details": CC_DETAILS})
+
+def build_app(args, workdir: pathlib.Path):
+    # generated catalogs, the order journal and the menu index go to the work directory, never into the checkout
+    catalog = pathlib.Path(args.catalog) if args.catalog else workdir / f"catalog_{args.venues}_{args.min_items}_{args.max_items}_{args.seed}"
+    if not (catalog / "menus.json").exists():
+        num_venues, num_items = write_catalog(generate_catalog(args.venues, (args.min_items, args.max_items), args.seed, hours=not args.no_hours), catalog)
+        print(f"generated {num_venues} venues with {num_items} menu items in {catalog}")
+
+    eats_api = MockEatsAPI(OrderJournal(str(workdir / "orders")), data_dir=str(catalog), catalog_cache_dir=str(workdir / "catalog_cache"))
+    embeddings, user_store, chains = create_components(args.backend, args.llm_latency, args.token_latency, args.embedding_latency)
+    start = timer()
+    menu_index = MenuIndex.load_or_build(eats_api, embeddings.get_embeddings(), workdir / f"menu_index_{catalog.name}_{args.backend}")
+    print(f"menu index with {len(menu_index)} items ready in {timer() - start:.3f} seconds")
+    return create_app(eats_api, chains, embeddings, user_store, menu_index, args.concurrency, args.users, args.intent_mode, stage_workers=args.stage_workers)
+
+def run(args, workdir: pathlib.Path):
+    # keep every observation of the run for the stage percentiles
+    metrics.window = 1 << 20
+    load_test = LoadTest(testing.TestClient(build_app(args, workdir)), args.seed)
+    for n in range(args.warmup):
+        load_test.conversation(-1 - n)
+    load_test.latencies.clear()
+    load_test.errors.clear()
+    load_test.statuses.clear()
+    metrics.reset()
+
+    start = timer()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(load_test.conversation, range(args.users)))
+    wall = timer() - start
+
+    requests = sum(len(latencies) for latencies in load_test.latencies.values())
+    print(f"{args.users} conversations, concurrency {args.concurrency}: {requests} requests in {wall:.3f} seconds, "
+          f"{requests / wall:.2f} requests/s, {args.users / wall:.2f} conversations/s")
+    print(f"replies: {dict(load_test.statuses)}")
+
+    print(f"\n{'endpoint':<10} {'count':>7} {'errors':>7} {'mean ms':>10} " + " ".join(f"{f'p{int(q * 100)} ms':>10}" for q in QUANTILES))
+    for endpoint, latencies in sorted(load_test.latencies.items()):
+        latencies = sorted(latencies)
+        print(f"{endpoint:<10} {len(latencies):>7} {load_test.errors[endpoint]:>7} {statistics.mean(latencies) * 1000:>10.2f} "
+              + " ".join(f"{percentile(latencies, q) * 1000:>10.2f}" for q in QUANTILES))
+
+    print(f"\n{'stage':<48} {'count':>7} {'mean ms':>10} " + " ".join(f"{f'p{int(q * 100)} ms':>10}" for q in QUANTILES))
+    for stage, labels, histogram in metrics.histograms():
+        name = stage + "".join(f" {key}={value}" for key, value in labels.items())
+        print(f"{name:<48} {histogram.count:>7} {histogram.sum / histogram.count * 1000:>10.2f} "
+              + " ".join(f"{value * 1000:>10.2f}" for value in histogram.quantiles()))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--catalog", default=None, help="directory of a catalog written by fill_api, one is generated otherwise")
+    parser.add_argument("--venues", type=int, default=1000)
+    parser.add_argument("--min-items", type=int, default=10)
+    parser.add_argument("--max-items", type=int, default=40)
+    parser.add_argument("--no-hours", action="store_true", help="generate venues which are always open")
+    parser.add_argument("--users", type=int, default=32, help="conversations, each ending with an order when one is proposed")
+    parser.add_argument("--concurrency", type=int, default=4, help="conversations in flight at once")
+    parser.add_argument("--warmup", type=int, default=2, help="conversations run before measuring")
+    parser.add_argument("--intent-mode", choices=("embedding", "label"), default="embedding")
+    parser.add_argument("--stage-workers", type=int, default=4, help="threads running independent turn stages concurrently, 0 runs them in order")
+    parser.add_argument("--backend", choices=BACKENDS, default="llama", help="'fake' isolates the framework overhead from model time")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds the fake LLM takes per call")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds the fake LLM takes per generated token")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="seconds the fake embedding model takes per batch")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None,
+                        help="directory kept for generated catalogs, orders and menu indexes, reused by later runs; a temporary one is removed otherwise")
+    args = parser.parse_args()
+
+    if args.workdir:
+        run(args, pathlib.Path(args.workdir))
+    else:
+        with tempfile.TemporaryDirectory(prefix="bench_app_") as workdir:
+            run(args, pathlib.Path(workdir))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# Answers radius queries over a synthetic catalog of venues around New York with the grid index
+# and reports query latency next to a linear scan over all venues.
+import argparse
+import os
+import random
+import statistics
+import sys
+from timeit import default_timer as timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from services.eats.geo import GeoIndex, haversine_km
+
+CENTER = (40.7655, -73.9870)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--venues", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--radius", type=float, default=5.0)
+    parser.add_argument("--cell-km", type=float, default=1.0)
+    parser.add_argument("--spread", type=float, default=1.0, help="half width of the venue area in degrees")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    points = [(CENTER[0] + rng.uniform(-args.spread, args.spread), CENTER[1] + rng.uniform(-args.spread, args.spread)) for _ in range(args.venues)]
+    queries = [(CENTER[0] + rng.uniform(-0.2, 0.2), CENTER[1] + rng.uniform(-0.2, 0.2)) for _ in range(args.queries)]
+
+    start = timer()
+    index = GeoIndex(args.cell_km)
+    for i, point in enumerate(points):
+        index.add(i, point)
+    print(f"indexed {len(index)} venues in {timer() - start:.3f} seconds")
+
+    grid, scan, found = [], [], []
+    for query in queries:
+        start = timer()
+        found.append(len(index.query(query, args.radius)))
+        grid.append(timer() - start)
+        start = timer()
+        [i for i, point in enumerate(points) if haversine_km(query, point) <= args.radius]
+        scan.append(timer() - start)
+
+    print(f"{args.queries} queries, radius {args.radius} km, {statistics.mean(found):.0f} venues found on average")
+    print(f"{'':>12} {'mean ms':>10} {'p99 ms':>10}")
+    for name, latencies in (("grid", grid), ("linear scan", scan)):
+        latencies = sorted(latencies)
+        print(f"{name:>12} {statistics.mean(latencies) * 1000:>10.3f} {latencies[min(int(0.99 * len(latencies)), len(latencies) - 1)] * 1000:>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# Books orders through the order journal and reports booking latency as the order history grows,
+# next to the previous approach of rewriting the whole orders file on every booking.
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import uuid
+from timeit import default_timer as timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from stores.order_journal import OrderJournal
+
+ORDER = {
+    "status": "accepted",
+    "items": [{"title": "Margherita Pizza", "price": 12.5, "quantity": 1}],
+    "address": "123 Main St, New York, NY 10019",
+    "total_price": 12.5,
+    "payment_details": {"card_number": "4111111111111111", "expiry_date": "12/30", "cvv": "123"},
+}
+
+def report(name, latencies, every):
+    print(f"{name}")
+    print(f"{'orders':>10} {'mean ms':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for start in range(0, len(latencies), every):
+        window = sorted(latencies[start:start + every])
+        p99 = window[min(int(0.99 * len(window)), len(window) - 1)]
+        print(f"{start + len(window):>10} {statistics.mean(window) * 1000:>10.4f} {window[len(window) // 2] * 1000:>10.4f} {p99 * 1000:>10.4f}")
+
+def bench_journal(orders, fsync, compact_every):
+    with tempfile.TemporaryDirectory() as directory:
+        journal = OrderJournal(directory, fsync=fsync, compact_every=compact_every)
+        latencies = []
+        for _ in range(orders):
+            start = timer()
+            journal.append(str(uuid.uuid4()), ORDER)
+            latencies.append(timer() - start)
+        journal.close()
+
+        start = timer()
+        replayed = len(OrderJournal(directory))
+        print(f"replayed {replayed} orders on startup in {timer() - start:.3f} seconds")
+    return latencies
+
+def bench_rewrite(orders):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "orders.json")
+        history = {}
+        latencies = []
+        for _ in range(orders):
+            start = timer()
+            history[str(uuid.uuid4())] = ORDER
+            with open(path, "w") as f:
+                json.dump(history, f, indent=2)
+            latencies.append(timer() - start)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--fsync", choices=["always", "interval", "never"], default="interval")
+    parser.add_argument("--compact-every", type=int, default=10000)
+    parser.add_argument("--rewrite-orders", type=int, default=2000, help="orders to book with the full rewrite, 0 to skip")
+    args = parser.parse_args()
+
+    every = max(args.orders // 10, 1)
+    report(f"order journal (fsync={args.fsync}, compact every {args.compact_every})", bench_journal(args.orders, args.fsync, args.compact_every), every)
+    if args.rewrite_orders:
+        print()
+        report("full rewrite", bench_rewrite(args.rewrite_orders), max(args.rewrite_orders // 10, 1))
+
+if __name__ == "__main__":
+    main()
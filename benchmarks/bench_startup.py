@@ -0,0 +1,107 @@
+# Measures process startup in a fresh interpreter per startup mode: the cost of importing main, the time until the app
+# answers /healthz, until /readyz reports the models loaded, and the latency of the first query.
+# --max-import-seconds makes it exit with an error when importing main gets slower, e.g. in CI.
+import argparse
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+MODES = ("eager", "background", "lazy")
+
+def measure(args) -> dict:
+    # runs in the child process, timings are taken from before the first import
+    start = time.perf_counter()
+    import main
+    imported = time.perf_counter() - start
+
+    from falcon import testing
+    from services.eats.mock_eats_api import MockEatsAPI
+    from services.startup import HEAVY_MODULES
+    from stores.order_journal import OrderJournal
+
+    heavy = [module for module in HEAVY_MODULES if module in sys.modules]
+    workdir = pathlib.Path(args.workdir)
+    eats_api = MockEatsAPI(OrderJournal(str(workdir / "orders")), data_dir=args.catalog, catalog_cache_dir=str(workdir / "catalog_cache"))
+    app = main.create_app(eats_api, backend=args.backend, startup=args.child,
+                          menu_index_path=workdir / f"menu_index_{pathlib.Path(args.catalog).name}")
+    created = time.perf_counter() - start
+    client = testing.TestClient(app)
+    healthy = None
+    while True:
+        now = time.perf_counter() - start
+        if healthy is None and client.simulate_get("/healthz").status_code == 200:
+            healthy = now
+        # a lazy app only gets ready by serving a query
+        if args.child == "lazy" or client.simulate_get("/readyz").status_code == 200:
+            break
+        time.sleep(0.005)
+    ready = time.perf_counter() - start
+
+    query_start = time.perf_counter()
+    status = client.simulate_post("/query", json={"input": "I'd like sushi tonight"}).status_code
+    first_query = time.perf_counter() - query_start
+    eats_api.order_journal.close()
+    return {"mode": args.child, "import": imported, "heavy_modules": heavy, "app_created": created, "healthy": healthy,
+            "ready": ready, "first_query": first_query, "first_query_status": status}
+
+def run(args, workdir: pathlib.Path):
+    if args.catalog is None:
+        from services.eats.fill_api import generate_catalog, write_catalog
+
+        args.catalog = str(workdir / f"catalog_{args.venues}_10_40_0")
+        if not (pathlib.Path(args.catalog) / "menus.json").exists():
+            write_catalog(generate_catalog(args.venues, (10, 40), 0, hours=False), args.catalog)
+
+    root = pathlib.Path(__file__).parent.parent
+    child = [sys.executable, __file__, "--backend", args.backend, "--catalog", args.catalog, "--workdir", str(workdir)]
+    # the first run compiles the catalog and builds the menu index, which later starts only open
+    subprocess.run(child + ["--child", "eager"], cwd=root, capture_output=True, check=True)
+
+    print(f"{'mode':<12} {'import s':>9} {'created s':>10} {'healthy s':>10} {'ready s':>9} {'1st query s':>12}  heavy modules at import")
+    slowest_import = 0.0
+    for mode in args.modes:
+        runs = []
+        for _ in range(args.repeat):
+            output = subprocess.run(child + ["--child", mode], cwd=root, capture_output=True, text=True, check=True)
+            runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+        best = min(runs, key=lambda run: run["ready"])
+        slowest_import = max(slowest_import, min(run["import"] for run in runs))
+        print(f"{mode:<12} {best['import']:>9.3f} {best['app_created']:>10.3f} {best['healthy']:>10.3f} {best['ready']:>9.3f} "
+              f"{best['first_query']:>12.3f}  {', '.join(best['heavy_modules']) or '-'}")
+    return slowest_import
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--backend", choices=("llama", "fake"), default="fake", help="'llama' includes loading the GGUF models and MiniLM")
+    parser.add_argument("--catalog", default=None, help="directory of a catalog written by fill_api, one is generated otherwise")
+    parser.add_argument("--venues", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per mode, the fastest is reported")
+    parser.add_argument("--max-import-seconds", type=float, default=None, help="fail when importing main takes longer")
+    parser.add_argument("--workdir", default=None,
+                        help="directory kept for the generated catalog, orders and menu index, reused by later runs; a temporary one is removed otherwise")
+    parser.add_argument("--child", choices=MODES, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args)))
+        return
+
+    if args.workdir:
+        slowest_import = run(args, pathlib.Path(args.workdir))
+    else:
+        with tempfile.TemporaryDirectory(prefix="bench_startup_") as workdir:
+            slowest_import = run(args, pathlib.Path(workdir))
+
+    if args.max_import_seconds is not None and slowest_import > args.max_import_seconds:
+        print(f"importing main took {slowest_import:.3f} seconds, more than {args.max_import_seconds:.3f}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
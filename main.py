@@ -1,28 +1,190 @@
+import argparse
+import functools
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable, Optional, Tuple
 from wsgiref.simple_server import make_server
 import falcon
-from services.agent.chains import Chains
+import falcon.asgi
+from services.agent.batching_embeddings import BatchingEmbeddings
 from services.agent.embeddings import AgentEmbeddings
-from services.llm_service import OrderingAgent
+from services.agent.menu_index import MenuIndex
+from services.llm_service import INTENT_MODES, OrderingAgent
+from services.eats.async_eats_api import BlockingEatsAPI
+from services.eats.cached_eats_api import CachedEatsAPI
+from services.eats.http_eats_api import HttpEatsAPI
 from services.eats.mock_eats_api import MockEatsAPI
 from services.eats.eats_api import EatsAPI
-from resources.order_resource import OrderResource
+from services.eats.open_hours import utc_now
+from services.metrics import metrics
+from services.startup import STARTUP_MODES, AgentLoader
+from resources.health_resource import AsyncHealthResource, AsyncReadinessResource, HealthResource, ReadinessResource
+from resources.metrics_resource import AsyncMetricsResource, MetricsResource
+from resources.order_resource import AsyncOrderResource, OrderResource
+from server.backpressure import BackpressureMiddleware
+from server.wsgi import make_threaded_server, pool_threads, serve_prefork
+from stores.order_journal import OrderJournal
 from stores.userstore import UserStore
 
-def create_app(eats_api: EatsAPI, chains: Chains, embeddings: AgentEmbeddings, user_store: UserStore):
-    ordering_agent = OrderingAgent(eats_api, chains, embeddings, user_store)
-    app = falcon.App(middleware=falcon.CORSMiddleware(
-    allow_origins='http://localhost:3000', allow_credentials='*'))
+if TYPE_CHECKING:
+    # langchain, llama.cpp and the HuggingFace stack are imported when the models load, not with main
+    from services.agent.chains import Chains
+
+BACKENDS = ("llama", "fake")
+
+def _create_middleware(max_concurrency: Optional[int], max_queue: int) -> list:
+    middleware = [falcon.CORSMiddleware(
+    allow_origins='http://localhost:3000', allow_credentials='*')]
+    if max_concurrency:
+        middleware.append(BackpressureMiddleware(max_concurrency, max_queue))
+    return middleware
+
+def _register_collectors(ordering_agent: OrderingAgent, chains: "Chains", user_store: UserStore) -> None:
+    metrics.register_collector("model", chains.registry.samples)
+    metrics.register_collector("intent_path", ordering_agent.intent_classifier.stats)
+    metrics.register_collector("budget_parser", ordering_agent.budget_parser.stats)
+    metrics.register_collector("rephrase_cache", ordering_agent.rephrase_cache.stats)
+    metrics.register_collector("turn_graph", ordering_agent.turn_graph_stats.stats)
+    metrics.register_collector("sessions", user_store.stats)
+    if isinstance(ordering_agent.embeddings, BatchingEmbeddings):
+        metrics.register_collector("embeddings", ordering_agent.embeddings.stats)
+    if ordering_agent.menu_cache is not None:
+        metrics.register_collector("menu_cache", ordering_agent.menu_cache.stats)
+
+def _register_app_collectors(agent_loader: AgentLoader, middleware: list) -> None:
+    metrics.register_collector("startup", agent_loader.stats)
+    for component in middleware:
+        if isinstance(component, BackpressureMiddleware):
+            metrics.register_collector("backpressure", component.stats)
+
+def _menu_index_path(backend: str, path: Optional[pathlib.Path] = None) -> pathlib.Path:
+    # vectors of different embedding models can't share an index
+    path = pathlib.Path(path or MenuIndex.default_path())
+    return path if backend == "llama" else path.with_name(f"{path.name}_{backend}")
+
+def create_components(backend: str = "llama", llm_latency: float = 0.0, token_latency: float = 0.0,
+                      embedding_latency: float = 0.0, reuse_prefixes: bool = True) -> Tuple[AgentEmbeddings, UserStore, "Chains"]:
+    # "fake" swaps the GGUF models and MiniLM for a scripted LLM and hashing embeddings with simulated latencies
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend}, expected one of {BACKENDS}")
+    from services.agent.chains import Chains
+
+    if backend == "fake":
+        from services.agent.fake_backends import HashingEmbeddings, ScriptedModelRegistry
+
+        embeddings = AgentEmbeddings(model=HashingEmbeddings(latency=embedding_latency))
+        user_store = UserStore(embeddings)
+        return embeddings, user_store, Chains(user_store, ScriptedModelRegistry(latency=llm_latency, token_latency=token_latency), reuse_prefixes)
+    embeddings = AgentEmbeddings()
+    user_store = UserStore(embeddings)
+    return embeddings, user_store, Chains(user_store, reuse_prefixes=reuse_prefixes)
+
+def load_agent(eats_api: EatsAPI, chains: Optional["Chains"] = None, embeddings: Optional[AgentEmbeddings] = None, user_store: Optional[UserStore] = None,
+               menu_index: Optional[MenuIndex] = None, intent_mode: str = "embedding", backend: str = "llama", stage_workers: int = 4,
+               reuse_prefixes: bool = True, menu_index_path: Optional[pathlib.Path] = None, clock: Callable[[], datetime] = utc_now) -> OrderingAgent:
+    # the slow part of startup: imports the model stack, loads the models and the menu index and builds the agent
+    if chains is None or embeddings is None or user_store is None:
+        embeddings, user_store, chains = create_components(backend, reuse_prefixes=reuse_prefixes)
+    if menu_index is None:
+        menu_index = MenuIndex.load_or_build(eats_api, embeddings.get_embeddings(), _menu_index_path(backend, menu_index_path))
+    # clock is the time venues' opening hours are checked at, tests pin it
+    ordering_agent = OrderingAgent(eats_api, chains, embeddings, user_store, menu_index, clock=clock, intent_mode=intent_mode, stage_workers=stage_workers)
+    _register_collectors(ordering_agent, chains, user_store)
+    return ordering_agent
+
+def create_app(eats_api: EatsAPI, chains: Optional["Chains"] = None, embeddings: Optional[AgentEmbeddings] = None, user_store: Optional[UserStore] = None,
+               menu_index: Optional[MenuIndex] = None, max_concurrency: Optional[int] = None, max_queue: int = 0, intent_mode: str = "embedding",
+               backend: str = "llama", stage_workers: int = 4, startup: str = "eager", reuse_prefixes: bool = True,
+               menu_index_path: Optional[pathlib.Path] = None, clock: Callable[[], datetime] = utc_now):
+    agent_loader = AgentLoader(functools.partial(load_agent, eats_api, chains, embeddings, user_store, menu_index, intent_mode, backend, stage_workers,
+                                                 reuse_prefixes, menu_index_path, clock), startup)
+    middleware = _create_middleware(max_concurrency, max_queue)
+    app = falcon.App(middleware=middleware)
+    _register_app_collectors(agent_loader, middleware)
     
-    order_resource = OrderResource(ordering_agent, eats_api)
+    app.add_route('/metrics', MetricsResource(metrics))
+    app.add_route('/healthz', HealthResource(agent_loader))
+    app.add_route('/readyz', ReadinessResource(agent_loader))
+    # streamed turns run on a pool as large as the requests admitted at once, further ones are refused before reaching it
+    turn_executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="turn") if max_concurrency else None
+    order_resource = OrderResource(agent_loader, eats_api, turn_executor)
+    app.add_route('/query', order_resource, suffix='query')
+    app.add_route('/query/stream', order_resource, suffix='query_stream')
+    app.add_route('/order', order_resource, suffix='order')
+    return app
+
+def create_asgi_app(eats_api: EatsAPI, chains: Optional["Chains"] = None, embeddings: Optional[AgentEmbeddings] = None, user_store: Optional[UserStore] = None,
+                    menu_index: Optional[MenuIndex] = None, max_concurrency: int = 4, max_queue: int = 0, intent_mode: str = "embedding",
+                    backend: str = "llama", stage_workers: int = 4, startup: str = "eager", reuse_prefixes: bool = True,
+                    menu_index_path: Optional[pathlib.Path] = None, clock: Callable[[], datetime] = utc_now):
+    agent_loader = AgentLoader(functools.partial(load_agent, eats_api, chains, embeddings, user_store, menu_index, intent_mode, backend, stage_workers,
+                                                 reuse_prefixes, menu_index_path, clock), startup)
+    middleware = _create_middleware(max_concurrency, max_queue)
+    app = falcon.asgi.App(middleware=middleware)
+    _register_app_collectors(agent_loader, middleware)
+
+    app.add_route('/metrics', AsyncMetricsResource(metrics))
+    app.add_route('/healthz', AsyncHealthResource(agent_loader))
+    app.add_route('/readyz', AsyncReadinessResource(agent_loader))
+    executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="agent")
+    order_resource = AsyncOrderResource(OrderResource(agent_loader, eats_api, executor), executor)
     app.add_route('/query', order_resource, suffix='query')
+    app.add_route('/query/stream', order_resource, suffix='query_stream')
     app.add_route('/order', order_resource, suffix='order')
     return app
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="LLama Eats server")
+    parser.add_argument("--host", default="")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--threads", type=int, default=0, help="request threads per worker, 0 serves one request at a time")
+    parser.add_argument("--workers", type=int, default=1, help="pre-forked worker processes sharing the preloaded models")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="requests executing at once before queueing")
+    parser.add_argument("--max-queue", type=int, default=16, help="requests allowed to wait for a slot before answering 503")
+    parser.add_argument("--asgi", action="store_true", help="serve the ASGI app with uvicorn")
+    parser.add_argument("--eats-url", default=None, help="base url of an Eats backend, the mock data is used otherwise")
+    parser.add_argument("--orders-dir", default=None, help="directory of the mock backend's order journal, the user state directory by default")
+    parser.add_argument("--eats-concurrency", type=int, default=16, help="menus fetched at once from the Eats backend")
+    parser.add_argument("--menu-ttl", type=float, default=300.0, help="seconds menus are cached before revalidation, 0 disables the cache")
+    parser.add_argument("--backend", choices=BACKENDS, default="llama", help="'fake' serves scripted replies without loading any model")
+    parser.add_argument("--intent-mode", choices=INTENT_MODES, default="embedding",
+                        help="how the LLM fallback detects intents, 'label' constrains the model to reply with an intent label")
+    parser.add_argument("--stage-workers", type=int, default=4, help="threads running the independent stages of turns concurrently, 0 runs them in order")
+    parser.add_argument("--startup", choices=STARTUP_MODES, default="eager",
+                        help="'background' answers /healthz at once and loads the models on a warm-up thread, 'lazy' loads them on the first query")
+    parser.add_argument("--no-prefix-reuse", action="store_true", help="evaluate the whole prompt on every call instead of restoring the saved template prefix")
+    return parser.parse_args()
+
 if __name__ == '__main__':
-    embeddings = AgentEmbeddings()
-    user_store = UserStore(embeddings)
-    chains = Chains(user_store)
-    app = create_app(MockEatsAPI(), chains, embeddings, user_store)
-    with make_server('', 8000, app) as httpd:
-        print('Serving on port 8000...')
-        httpd.serve_forever()
\ No newline at end of file
+    args = parse_args()
+    if args.eats_url:
+        eats_api = BlockingEatsAPI(HttpEatsAPI(args.eats_url), concurrency=args.eats_concurrency)
+    else:
+        eats_api = MockEatsAPI(OrderJournal(args.orders_dir))
+    if args.menu_ttl > 0:
+        eats_api = CachedEatsAPI(eats_api, menu_ttl=args.menu_ttl)
+    # the models and the menu index are loaded by the app according to --startup
+    options = dict(intent_mode=args.intent_mode, backend=args.backend, stage_workers=args.stage_workers, startup=args.startup,
+                   reuse_prefixes=not args.no_prefix_reuse)
+
+    if args.asgi:
+        import uvicorn
+
+        app = create_asgi_app(eats_api, max_concurrency=args.max_concurrency or 4, max_queue=args.max_queue, **options)
+        uvicorn.run(app, host=args.host or "0.0.0.0", port=args.port)
+    elif args.threads or args.workers > 1:
+        max_concurrency = args.max_concurrency or max(args.threads, 1)
+        app = create_app(eats_api, max_concurrency=max_concurrency, max_queue=args.max_queue, **options)
+        threads = pool_threads(args.threads, max_concurrency, args.max_queue)
+        with make_threaded_server(args.host, args.port, app, threads) as httpd:
+            print(f'Serving on port {args.port} with {args.workers} workers x {threads} threads...')
+            if args.workers > 1:
+                serve_prefork(httpd, args.workers)
+            else:
+                httpd.serve_forever()
+    else:
+        app = create_app(eats_api, **options)
+        with make_server(args.host, args.port, app) as httpd:
+            print(f'Serving on port {args.port}...')
+            httpd.serve_forever()
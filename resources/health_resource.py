@@ -0,0 +1,26 @@
+import falcon
+from falcon import Request, Response
+from services.startup import AgentLoader
+
+class HealthResource:
+    # liveness: the process answers, also while the models are still loading
+    def __init__(self, agent_loader: AgentLoader):
+        self.agent_loader = agent_loader
+
+    def on_get(self, req: Request, resp: Response):
+        resp.media = self.agent_loader.status()
+        resp.status = falcon.HTTP_503 if self.agent_loader.failed else falcon.HTTP_200
+
+class ReadinessResource(HealthResource):
+    # readiness: queries are answered without waiting for the models to load
+    def on_get(self, req: Request, resp: Response):
+        resp.media = self.agent_loader.status()
+        resp.status = falcon.HTTP_200 if self.agent_loader.ready else falcon.HTTP_503
+
+class AsyncHealthResource(HealthResource):
+    async def on_get(self, req, resp):
+        super().on_get(req, resp)
+
+class AsyncReadinessResource(ReadinessResource):
+    async def on_get(self, req, resp):
+        super().on_get(req, resp)
@@ -0,0 +1,14 @@
+from falcon import Request, Response
+from services.metrics import Metrics
+
+class MetricsResource:
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    def on_get(self, req: Request, resp: Response):
+        resp.content_type = "text/plain; version=0.0.4"
+        resp.text = self.metrics.render()
+
+class AsyncMetricsResource(MetricsResource):
+    async def on_get(self, req, resp):
+        super().on_get(req, resp)
@@ -1,26 +1,56 @@
+import asyncio
 import json
+import logging
+import queue
+import threading
 import traceback
 import uuid
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import closing
+from typing import Callable, Iterator, Optional, Tuple, Union
 from falcon import Request, Response
 import falcon
+import falcon.asgi
 from services.llm_service import OrderingAgent, Response as AgentResponse, ResponseStatus
 from services.eats.eats_api import EatsAPI
+from services.metrics import metrics
+from services.startup import AgentLoader
 from models.order import CCDetails, Order, OrderDetails
 
+class TurnCancelled(BaseException):
+    # raised from the listener of a streamed turn once its client is gone, a BaseException so that the agent's
+    # broad except clauses don't swallow it
+    pass
+
 class OrderResource:
-    def __init__(self, ordering_agent: OrderingAgent, eats_api: EatsAPI):
-        self.ordering_agent = ordering_agent
+    def __init__(self, ordering_agent: Union[OrderingAgent, AgentLoader], eats_api: EatsAPI, executor: Optional[Executor] = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        # queries wait for an agent still loading, orders only need the eats api
+        self.agent_loader = ordering_agent if isinstance(ordering_agent, AgentLoader) else AgentLoader.loaded(ordering_agent)
         self.eats_api = eats_api
+        # streamed turns run on a bounded pool while the request thread writes their events
+        self.executor = executor or ThreadPoolExecutor(max_workers=4, thread_name_prefix="turn")
+
+    @property
+    def ordering_agent(self) -> OrderingAgent:
+        return self.agent_loader.get()
 
     def on_post_query(self, req: Request, resp: Response):
+        self.post_query(req, resp, req.media)
+
+    def get_or_create_user_id(self, req: Request, resp: Response) -> str:
         user_ids = req.get_cookie_values("user_id")
         if user_ids:
             user_id = user_ids[0]
         else:
             user_id = str(uuid.uuid4())
         resp.set_cookie("user_id", user_id, max_age=31556952)  # 1 year
+        return user_id
+
+    def post_query(self, req: Request, resp: Response, media: dict):
+        user_id = self.get_or_create_user_id(req, resp)
         
-        input = req.media.get('input')
+        input = media.get('input')
 
         if not input:
             resp.status = falcon.HTTP_400
@@ -29,7 +59,69 @@ class OrderResource:
         response = self.ordering_agent.handle_input(user_id, input)
         resp.text = response.model_dump_json()
 
-    def on_post_order(self, req: Request, resp: Response):  
+    def on_post_query_stream(self, req: Request, resp: Response):
+        self.post_query_stream(req, resp, req.media)
+
+    def post_query_stream(self, req: Request, resp: Response, media: dict):
+        user_id = self.get_or_create_user_id(req, resp)
+
+        input = media.get('input')
+
+        if not input:
+            resp.status = falcon.HTTP_400
+            return
+
+        resp.content_type = "text/event-stream"
+        resp.set_header("Cache-Control", "no-cache")
+        resp.set_header("X-Accel-Buffering", "no")
+        resp.stream = self._encode_events(self.stream_events(user_id, input))
+
+    def run_turn(self, user_id: str, input: str, put: Callable[[Optional[Tuple[str, dict]]], None],
+                 cancelled: Optional[threading.Event] = None) -> None:
+        def listener(event: str, data: dict) -> None:
+            # a turn whose client disconnected stops at its next event
+            if cancelled is not None and cancelled.is_set():
+                raise TurnCancelled()
+            put((event, data))
+
+        try:
+            response = self.ordering_agent.handle_input(user_id, input, listener)
+            put(("response", json.loads(response.model_dump_json())))
+        except TurnCancelled:
+            self.logger.debug(f"turn of user {user_id} cancelled, the client disconnected")
+        except Exception:
+            self.logger.exception(f"couldn't handle the streamed turn of user {user_id}")
+            put(("error", {"message": "Sorry, something went wrong."}))
+        finally:
+            put(None)
+
+    def stream_events(self, user_id: str, input: str) -> Iterator[Tuple[str, dict]]:
+        # the first event goes out before any model runs, the turn itself runs on the executor
+        yield "status", {"stage": "received"}
+        events = queue.Queue()
+        cancelled = threading.Event()
+        turn = self.executor.submit(self.run_turn, user_id, input, events.put, cancelled)
+        try:
+            while (event := events.get()) is not None:
+                yield event
+        finally:
+            # closed by the server, after the last event or when the client went away
+            cancelled.set()
+            turn.cancel()
+
+    def _encode_events(self, events: Iterator[Tuple[str, dict]]) -> Iterator[bytes]:
+        with closing(events):
+            for event, data in events:
+                yield self._encode_event(event, data)
+
+    @staticmethod
+    def _encode_event(event: str, data: dict) -> bytes:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+    def on_post_order(self, req: Request, resp: Response):
+        self.post_order(req, resp, req.media)
+
+    def post_order(self, req: Request, resp: Response, media: dict):
         user_ids = req.get_cookie_values("user_id")
         if user_ids:
             user_id = user_ids[0]
@@ -39,7 +131,7 @@ class OrderResource:
             return
 
         # Get order details from request body
-        order_data = req.media
+        order_data = media
         
         # Validate request payload structure
         if "order" not in order_data or "cc_details" not in order_data:
@@ -57,7 +149,8 @@ class OrderResource:
                             order_details=order_details, 
                             payment_details=payment_details)
 
-            order_id = self.eats_api.book_order(order_to_add)
+            with metrics.timer("book_order"):
+                order_id = self.eats_api.book_order(order_to_add)
 
             success_response = AgentResponse(
                 status=ResponseStatus.ORDER_CREATED,
@@ -73,3 +166,48 @@ class OrderResource:
             print(e)
             traceback.print_exc()
             resp.status_code = falcon.HTTP_500
+
+
+class AsyncOrderResource:
+    def __init__(self, order_resource: OrderResource, executor: Optional[Executor] = None):
+        self.order_resource = order_resource
+        self.executor = executor
+
+    async def _run(self, handler, req, resp):
+        # the agent is synchronous and model bound, so it runs on the worker executor instead of the event loop
+        media = await req.get_media()
+        await asyncio.get_running_loop().run_in_executor(self.executor, handler, req, resp, media)
+
+    async def on_post_query(self, req, resp):
+        await self._run(self.order_resource.post_query, req, resp)
+
+    async def on_post_order(self, req, resp):
+        await self._run(self.order_resource.post_order, req, resp)
+
+    async def on_post_query_stream(self, req, resp):
+        media = await req.get_media()
+        user_id = self.order_resource.get_or_create_user_id(req, resp)
+
+        input = media.get('input')
+
+        if not input:
+            resp.status = falcon.HTTP_400
+            return
+
+        resp.set_header("Cache-Control", "no-cache")
+        resp.sse = self._stream_events(user_id, input)
+
+    async def _stream_events(self, user_id: str, input: str):
+        yield falcon.asgi.SSEvent(event="status", json={"stage": "received"})
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        cancelled = threading.Event()
+        put = lambda event: loop.call_soon_threadsafe(events.put_nowait, event)
+        turn = loop.run_in_executor(self.executor, self.order_resource.run_turn, user_id, input, put, cancelled)
+        try:
+            while (event := await events.get()) is not None:
+                yield falcon.asgi.SSEvent(event=event[0], json=event[1])
+            await turn
+        finally:
+            cancelled.set()
+            turn.cancel()
@@ -0,0 +1,111 @@
+import threading
+from typing import AsyncIterator, Callable, Iterable
+
+import falcon
+
+class _SlotStream:
+    # a streamed body keeps executing after the responder returned, so its slot is held until the server closes it
+    def __init__(self, stream: Iterable, release: Callable[[], None]):
+        self.stream = stream
+        self._iterator = iter(stream)
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self) -> None:
+        release, self._release = self._release, None
+        try:
+            close = getattr(self.stream, "close", None)
+            if close is not None:
+                close()
+        finally:
+            if release is not None:
+                release()
+
+class BackpressureMiddleware:
+    def __init__(self, max_concurrency: int, max_queue: int = 0, queue_timeout: float = 30.0, retry_after: int = 1,
+                 exempt_paths: Iterable[str] = ("/metrics", "/healthz", "/readyz")):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.exempt_paths = set(exempt_paths)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        # admitted requests, both executing and waiting for a slot
+        self._pending = 0
+        self.rejected = 0
+
+    def _admit(self) -> bool:
+        with self._lock:
+            if self._pending >= self.max_concurrency + self.max_queue:
+                self.rejected += 1
+                return False
+            self._pending += 1
+            return True
+
+    def _release(self) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def _release_slot(self) -> None:
+        self._slots.release()
+        self._release()
+
+    async def _release_after(self, events: AsyncIterator) -> AsyncIterator:
+        try:
+            async for event in events:
+                yield event
+        finally:
+            aclose = getattr(events, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            self._release()
+
+    def _reject(self):
+        return falcon.HTTPServiceUnavailable(description="Server is saturated, please retry.", retry_after=self.retry_after)
+
+    def process_request(self, req, resp):
+        if req.path in self.exempt_paths:
+            return
+        if not self._admit():
+            raise self._reject()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._release()
+            with self._lock:
+                self.rejected += 1
+            raise self._reject()
+        req.context.backpressure_slot = True
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        if req.context.get("backpressure_slot"):
+            req.context.backpressure_slot = False
+            if resp.stream is not None and not hasattr(resp.stream, "read"):
+                resp.stream = _SlotStream(resp.stream, self._release_slot)
+            else:
+                self._release_slot()
+
+    async def process_request_async(self, req, resp):
+        # under ASGI execution is bounded by the worker executor, so only its queue is admitted here
+        if req.path in self.exempt_paths:
+            return
+        if not self._admit():
+            raise self._reject()
+        req.context.backpressure_admitted = True
+
+    async def process_response_async(self, req, resp, resource, req_succeeded):
+        if req.context.get("backpressure_admitted"):
+            req.context.backpressure_admitted = False
+            if resp.sse is not None:
+                # server-sent events are produced after this hook, they stay admitted until the stream ends or is closed
+                resp.sse = self._release_after(resp.sse)
+            else:
+                self._release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"pending": self._pending, "rejected": self.rejected}
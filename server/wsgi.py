@@ -0,0 +1,105 @@
+import logging
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+# threads beyond the admission capacity of the backpressure middleware, they answer its 503s and /healthz, /readyz and /metrics
+# while every admitted request is executing or waiting for a slot
+SPARE_THREADS = 4
+
+SATURATED_BODY = b"Server is saturated, please retry."
+SATURATED_RESPONSE = (b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\nContent-Type: text/plain\r\n"
+                      b"Content-Length: %d\r\nConnection: close\r\n\r\n%s" % (len(SATURATED_BODY), SATURATED_BODY))
+
+def pool_threads(threads: int, max_concurrency: int, max_queue: int) -> int:
+    # every admitted request needs a thread, either executing or waiting for a slot, and the spare ones reject the rest
+    return max(threads, max_concurrency + max_queue) + SPARE_THREADS
+
+class ThreadPoolWSGIServer(WSGIServer):
+    def __init__(self, server_address, handler_class=WSGIRequestHandler, threads: int = 8, max_backlog: Optional[int] = None,
+                 bind_and_activate: bool = True):
+        super().__init__(server_address, handler_class, bind_and_activate)
+        self.threads = threads
+        # connections accepted but not yet picked up by a thread, beyond it they are answered with 503 on accept
+        self.max_backlog = threads if max_backlog is None else max_backlog
+        self._backlog = 0
+        self._backlog_lock = threading.Lock()
+        self.rejected = 0
+        # worker threads are started lazily on the first request, so the server is safe to fork before serving
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    def process_request(self, request, client_address):
+        with self._backlog_lock:
+            saturated = self._backlog >= self.max_backlog
+            if saturated:
+                self.rejected += 1
+            else:
+                self._backlog += 1
+        if saturated:
+            self._reject(request)
+            return
+        self._executor.submit(self._process_request_thread, request, client_address)
+
+    def _reject(self, request) -> None:
+        try:
+            # the request is read first, closing a socket with unread data resets it before the client reads the response
+            request.settimeout(0.1)
+            request.recv(65536)
+            request.sendall(SATURATED_RESPONSE)
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+    def _process_request_thread(self, request, client_address):
+        with self._backlog_lock:
+            self._backlog -= 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=True)
+
+def make_threaded_server(host: str, port: int, app, threads: int = 8, max_backlog: Optional[int] = None) -> ThreadPoolWSGIServer:
+    server = ThreadPoolWSGIServer((host, port), WSGIRequestHandler, threads=threads, max_backlog=max_backlog)
+    server.set_app(app)
+    return server
+
+def serve_prefork(server: ThreadPoolWSGIServer, workers: int) -> None:
+    logger = logging.getLogger("serve_prefork")
+    # the app, models and menu index are already loaded, children share them copy-on-write
+    children: List[int] = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        children.append(pid)
+    logger.info(f"started {workers} workers: {children}")
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    finally:
+        server.socket.close()
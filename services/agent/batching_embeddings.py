@@ -0,0 +1,142 @@
+import logging
+import os
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from timeit import default_timer as timer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+def normalize_text(text: str) -> str:
+    # cache key of a text, runs of whitespace don't change the tokens of any of the supported models
+    return " ".join(text.split())
+
+def normalize_uncased(text: str) -> str:
+    # for uncased models like MiniLM, whose tokenizer lowercases the text anyway
+    return normalize_text(text).casefold()
+
+class BatchingEmbeddings(Embeddings):
+    # concurrent embed calls are queued and embedded together in one forward pass, repeated texts are served from an LRU cache.
+    # queries go through embed_documents too, which is the same forward pass for symmetric models like MiniLM.
+    # normalize only keys the cache and the pending requests, the model always embeds the text as it was given
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = 64, max_wait: float = 0.005, cache_size: int = 4096,
+                 normalize: Callable[[str], str] = normalize_text):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+        self.normalize = normalize
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._queue: "queue.Queue[Tuple[str, str, Future]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid: Optional[int] = None
+        self._worker_lock = threading.Lock()
+        self._counters = {"texts": 0, "cache_hits": 0, "batches": 0, "batched_texts": 0, "max_batch_size": 0, "bulk_texts": 0}
+        self._busy_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _ensure_worker(self) -> None:
+        # the worker thread doesn't survive a fork, so each worker process starts its own
+        with self._worker_lock:
+            if self._worker is None or self._worker_pid != os.getpid():
+                self._queue = queue.Queue()
+                self._worker = threading.Thread(target=self._run, args=(self._queue,), name="embedding-batcher", daemon=True)
+                self._worker_pid = os.getpid()
+                self._worker.start()
+
+    def _run(self, requests: "queue.Queue[Tuple[str, str, Future]]") -> None:
+        while True:
+            batch = [requests.get()]
+            deadline = timer() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - timer()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._embed_batch(batch)
+
+    def _embed_batch(self, batch: List[Tuple[str, str, Future]]) -> None:
+        # requests with the same key share the embedding of the first one's text
+        texts: Dict[str, str] = {}
+        waiting: Dict[str, List[Future]] = {}
+        for key, text, future in batch:
+            texts.setdefault(key, text)
+            waiting.setdefault(key, []).append(future)
+        try:
+            start = timer()
+            vectors = self.embeddings.embed_documents(list(texts.values()))
+            elapsed = timer() - start
+        except Exception as e:
+            for futures in waiting.values():
+                for future in futures:
+                    future.set_exception(e)
+            return
+
+        with self._stats_lock:
+            self._counters["batches"] += 1
+            self._counters["batched_texts"] += len(texts)
+            self._counters["max_batch_size"] = max(self._counters["max_batch_size"], len(texts))
+            self._busy_seconds += elapsed
+        for key, vector in zip(texts, vectors):
+            self._remember(key, vector)
+            for future in waiting[key]:
+                future.set_result(vector)
+
+    def _cached(self, key: str) -> Optional[List[float]]:
+        with self._cache_lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+            return vector
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        with self._cache_lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.normalize(text) for text in texts]
+        vectors: List[Optional[List[float]]] = [self._cached(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        with self._stats_lock:
+            self._counters["texts"] += len(texts)
+            self._counters["cache_hits"] += len(texts) - len(missing)
+
+        if len(missing) > self.max_batch_size:
+            # bulk calls like building the menu index are already batched, and would only flush the cache
+            with self._stats_lock:
+                self._counters["bulk_texts"] += len(missing)
+            for i, vector in zip(missing, self.embeddings.embed_documents([texts[i] for i in missing])):
+                vectors[i] = vector
+        elif missing:
+            self._ensure_worker()
+            futures = {}
+            for i in missing:
+                if keys[i] not in futures:
+                    futures[keys[i]] = Future()
+                    self._queue.put((keys[i], texts[i], futures[keys[i]]))
+            for i in missing:
+                vectors[i] = futures[keys[i]].result()
+        return [list(vector) for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            counters = dict(self._counters)
+            busy_seconds = self._busy_seconds
+        with self._cache_lock:
+            counters["cache_entries"] = len(self._cache)
+        counters["mean_batch_size"] = counters["batched_texts"] / counters["batches"] if counters["batches"] else 0.0
+        counters["texts_per_second"] = counters["batched_texts"] / busy_seconds if busy_seconds else 0.0
+        return counters
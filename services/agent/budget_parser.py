@@ -0,0 +1,161 @@
+import math
+import re
+import threading
+from typing import List, Optional
+
+UNITS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9,
+    "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15, "sixteen": 16,
+    "seventeen": 17, "eighteen": 18, "nineteen": 19,
+}
+TENS = {
+    "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+}
+SCALES = {"hundred": 100, "thousand": 1000}
+ORDINALS = [
+    "first", "second", "third", "fourth", "fifth", "sixth", "seventh", "eighth", "ninth", "tenth", "eleventh", "twelfth",
+    "thirteenth", "fourteenth", "fifteenth", "sixteenth", "seventeenth", "eighteenth", "nineteenth", "twentieth", "thirtieth",
+    "fortieth", "fiftieth", "sixtieth", "seventieth", "eightieth", "ninetieth", "hundredth", "thousandth",
+]
+
+APPROXIMATE_PATTERN = re.compile(r"\b(around|about|approx\w*|roughly|circa|nearly|almost|or so|give or take|more or less|something like)\b|~|\d\s*-?ish\b")
+NUMBER_PATTERN = re.compile(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?")
+RANGE_PATTERN = re.compile(r"^\s*(?:between\s+|from\s+)?(?P<low>[^\s]+)\s*(?:-|–|to|and)\s*(?P<high>[^\s]+)\s*$")
+# "and" only joins number words after a scale ("one hundred and twenty"), so "fifteen and twenty" stays a range
+NUMBER_WORD_PATTERN = re.compile(r"\b(?:a\s+)?(?:(?:(?:(?<=hundred )|(?<=thousand ))and\s+)?(?:%s)(?:[\s-]+|\b))+" % "|".join(list(UNITS) + list(TENS) + list(SCALES)))
+# "5th ave", "twenty-first street"
+ORDINAL_PATTERN = re.compile(r"\b\d+(?:st|nd|rd|th)\b")
+ORDINAL_WORD_PATTERN = re.compile(r"(?:%s)s?\b" % "|".join(ORDINALS))
+# "half a hundred", "a third of 60", "1/2"
+FRACTION_PATTERN = re.compile(r"\b(?:half|halves|quarters?|(?:a|one|two|three|four)[\s-]+(?:%s)s?|(?:%s)s)\b|\d\s*/\s*\d"
+                              % ("|".join(ORDINALS[2:10]), "|".join(ORDINALS[2:10])))
+NEGATIVE_PATTERN = re.compile(r"\b(?:minus|negative)\b")
+# an address next to the budget, or instead of it, leaves too many numbers to guess from
+ADDRESS_PATTERN = re.compile(r"\b(?:address|street|st|avenue|ave|road|rd|boulevard|blvd|lane|ln|drive|dr|broadway|apt|apartment|suite|floor|zip)\b")
+CURRENCY_PATTERN = re.compile(r"[$€£]|\busd\b|\bdollars?\b|\bbucks?\b")
+
+def _words_to_numbers(words: str) -> List[int]:
+    # number words only add up where they compose, "twenty two" or "a hundred and five".
+    # adjacent words which don't, "ten ten" or "five twenty", are separate numbers.
+    # a scale which doesn't compose, "one hundred one hundred", leaves the words unread
+    numbers = []
+    total = current = 0
+    last = None
+    for word in re.split(r"[\s-]+", words.strip()):
+        if word in ("", "and"):
+            continue
+        if word == "a":
+            current, last = 1, "a"
+            continue
+        if word in UNITS:
+            kind = "unit" if UNITS[word] < 10 else "teen"
+            composes = last in (None, "a", "hundred", "thousand") or (kind == "unit" and last == "tens")
+        elif word in TENS:
+            kind = "tens"
+            composes = last in (None, "a", "hundred", "thousand")
+        elif word == "hundred":
+            kind = "hundred"
+            composes = last in ("a", "unit", "teen", "tens") and current < 100
+        elif word == "thousand":
+            kind = "thousand"
+            composes = last in ("a", "unit", "teen", "tens", "hundred") and total == 0
+        else:
+            return []
+        if not composes:
+            if kind in ("hundred", "thousand"):
+                return []
+            numbers.append(total + current)
+            total = current = 0
+            last = None
+        if last == "a" and kind in ("unit", "teen", "tens"):
+            # "a twenty"
+            current = 0
+        if kind in ("unit", "teen"):
+            current += UNITS[word]
+        elif kind == "tens":
+            current += TENS[word]
+        elif kind == "hundred":
+            current *= 100
+        else:
+            total, current = current * 1000, 0
+        last = kind
+    if last not in (None, "a"):
+        numbers.append(total + current)
+    return numbers
+
+class BudgetParser:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _replace_number_words(self, text: str) -> str:
+        def replace(match):
+            if ORDINAL_WORD_PATTERN.match(text, match.end()):
+                # "twenty-first" is an ordinal, not twenty
+                return " "
+            numbers = _words_to_numbers(match.group(0))
+            if not numbers:
+                return match.group(0)
+            return " ".join(str(number) for number in numbers) + " "
+        return NUMBER_WORD_PATTERN.sub(replace, text)
+
+    def _extract_amounts(self, text: str) -> List[float]:
+        return [float(match.replace(",", "")) for match in NUMBER_PATTERN.findall(text)]
+
+    def _is_negative(self, text: str) -> bool:
+        if NEGATIVE_PATTERN.search(text):
+            return True
+        for match in NUMBER_PATTERN.finditer(text):
+            before = CURRENCY_PATTERN.sub("", text[:match.start()]).rstrip()
+            # a dash after another amount is a range, "20-30" or "$20 - $30"
+            if before.endswith("-") and not before[:-1].rstrip()[-1:].isdigit():
+                return True
+        return False
+
+    def _is_range(self, text: str) -> bool:
+        # strip everything around the numbers so "between $20 and $30 bucks" reads as "20 and 30"
+        numbers = list(NUMBER_PATTERN.finditer(text))
+        span = text[numbers[0].start():numbers[-1].end()]
+        prefix = text[:numbers[0].start()].rsplit(None, 1)
+        span = re.sub(r"[$€£]|usd|dollars?|bucks?", "", span)
+        if prefix and prefix[-1] in ("between", "from"):
+            span = f"{prefix[-1]} {span}"
+        return RANGE_PATTERN.match(span) is not None
+
+    def parse(self, text: str) -> Optional[float]:
+        amount = self._parse(text)
+        with self._lock:
+            if amount is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return amount
+
+    def _parse(self, text: str) -> Optional[float]:
+        text = text.lower()
+        if FRACTION_PATTERN.search(text) or ADDRESS_PATTERN.search(text):
+            # left to the math model, which sees the whole sentence
+            return None
+        normalized = self._replace_number_words(ORDINAL_PATTERN.sub(" ", text))
+        amounts = self._extract_amounts(normalized)
+        if not amounts or self._is_negative(normalized):
+            return None
+        if len(amounts) > 2 or (len(amounts) == 2 and not self._is_range(normalized)):
+            # several unrelated numbers need actual reasoning, leave it to the math model
+            return None
+
+        amount = max(amounts)
+        if APPROXIMATE_PATTERN.search(normalized):
+            # same rule the math prompt uses: round up to the next number dividable by 10
+            amount = float(math.ceil(amount / 10) * 10)
+        return amount
+
+    def hit_rate(self) -> float:
+        with self._lock:
+            total = self.hits + self.misses
+            return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
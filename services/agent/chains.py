@@ -1,16 +1,42 @@
+import json
 import logging
 import pathlib
+from typing import Dict, List, Optional
 
 from langchain.chains.base import Chain
 from langchain.chains.qa_with_sources.retrieval import RetrievalQAWithSourcesChain
 from langchain.prompts import PromptTemplate
-from langchain_community.llms import LlamaCpp
+from langchain_core.language_models import BaseLLM
+from langchain_core.runnables import Runnable
 
+from services.agent.model_registry import ModelRegistry, SharedLlamaCpp, model_registry
+from services.agent.prompt_prefix import static_prefix
 from stores.userstore import UserStore
 
+def choice_grammar(choices: List[str]) -> str:
+    # a GBNF grammar letting llama.cpp sample nothing but one of the choices
+    alternatives = " | ".join(json.dumps(choice) for choice in choices)
+    return f"root ::= {alternatives}\n"
+
 class Chains:
-    def __init__(self, user_store: UserStore):
+    def __init__(self, user_store: UserStore, registry: Optional[ModelRegistry] = None, reuse_prefixes: bool = True):
         self.user_store = user_store
+        self.registry = registry or model_registry
+        self.reuse_prefixes = reuse_prefixes
+        self._chains: Dict[str, Chain] = {}
+
+    def _load_llm(self, model_path: str) -> BaseLLM:
+        return self.registry.get_llm(model_path, verbose=False, model_kwargs={"loglevel": logging.ERROR})
+
+    def _get_llm(self, model_path: str, **generation_kwargs) -> Runnable:
+        # the model is loaded once per process, generation settings are bound per chain
+        return self._load_llm(model_path).bind(**generation_kwargs)
+
+    def _reuse_prefix(self, model_path: str, name: str, prompt: PromptTemplate) -> None:
+        # the evaluated instructions of the template are kept with the model, so calls only evaluate the variable part
+        llm = self._load_llm(model_path)
+        if self.reuse_prefixes and isinstance(llm, SharedLlamaCpp):
+            llm.register_prefix(name, static_prefix(prompt))
 
     def _get_qa_model(self) -> str:
         base_model_path = pathlib.Path(__file__).parent.parent.parent / "tmp/models--TheBloke--Llama-2-7B-GGUF/snapshots/b4e04e128f421c93a5f1e34ac4d7ca9b0af47b80"
@@ -29,8 +55,11 @@ class Chains:
         return str(base_model_path / model_filename)
     
     def create_math_chain(self) -> Chain:
+        if "math" in self._chains:
+            return self._chains["math"]
+
         model_path = self._get_math_model()
-        llm = LlamaCpp(model_path=model_path, temperature=0, max_tokens=20, verbose=False, model_kwargs={"loglevel": logging.ERROR})
+        llm = self._get_llm(model_path, temperature=0, max_tokens=20)
 
         prompt_template = """
             Solve the problem of finding the maximum amount from the following input text.
@@ -45,13 +74,18 @@ class Chains:
             input_variables=["input_text"],
             template=prompt_template,
         )
+        self._reuse_prefix(model_path, "math", prompt)
 
         math_chain = prompt | llm
+        self._chains["math"] = math_chain
         return math_chain
     
     def create_qa_chain(self, user_id: str) -> Chain:
-        model_path = self._get_qa_model()        
-        llm = LlamaCpp(model_path=model_path, temperature=0.7, max_tokens=50, verbose=False, model_kwargs={"loglevel": logging.ERROR})
+        if "qa" in self._chains:
+            return self._chains["qa"]
+
+        model_path = self._get_qa_model()
+        llm = self._get_llm(model_path, temperature=0.7, max_tokens=50)
 
         prompt_template = """
         You are an AI assistant for a food ordering app. Your purpose is to interpret what user wants and user's intent.
@@ -70,13 +104,18 @@ class Chains:
         prompt = PromptTemplate(
             template=prompt_template, input_variables=["context", "question"]
         )
+        self._reuse_prefix(model_path, "qa", prompt)
 
         qa_chain = prompt | llm
+        self._chains["qa"] = qa_chain
         return qa_chain
     
     def create_answer_chain(self) -> Chain:
-        model_path = self._get_answer_model()        
-        llm = LlamaCpp(model_path=model_path, temperature=0.7, max_tokens=100, verbose=False, model_kwargs={"loglevel": logging.ERROR})
+        if "answer" in self._chains:
+            return self._chains["answer"]
+
+        model_path = self._get_answer_model()
+        llm = self._get_llm(model_path, temperature=0.7, max_tokens=100)
 
         prompt_template = """
         You are an AI assistant for a food ordering app. Your purpose is help user make a purchase.
@@ -87,6 +126,35 @@ class Chains:
         prompt = PromptTemplate(
             template=prompt_template, input_variables=["answer"]
         )
+        self._reuse_prefix(model_path, "answer", prompt)
 
         answer_chain = prompt | llm
-        return answer_chain
\ No newline at end of file
+        self._chains["answer"] = answer_chain
+        return answer_chain
+
+    def create_intent_chain(self, labels: Dict[str, str]) -> Chain:
+        # labels maps each intent name to its description, the model is constrained to reply with one of the names
+        if "intent" in self._chains:
+            return self._chains["intent"]
+
+        model_path = self._get_qa_model()
+        grammar = self._load_llm(model_path).compile_grammar(choice_grammar(list(labels)))
+        llm = self._get_llm(model_path, temperature=0, max_tokens=16, grammar=grammar)
+
+        described = "\n        ".join(f"- {name}: {description}" for name, description in labels.items())
+        prompt_template = """
+        You are an AI assistant for a food ordering app. Classify what the user wants with exactly one of these labels:
+        """ + described.replace("{", "{{").replace("}", "}}") + """
+        Use the following pieces of context to determine user's intent:
+        {context}
+        User's input:'{question}'
+        Label:"""
+
+        prompt = PromptTemplate(
+            template=prompt_template, input_variables=["context", "question"]
+        )
+        self._reuse_prefix(model_path, "intent", prompt)
+
+        intent_chain = prompt | llm
+        self._chains["intent"] = intent_chain
+        return intent_chain
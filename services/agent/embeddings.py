@@ -1,11 +1,41 @@
+import logging
 import pathlib
-from langchain_huggingface import HuggingFaceEmbeddings
+import threading
+from typing import Optional
 from langchain_core.embeddings import Embeddings
+from services.agent.batching_embeddings import BatchingEmbeddings, normalize_text, normalize_uncased
 
 class AgentEmbeddings:
+    def __init__(self, max_batch_size: int = 64, max_wait: float = 0.005, cache_size: int = 4096, model: Optional[Embeddings] = None):
+        # model replaces MiniLM, e.g. with HashingEmbeddings for tests and benchmarks
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+        self._embeddings: Optional[BatchingEmbeddings] = None
+        self._lock = threading.Lock()
+
     def get_embeddings(self) -> Embeddings:
-        cache_path = str(pathlib.Path(__file__).parent.parent.parent / "tmp")
-        return HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2", 
-            cache_folder=cache_path
-        )
\ No newline at end of file
+        # one model and one batching queue shared by every component
+        with self._lock:
+            if self._embeddings is None:
+                model, normalize = self.model, normalize_text
+                if model is None:
+                    # imported here, torch and transformers take seconds to import and aren't needed until the model loads
+                    from langchain_huggingface import HuggingFaceEmbeddings
+                    from transformers.utils import is_torch_mps_available
+
+                    logger = logging.getLogger(self.__class__.__name__)
+                    if is_torch_mps_available():
+                        logger.debug("MPS is available and being used.")
+                    else:
+                        logger.warning("MPS is not available or not being used.")
+                    cache_path = str(pathlib.Path(__file__).parent.parent.parent / "tmp")
+                    model = HuggingFaceEmbeddings(
+                        model_name="sentence-transformers/all-MiniLM-L6-v2", 
+                        cache_folder=cache_path
+                    )
+                    # MiniLM is uncased, so texts differing only in case share a cache entry
+                    normalize = normalize_uncased
+                self._embeddings = BatchingEmbeddings(model, self.max_batch_size, self.max_wait, self.cache_size, normalize)
+            return self._embeddings
@@ -0,0 +1,116 @@
+import json
+import re
+import time
+import zlib
+from typing import Any, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+from services.agent.model_registry import ModelRegistry, ModelStats
+
+# replies of the scripted model for the prompts of Chains, the first rule whose pattern matches the prompt wins
+CHAIN_SCRIPT: List[Tuple[str, str]] = [
+    (r"Rephrase .*?:'(.*)'\.\s*Repond", r'"\1"'),
+    (r"Input Text:\D*(\d+)", r"\1"),
+    (r"input:'[^']*(\b\d{5}\b|\bstreet\b|\bst\.|\bavenue\b|\baddress\b)", "The user is providing their delivery address PROVIDE_ADDRESS."),
+    (r"input:'[^']*(\$|\bdollars?\b|\bbucks\b|\bbudget\b|\d)", "The user is specifying a budget limit they are willing to pay PROVIDE_BUDGET."),
+    (r"input:'[^']*(\bfood\b|\brestaurants?\b|\bwith\b|\bcraving\b|\blike\b|\bwant\b)", "The user is providing their preferred cuisine or ingredients PROVIDE_PREFERENCES."),
+    (r"input:'", "The user is asking a general question not related to ordering food GENERAL_QUESTION."),
+]
+
+class ScriptedLLM(LLM):
+    # a deterministic stand-in for llama.cpp, with simulated prompt and per token latency to isolate framework overhead
+    rules: List[Tuple[str, str]] = CHAIN_SCRIPT
+    default: str = ""
+    latency: float = 0.0
+    token_latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def compile_grammar(self, grammar: str) -> str:
+        return grammar
+
+    @staticmethod
+    def _choices(grammar: str) -> List[str]:
+        # the alternatives of a grammar built by chains.choice_grammar
+        return [json.loads(f'"{choice}"') for choice in re.findall(r'"((?:[^"\\]|\\.)*)"', grammar)]
+
+    def reply(self, prompt: str, grammar: Optional[str] = None) -> str:
+        reply = self.default
+        for pattern, template in self.rules:
+            match = re.search(pattern, prompt, re.DOTALL | re.IGNORECASE)
+            if match:
+                reply = match.expand(template)
+                break
+        if grammar:
+            choices = self._choices(grammar)
+            reply = next((choice for choice in choices if choice in reply), choices[0] if choices else reply)
+        return reply
+
+    @staticmethod
+    def _tokens(text: str) -> List[str]:
+        return re.findall(r"\s*\S+", text) or [text]
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, None, **kwargs))
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        time.sleep(self.latency)
+        for token in self._tokens(self.reply(prompt, kwargs.get("grammar"))):
+            time.sleep(self.token_latency)
+            chunk = GenerationChunk(text=token)
+            if run_manager is not None:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+class ScriptedModelRegistry(ModelRegistry):
+    # hands out scripted models in place of GGUF files, so Chains runs without any model on disk
+    def __init__(self, rules: Optional[List[Tuple[str, str]]] = None, latency: float = 0.0, token_latency: float = 0.0):
+        super().__init__()
+        self.rules = rules or CHAIN_SCRIPT
+        self.latency = latency
+        self.token_latency = token_latency
+
+    def get_llm(self, model_path: str, **load_kwargs) -> ScriptedLLM:
+        with self._lock:
+            model = self._models.get(model_path)
+            if model is None:
+                model = self._models[model_path] = ScriptedLLM(rules=self.rules, latency=self.latency, token_latency=self.token_latency)
+                self._stats[model_path] = ModelStats(model_path=model_path, load_seconds=0.0, rss_bytes=0)
+        return model
+
+class HashingEmbeddings(Embeddings):
+    # deterministic feature hashing of words and character trigrams, texts sharing words end up close like with MiniLM
+    def __init__(self, dimensions: int = 384, latency: float = 0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+
+    def _features(self, text: str) -> Iterator[str]:
+        for word in re.findall(r"\w+", text.casefold()):
+            yield word
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3]
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dimensions] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # one simulated forward pass per call, like a batch through the real model
+        time.sleep(self.latency)
+        return [self._vector(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
@@ -0,0 +1,54 @@
+import logging
+import threading
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+class IntentClassifier:
+    def __init__(self, embeddings: Embeddings, examples: Dict[Enum, List[str]], threshold: float = 0.1):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.intents = list(examples.keys())
+
+        texts = []
+        labels = []
+        for label, (intent, utterances) in enumerate(examples.items()):
+            texts.extend(utterances)
+            labels.extend([label] * len(utterances))
+        self._example_vectors = self._normalize(np.asarray(embeddings.embed_documents(texts), dtype=np.float32))
+        self._example_labels = np.asarray(labels)
+
+        self._lock = threading.Lock()
+        self.counters = {"fast": 0, "fallback": 0}
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def score(self, text: str) -> List[Tuple[Enum, float]]:
+        query = self._normalize(np.asarray(self.embeddings.embed_query(text), dtype=np.float32))
+        similarities = self._example_vectors @ query
+        # an intent scores as its nearest example utterance
+        scores = [(intent, float(similarities[self._example_labels == label].max())) for label, intent in enumerate(self.intents)]
+        return sorted(scores, key=lambda x: x[1], reverse=True)
+
+    def classify(self, text: str) -> Tuple[Enum, float]:
+        scores = self.score(text)
+        margin = scores[0][1] - scores[1][1] if len(scores) > 1 else scores[0][1]
+        return scores[0][0], margin
+
+    def predict(self, text: str) -> Optional[Enum]:
+        intent, margin = self.classify(text)
+        confident = margin >= self.threshold
+        with self._lock:
+            self.counters["fast" if confident else "fallback"] += 1
+        self.logger.debug(f"fast intent {intent} with margin {margin:.3f} {'accepted' if confident else 'rejected'}")
+        return intent if confident else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters)
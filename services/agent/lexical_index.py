@@ -0,0 +1,195 @@
+import json
+import pathlib
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from services.paths import atomic_write
+
+TOKEN_PATTERN = re.compile(r"[a-zà-ÿ]+")
+STOP_WORDS = {"a", "an", "and", "the", "of", "with", "in", "on", "for", "to", "some", "something", "lots", "lot", "please", "i", "want", "like", "would", "me", "my", "any"}
+
+# "no pork", "without garlic", "hold the onions", "allergic to shrimp", "dairy-free"
+NEGATION_PATTERN = re.compile(
+    r"\b(?:no|without|not|hold the|allergic to|free of|avoid(?:ing)?)\s+([a-zà-ÿ]+(?:\s+[a-zà-ÿ]+)?)|\b([a-zà-ÿ]+)[\s-]free\b",
+    re.IGNORECASE,
+)
+# ends a negated phrase, e.g. "no pork and lots of basil"
+NEGATION_END_PATTERN = re.compile(r"\s+(?:and|or|but|with|please|lots|extra)\b.*$", re.IGNORECASE)
+
+def stem(token: str) -> str:
+    # crude plural folding, enough for "mushrooms" to match "mushroom" and "tomatoes" to match "tomato"
+    if len(token) > 4 and token.endswith("oes"):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+def tokenize(text: str) -> List[str]:
+    return [stem(token) for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+def parse_preferences(text: str) -> Tuple[str, List[str]]:
+    # splits the preferences into the text to rank by and the ingredients to exclude
+    excluded = []
+    for match in NEGATION_PATTERN.finditer(text):
+        phrase = NEGATION_END_PATTERN.sub("", match.group(1) or match.group(2)).strip().lower()
+        if phrase and tokenize(phrase):
+            excluded.append(phrase)
+    fragments = [" ".join(fragment.split()) for fragment in NEGATION_PATTERN.sub(" ", text).split(",")]
+    return ", ".join(fragment for fragment in fragments if fragment), excluded
+
+class AppendedPostings:
+    # postings of the rows appended after the CSR arrays were built, shared by the indexes appending to them;
+    # each index only reads the rows below its own size
+    def __init__(self):
+        self.rows: Dict[str, List[int]] = defaultdict(list)
+        self.weights: Dict[str, List[float]] = defaultdict(list)
+        self.exclusion_rows: Dict[str, List[int]] = defaultdict(list)
+
+class LexicalIndex:
+    # BM25 over weighted item fields, postings are precomputed term weights stored as CSR arrays
+    FIELD_WEIGHTS = {"title": 2.0, "category": 1.5, "ingredients": 2.0, "subtitle": 0.5}
+    EXCLUSION_FIELDS = ("title", "ingredients")
+    TERMS_FILENAME = "lexical_terms.json"
+    ARRAYS = ("offsets", "rows", "weights", "exclusion_offsets", "exclusion_rows")
+
+    def __init__(self, terms: Dict[str, int], size: int, offsets: np.ndarray, rows: np.ndarray, weights: np.ndarray,
+                 exclusion_offsets: np.ndarray, exclusion_rows: np.ndarray, average_length: Optional[float] = None,
+                 k1: float = 1.2, b: float = 0.75, appended: Optional[AppendedPostings] = None):
+        self.terms = terms
+        self.size = size
+        self.offsets = offsets
+        self.rows = rows
+        self.weights = weights
+        self.exclusion_offsets = exclusion_offsets
+        self.exclusion_rows = exclusion_rows
+        self.average_length = average_length
+        self.k1 = k1
+        self.b = b
+        self.appended = appended
+
+    @staticmethod
+    def _field_text(item: dict, field: str) -> str:
+        value = item.get(field) or ""
+        return " ".join(value) if isinstance(value, list) else str(value)
+
+    @classmethod
+    def _counts(cls, item: dict) -> Counter:
+        counts = Counter()
+        for field, weight in cls.FIELD_WEIGHTS.items():
+            for token in tokenize(cls._field_text(item, field)):
+                counts[token] += weight
+        return counts
+
+    @classmethod
+    def _exclusion_tokens(cls, item: dict) -> Set[str]:
+        return {token for field in cls.EXCLUSION_FIELDS for token in tokenize(cls._field_text(item, field))}
+
+    @classmethod
+    def from_items(cls, items: List[dict], k1: float = 1.2, b: float = 0.75) -> "LexicalIndex":
+        frequencies: List[Counter] = []
+        exclusion_postings = defaultdict(set)
+        for row, item in enumerate(items):
+            frequencies.append(cls._counts(item))
+            for token in cls._exclusion_tokens(item):
+                exclusion_postings[token].add(row)
+
+        lengths = np.asarray([sum(counts.values()) for counts in frequencies], dtype=np.float32)
+        average_length = float(lengths.mean()) if len(items) else 0.0
+        postings = defaultdict(list)
+        for row, counts in enumerate(frequencies):
+            for token, frequency in counts.items():
+                postings[token].append((row, frequency))
+
+        vocabulary = sorted(set(postings) | set(exclusion_postings))
+        terms = {token: i for i, token in enumerate(vocabulary)}
+        offsets, rows, weights = [0], [], []
+        exclusion_offsets, exclusion_rows = [0], []
+        for token in vocabulary:
+            token_postings = postings.get(token, [])
+            idf = np.log(1 + (len(items) - len(token_postings) + 0.5) / (len(token_postings) + 0.5))
+            for row, frequency in token_postings:
+                norm = k1 * (1 - b + b * lengths[row] / average_length)
+                rows.append(row)
+                weights.append(idf * frequency * (k1 + 1) / (frequency + norm))
+            offsets.append(len(rows))
+            exclusion_rows.extend(sorted(exclusion_postings.get(token, ())))
+            exclusion_offsets.append(len(exclusion_rows))
+
+        return cls(terms, len(items), np.asarray(offsets, dtype=np.int64), np.asarray(rows, dtype=np.int32), np.asarray(weights, dtype=np.float32),
+                   np.asarray(exclusion_offsets, dtype=np.int64), np.asarray(exclusion_rows, dtype=np.int32), average_length, k1, b)
+
+    def append(self, items: List[dict]) -> "LexicalIndex":
+        # indexes items as rows following this index's rows, in time proportional to the items; their weights use the
+        # document frequencies and average length known so far, the CSR arrays are only rebuilt when the index is saved
+        appended = self.appended or AppendedPostings()
+        frequencies = [self._counts(item) for item in items]
+        average_length = self.average_length or float(np.mean([sum(counts.values()) for counts in frequencies] or [0.0]))
+        size = self.size + len(items)
+        for row, (item, counts) in enumerate(zip(items, frequencies), start=self.size):
+            length = sum(counts.values())
+            for token, frequency in counts.items():
+                term = self.terms.get(token)
+                document_frequency = (0 if term is None else int(self.offsets[term + 1] - self.offsets[term])) + len(appended.rows.get(token, ())) + 1
+                idf = np.log(1 + (size - document_frequency + 0.5) / (document_frequency + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * length / average_length) if average_length else self.k1
+                appended.rows[token].append(row)
+                appended.weights[token].append(float(idf * frequency * (self.k1 + 1) / (frequency + norm)))
+            for token in self._exclusion_tokens(item):
+                appended.exclusion_rows[token].append(row)
+        return LexicalIndex(self.terms, size, self.offsets, self.rows, self.weights, self.exclusion_offsets, self.exclusion_rows,
+                            average_length, self.k1, self.b, appended)
+
+    def _appended_rows(self, postings: Dict[str, List], token: str) -> Tuple[np.ndarray, int]:
+        # the rows appended up to this index's size, later appends of another index are ignored
+        rows = np.asarray(postings.get(token, ()), dtype=np.int64)
+        return rows, int(np.searchsorted(rows, self.size))
+
+    def save(self, path: pathlib.Path) -> None:
+        # each file is replaced whole, the arrays of a loaded index may be memory-mapped from them
+        for name in self.ARRAYS:
+            with atomic_write(path / f"lexical_{name}.npy") as f:
+                np.save(f, getattr(self, name))
+        with atomic_write(path / self.TERMS_FILENAME, "w") as f:
+            json.dump({"size": self.size, "terms": list(self.terms), "average_length": self.average_length, "k1": self.k1, "b": self.b}, f)
+
+    @classmethod
+    def load(cls, path: pathlib.Path, mmap: bool = True) -> "LexicalIndex":
+        with open(path / cls.TERMS_FILENAME) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(path / f"lexical_{name}.npy", mmap_mode="r" if mmap else None) for name in cls.ARRAYS}
+        return cls({token: i for i, token in enumerate(meta["terms"])}, meta["size"], **arrays, average_length=meta.get("average_length"),
+                   k1=meta.get("k1", 1.2), b=meta.get("b", 0.75))
+
+    def scores(self, text: str) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float32)
+        for token in set(tokenize(text)):
+            term = self.terms.get(token)
+            if term is not None:
+                start, end = self.offsets[term], self.offsets[term + 1]
+                # a document appears at most once per posting list, so fancy indexing adds without collisions
+                scores[self.rows[start:end]] += self.weights[start:end]
+            if self.appended is not None:
+                rows, end = self._appended_rows(self.appended.rows, token)
+                if end:
+                    scores[rows[:end]] += np.asarray(self.appended.weights[token][:end], dtype=np.float32)
+        return scores
+
+    def matching(self, phrases: Iterable[str]) -> np.ndarray:
+        # rows whose title or ingredients contain every token of any of the phrases
+        mask = np.zeros(self.size, dtype=bool)
+        for phrase in phrases:
+            phrase_mask = np.ones(self.size, dtype=bool)
+            for token in set(tokenize(phrase)):
+                term = self.terms.get(token)
+                token_mask = np.zeros(self.size, dtype=bool)
+                if term is not None:
+                    token_mask[self.exclusion_rows[self.exclusion_offsets[term]:self.exclusion_offsets[term + 1]]] = True
+                if self.appended is not None:
+                    rows, end = self._appended_rows(self.appended.exclusion_rows, token)
+                    token_mask[rows[:end]] = True
+                phrase_mask &= token_mask
+            mask |= phrase_mask
+        return mask
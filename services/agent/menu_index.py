@@ -0,0 +1,424 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from services.agent.lexical_index import LexicalIndex
+from services.eats.catalog_store import CatalogItems, CatalogStore
+from services.eats.eats_api import EatsAPI
+from services.metrics import metrics
+from services.paths import atomic_write, replace_directory
+
+@dataclass
+class MenuColumns:
+    # one immutable snapshot of the index, updates build a new one and swap it in
+    items: Sequence[dict]
+    vectors: np.ndarray
+    norms: np.ndarray
+    prices: np.ndarray
+    category_codes: np.ndarray
+    categories: List[str]
+    venue_codes: np.ndarray
+    venue_ids: List[str]
+    lexical_index: LexicalIndex
+    # rows of items removed by incremental updates are tombstoned until the index is saved
+    alive: Optional[np.ndarray] = None
+    category_positions: Optional[Dict[str, int]] = None
+    venue_positions: Optional[Dict[str, int]] = None
+
+    def __post_init__(self):
+        if self.category_positions is None:
+            self.category_positions = {category: code for code, category in enumerate(self.categories)}
+        if self.venue_positions is None:
+            self.venue_positions = {venue_id: code for code, venue_id in enumerate(self.venue_ids)}
+
+class AppendedItems(Sequence):
+    # the index's items followed by those added by updates, the appended list is shared by the snapshots and each one
+    # reads up to its own length
+    def __init__(self, base: Sequence[dict], appended: List[dict], length: int):
+        self.base = base
+        self.appended = appended
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(self.length))]
+        row = int(row)
+        if row < 0:
+            row += self.length
+        if not 0 <= row < self.length:
+            raise IndexError(row)
+        return self.base[row] if row < len(self.base) else self.appended[row - len(self.base)]
+
+class MenuIndex:
+    # vectors and the filterable attributes are kept in columnar arrays, filters are a vectorized mask applied before scoring
+    VECTORS_FILENAME = "vectors.npy"
+    NORMS_FILENAME = "norms.npy"
+    PRICES_FILENAME = "prices.npy"
+    CATEGORIES_FILENAME = "categories.npy"
+    VENUES_FILENAME = "venues.npy"
+    ITEMS_FILENAME = "items.bin"
+    META_FILENAME = "meta.json"
+    # bumped whenever document_text changes, so saved vectors are rebuilt
+    DOCUMENT_VERSION = "2"
+
+    def __init__(self, vectors: np.ndarray, items: Sequence[dict], fingerprint: str, norms: Optional[np.ndarray] = None,
+                 prices: Optional[np.ndarray] = None, category_codes: Optional[np.ndarray] = None, categories: Optional[List[str]] = None,
+                 venue_codes: Optional[np.ndarray] = None, venue_ids: Optional[List[str]] = None, lexical_index: Optional[LexicalIndex] = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.fingerprint = fingerprint
+        if isinstance(items, CatalogItems):
+            # the catalog's typed columns are used as they are, without building the item dicts
+            prices = items.prices.astype(np.float32) if prices is None else prices
+            if category_codes is None:
+                category_codes, categories = items.encoded("category")
+            if venue_codes is None:
+                venue_codes, venue_ids = items.encoded("venue_id")
+        if category_codes is None:
+            category_codes, categories = self._encode([item.get("category") for item in items])
+        if venue_codes is None:
+            venue_codes, venue_ids = self._encode([item["venue_id"] for item in items])
+        self._columns = MenuColumns(
+            items=items,
+            vectors=vectors,
+            norms=norms if norms is not None else np.einsum("ij,ij->i", vectors, vectors),
+            prices=prices if prices is not None else self._prices(items),
+            category_codes=category_codes,
+            categories=categories,
+            venue_codes=venue_codes,
+            venue_ids=venue_ids,
+            lexical_index=lexical_index or LexicalIndex.from_items(items),
+        )
+        self._update_lock = threading.Lock()
+        # updates append into column buffers with spare capacity, and find a venue's rows without scanning the index
+        self._buffers: Dict[str, np.ndarray] = {}
+        self._venue_rows: Optional[Dict[int, np.ndarray]] = None
+
+    @property
+    def items(self) -> Sequence[dict]:
+        return self._columns.items
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._columns.vectors
+
+    @property
+    def categories(self) -> List[str]:
+        return self._columns.categories
+
+    @property
+    def venue_ids(self) -> List[str]:
+        return self._columns.venue_ids
+
+    @property
+    def lexical_index(self) -> LexicalIndex:
+        return self._columns.lexical_index
+
+    def has_venue(self, store_id: str) -> bool:
+        return store_id in self._columns.venue_positions
+
+    def __len__(self) -> int:
+        columns = self._columns
+        return len(columns.items) if columns.alive is None else int(columns.alive.sum())
+
+    @staticmethod
+    def _prices(items: List[dict]) -> np.ndarray:
+        return np.asarray([item.get("price", np.inf) for item in items], dtype=np.float32)
+
+    @staticmethod
+    def _encode(values: List[Optional[str]], vocabulary: Optional[List[str]] = None) -> Tuple[np.ndarray, List[str]]:
+        if vocabulary is None:
+            vocabulary = sorted({value for value in values if value is not None})
+        else:
+            # codes of an existing vocabulary are kept, new values are appended
+            vocabulary = vocabulary + sorted({value for value in values if value is not None} - set(vocabulary))
+        positions = {value: code for code, value in enumerate(vocabulary)}
+        # -1 for items without the attribute, they never match a filter on it
+        return np.asarray([positions.get(value, -1) for value in values], dtype=np.int32), vocabulary
+
+    @staticmethod
+    def default_path() -> pathlib.Path:
+        return pathlib.Path(__file__).parent.parent.parent / "tmp/menu_index"
+
+    @staticmethod
+    def collect_items(eats_api: EatsAPI) -> Sequence[dict]:
+        catalog = getattr(eats_api, "catalog", None)
+        if isinstance(catalog, CatalogStore):
+            return catalog.items()
+        with metrics.timer("menu_fetch"):
+            menus = eats_api.get_menus([venue["store_id"] for venue in eats_api.get_venues()])
+        items = []
+        for store_id, menu in menus.items():
+            for item in menu:
+                # copy so the eats api data is never mutated
+                items.append({**item, "venue_id": store_id})
+        return items
+
+    @staticmethod
+    def document_text(item: dict) -> str:
+        # only the fields describing the dish, ids and prices are noise to the embedding
+        parts = [item.get("title", ""), item.get("category", "")]
+        if item.get("ingredients"):
+            parts.append("ingredients: " + ", ".join(item["ingredients"]))
+        parts.append(item.get("subtitle", ""))
+        return ". ".join(part for part in parts if part)
+
+    @staticmethod
+    def _item_key(item: dict) -> str:
+        return json.dumps(item, sort_keys=True)
+
+    @classmethod
+    def compute_fingerprint(cls, items: Sequence[dict]) -> str:
+        digest = hashlib.sha1(cls.DOCUMENT_VERSION.encode("utf-8"))
+        # independent of the item order, which changes with incremental updates
+        for key in sorted(cls._item_key(item) for item in items):
+            digest.update(key.encode("utf-8"))
+        return digest.hexdigest()
+
+    @classmethod
+    def from_items(cls, items: Sequence[dict], embeddings: Embeddings) -> "MenuIndex":
+        vectors = np.asarray(embeddings.embed_documents([cls.document_text(item) for item in items]), dtype=np.float32)
+        if len(items) == 0:
+            vectors = vectors.reshape(0, len(embeddings.embed_query("hello world")))
+        return cls(vectors, items, cls.compute_fingerprint(items))
+
+    @classmethod
+    def build(cls, eats_api: EatsAPI, embeddings: Embeddings) -> "MenuIndex":
+        return cls.from_items(cls.collect_items(eats_api), embeddings)
+
+    def _append(self, name: str, column: np.ndarray, added: np.ndarray) -> np.ndarray:
+        # writes past the end of the column into spare capacity, so earlier snapshots, which only see their own rows, stay
+        # valid; the buffer grows geometrically, so appending costs time proportional to the added rows on average
+        size = len(column)
+        buffer = self._buffers.get(name)
+        if buffer is None or column.base is not buffer or len(buffer) < size + len(added):
+            # the first update copies the, possibly memory-mapped, column into a writable buffer
+            capacity = size + max(size // 4, len(added), 1024)
+            buffer = np.empty((capacity,) + column.shape[1:], dtype=column.dtype)
+            buffer[:size] = column
+            self._buffers[name] = buffer
+        buffer[size:size + len(added)] = added
+        return buffer[:size + len(added)]
+
+    @staticmethod
+    def _append_codes(values: List[Optional[str]], vocabulary: List[str], positions: Dict[str, int]) -> np.ndarray:
+        # codes of the values, new ones are appended to the vocabulary, which the snapshots share
+        for value in values:
+            if value is not None and value not in positions:
+                positions[value] = len(vocabulary)
+                vocabulary.append(value)
+        return np.asarray([positions.get(value, -1) for value in values], dtype=np.int32)
+
+    def _rows_of_venue(self, columns: MenuColumns, code: Optional[int]) -> np.ndarray:
+        if self._venue_rows is None:
+            # built on the first update, which sees no tombstones yet, and kept current by the later ones
+            order = np.argsort(columns.venue_codes, kind="stable")
+            bounds = np.searchsorted(columns.venue_codes[order], np.arange(len(columns.venue_ids) + 1))
+            self._venue_rows = {venue: order[bounds[venue]:bounds[venue + 1]] for venue in range(len(columns.venue_ids))}
+        return self._venue_rows.get(code, np.empty(0, dtype=np.int64))
+
+    def update_venue(self, store_id: str, menu: List[dict], embeddings: Embeddings) -> Tuple[int, int]:
+        # tombstones the venue's items which are gone or changed and embeds only the new or changed ones, the work is
+        # proportional to the venue's menu rather than to the catalog
+        with self._update_lock:
+            columns = self._columns
+            size = len(columns.items)
+            code = columns.venue_positions.get(store_id)
+            rows = self._rows_of_venue(columns, code)
+            current = {self._item_key(columns.items[row]): row for row in rows}
+            fresh = {}
+            for item in menu:
+                item = {**item, "venue_id": store_id}
+                fresh.setdefault(self._item_key(item), item)
+
+            removed = [row for key, row in current.items() if key not in fresh]
+            added = [item for key, item in fresh.items() if key not in current]
+            if not removed and not added:
+                return 0, 0
+
+            # tombstones are also seen by a search still holding the previous snapshot, which is the newer state anyway
+            alive = self._append("alive", np.ones(size, dtype=bool) if columns.alive is None else columns.alive, np.ones(len(added), dtype=bool))
+            alive[removed] = False
+            items, vectors, norms, prices = columns.items, columns.vectors, columns.norms, columns.prices
+            category_codes, venue_codes, lexical_index = columns.category_codes, columns.venue_codes, columns.lexical_index
+            if added:
+                with metrics.timer("menu_reembed"):
+                    added_vectors = np.asarray(embeddings.embed_documents([self.document_text(item) for item in added]), dtype=np.float32)
+                if not isinstance(items, AppendedItems):
+                    items = AppendedItems(items, [], size)
+                items.appended.extend(added)
+                items = AppendedItems(items.base, items.appended, size + len(added))
+                vectors = self._append("vectors", vectors, added_vectors)
+                norms = self._append("norms", norms, np.einsum("ij,ij->i", added_vectors, added_vectors))
+                prices = self._append("prices", prices, self._prices(added))
+                added_categories = self._append_codes([item.get("category") for item in added], columns.categories, columns.category_positions)
+                category_codes = self._append("category_codes", category_codes, added_categories)
+                code = int(self._append_codes([store_id], columns.venue_ids, columns.venue_positions)[0])
+                venue_codes = self._append("venue_codes", venue_codes, np.full(len(added), code, dtype=np.int32))
+                # only the added items are indexed, the postings of tombstoned rows stay but the rows are masked out of searches
+                lexical_index = lexical_index.append(added)
+
+            self._venue_rows[code] = np.concatenate([np.setdiff1d(rows, removed), np.arange(size, size + len(added))])
+            self._columns = MenuColumns(items, vectors, norms, prices, category_codes, columns.categories, venue_codes, columns.venue_ids,
+                                        lexical_index, alive, columns.category_positions, columns.venue_positions)
+            self.fingerprint = None
+        self.logger.debug(f"updated venue {store_id}: {len(added)} items embedded, {len(removed)} tombstoned")
+        return len(added), len(removed)
+
+    def save(self, path: Optional[pathlib.Path] = None) -> None:
+        path = pathlib.Path(path or self.default_path())
+        # the index is written to a new directory which then replaces the old one, so a partially written index is
+        # never picked up and searches over the memory-mapped columns of the old one keep reading its files
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+        columns = self._columns
+        rows = np.flatnonzero(columns.alive) if columns.alive is not None else slice(None)
+        items = [columns.items[row] for row in rows] if columns.alive is not None else columns.items
+        lexical_index = LexicalIndex.from_items(items) if columns.alive is not None else columns.lexical_index
+        fingerprint = self.fingerprint or self.compute_fingerprint(items)
+
+        try:
+            for filename, column in ((self.VECTORS_FILENAME, columns.vectors), (self.NORMS_FILENAME, columns.norms),
+                                     (self.PRICES_FILENAME, columns.prices), (self.CATEGORIES_FILENAME, columns.category_codes),
+                                     (self.VENUES_FILENAME, columns.venue_codes)):
+                with atomic_write(tmp_path / filename) as f:
+                    np.save(f, column[rows])
+            lexical_index.save(tmp_path)
+            catalog = items.catalog if isinstance(items, CatalogItems) else CatalogStore.from_items(items)
+            catalog.save(tmp_path / self.ITEMS_FILENAME)
+            with atomic_write(tmp_path / self.META_FILENAME, "w") as f:
+                json.dump({"fingerprint": fingerprint, "size": len(items), "categories": columns.categories, "venue_ids": columns.venue_ids,
+                           "document_version": self.DOCUMENT_VERSION, "catalog": catalog.digest}, f)
+            replace_directory(tmp_path, path)
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: Optional[pathlib.Path] = None, mmap: bool = True) -> "MenuIndex":
+        path = pathlib.Path(path or cls.default_path())
+        with open(path / cls.META_FILENAME) as f:
+            meta = json.load(f)
+        # item dicts are built from the memory-mapped catalog only for the results returned
+        items = CatalogStore.open(path / cls.ITEMS_FILENAME).items()
+        mmap_mode = "r" if mmap else None
+        return cls(
+            np.load(path / cls.VECTORS_FILENAME, mmap_mode=mmap_mode),
+            items,
+            meta["fingerprint"],
+            norms=np.load(path / cls.NORMS_FILENAME, mmap_mode=mmap_mode),
+            prices=np.load(path / cls.PRICES_FILENAME, mmap_mode=mmap_mode),
+            category_codes=np.load(path / cls.CATEGORIES_FILENAME, mmap_mode=mmap_mode),
+            categories=meta["categories"],
+            venue_codes=np.load(path / cls.VENUES_FILENAME, mmap_mode=mmap_mode),
+            venue_ids=meta["venue_ids"],
+            lexical_index=LexicalIndex.load(path, mmap),
+        )
+
+    @classmethod
+    def load_or_build(cls, eats_api: EatsAPI, embeddings: Embeddings, path: Optional[pathlib.Path] = None) -> "MenuIndex":
+        path = pathlib.Path(path or cls.default_path())
+        items = cls.collect_items(eats_api)
+        logger = logging.getLogger(cls.__name__)
+
+        if (path / cls.META_FILENAME).exists():
+            try:
+                menu_index = cls.load(path)
+                # an index built from this very catalog is reused without fingerprinting its items
+                same_catalog = isinstance(items, CatalogItems) and cls._same_catalog(path, items.catalog)
+                if same_catalog or menu_index.fingerprint == cls.compute_fingerprint(items):
+                    logger.debug(f"loaded menu index with {len(menu_index.items)} items from {path}")
+                    return menu_index
+                logger.info("menu catalog changed, rebuilding menu index")
+            except Exception as e:
+                logger.warning(f"couldn't load menu index from {path}: {e}")
+
+        menu_index = cls.from_items(items, embeddings)
+        menu_index.save(path)
+        logger.debug(f"built menu index with {len(items)} items at {path}")
+        return menu_index
+
+    @classmethod
+    def _same_catalog(cls, path: pathlib.Path, catalog: CatalogStore) -> bool:
+        with open(path / cls.META_FILENAME) as f:
+            meta = json.load(f)
+        return meta.get("catalog") == catalog.digest and meta.get("document_version") == cls.DOCUMENT_VERSION
+
+    @staticmethod
+    def _codes(positions: dict, values: Iterable[str]) -> np.ndarray:
+        return np.asarray([positions[value] for value in set(values) if value in positions], dtype=np.int32)
+
+    @classmethod
+    def _mask(cls, columns: MenuColumns, max_price: Optional[float] = None, venue_ids: Optional[Iterable[str]] = None,
+              categories: Optional[Iterable[str]] = None) -> np.ndarray:
+        mask = np.ones(len(columns.items), dtype=bool) if columns.alive is None else columns.alive.copy()
+        if max_price is not None:
+            mask &= columns.prices <= max_price
+        if venue_ids is not None:
+            mask &= np.isin(columns.venue_codes, cls._codes(columns.venue_positions, venue_ids))
+        if categories is not None:
+            mask &= np.isin(columns.category_codes, cls._codes(columns.category_positions, categories))
+        return mask
+
+    def mask(self, max_price: Optional[float] = None, venue_ids: Optional[Iterable[str]] = None, categories: Optional[Iterable[str]] = None) -> np.ndarray:
+        return self._mask(self._columns, max_price, venue_ids, categories)
+
+    @staticmethod
+    def _distances(columns: MenuColumns, rows: np.ndarray, query_vector: Iterable[float]) -> np.ndarray:
+        # exact squared L2 distances to the eligible items only, lower is closer
+        query = np.asarray(query_vector, dtype=np.float32)
+        return columns.norms[rows] - 2 * (columns.vectors[rows] @ query) + query @ query
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        # positions of the k lowest scores, in order
+        top = np.argpartition(scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        return top[np.argsort(scores[top], kind="stable")]
+
+    def search(self, query_vector: Iterable[float], k: int = 5, max_price: Optional[float] = None, venue_ids: Optional[Iterable[str]] = None,
+               categories: Optional[Iterable[str]] = None) -> List[Tuple[dict, float]]:
+        columns = self._columns
+        if k <= 0:
+            return []
+        rows = np.flatnonzero(self._mask(columns, max_price, venue_ids, categories))
+        if len(rows) == 0:
+            return []
+
+        distances = self._distances(columns, rows, query_vector)
+        return [(columns.items[rows[i]], float(max(distances[i], 0.0))) for i in self._top_k(distances, k)]
+
+    @staticmethod
+    def _min_max(scores: np.ndarray) -> np.ndarray:
+        spread = scores.max() - scores.min()
+        if spread <= 0:
+            return np.zeros_like(scores)
+        return (scores - scores.min()) / spread
+
+    def hybrid_search(self, query_vector: Iterable[float], query_text: str, k: int = 5, max_price: Optional[float] = None, venue_ids: Optional[Iterable[str]] = None,
+                      categories: Optional[Iterable[str]] = None, excluded: Optional[Iterable[str]] = None, vector_weight: float = 0.6) -> List[Tuple[dict, float]]:
+        columns = self._columns
+        if k <= 0:
+            return []
+        mask = self._mask(columns, max_price, venue_ids, categories)
+        if excluded:
+            mask &= ~columns.lexical_index.matching(excluded)
+        rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            return []
+
+        # vector similarity and BM25 are min-max scaled over the eligible items and fused, higher is better
+        distances = self._distances(columns, rows, query_vector)
+        lexical = columns.lexical_index.scores(query_text)[rows]
+        scores = vector_weight * self._min_max(-distances) + (1 - vector_weight) * self._min_max(lexical)
+        return [(columns.items[rows[i]], float(scores[i])) for i in self._top_k(-scores, k)]
@@ -0,0 +1,162 @@
+import logging
+import os
+import queue
+import resource
+import threading
+from contextlib import closing
+from dataclasses import dataclass
+from timeit import default_timer as timer
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_community.llms import LlamaCpp
+from pydantic import PrivateAttr
+
+from services.agent.prompt_prefix import PrefixStateCache
+from services.metrics import metrics
+
+def current_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is the peak, in KiB on linux and bytes on macOS
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if os.uname().sysname == "Darwin" else usage * 1024
+
+class SharedLlamaCpp(LlamaCpp):
+    # a llama.cpp context is not thread safe, so calls into a shared model are serialized
+    _lock: Any = PrivateAttr(default_factory=threading.RLock)
+    _prefixes: PrefixStateCache = PrivateAttr(default_factory=PrefixStateCache)
+
+    @property
+    def lock(self) -> threading.RLock:
+        return self._lock
+
+    @property
+    def prefixes(self) -> PrefixStateCache:
+        return self._prefixes
+
+    def register_prefix(self, name: str, text: str) -> None:
+        self._prefixes.register(name, text)
+
+    def compile_grammar(self, grammar: str) -> Any:
+        from llama_cpp import LlamaGrammar
+
+        return LlamaGrammar.from_string(grammar, verbose=False)
+
+    def _prefill(self, prompt: str) -> None:
+        # evaluates the prompt ahead of generation so prompt evaluation is timed on its own
+        if not PrefixStateCache.supports(self.client):
+            return
+        template = self._prefixes.match(prompt)
+        try:
+            with metrics.timer("prompt_eval", template=template or "none"):
+                self._prefixes.prefill(self.client, prompt, template)
+        except Exception as e:
+            logging.getLogger(self.__class__.__name__).warning(f"prompt prefill failed, evaluating the whole prompt: {e}")
+            self.client.reset()
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        with self._lock:
+            self._prefill(prompt)
+            return super()._call(prompt, stop=stop, run_manager=run_manager, **kwargs)
+
+    def _generate_chunks(self, prompt, stop, kwargs, chunks: queue.Queue, stopped: threading.Event) -> None:
+        try:
+            with self._lock, closing(super()._stream(prompt, stop=stop, **kwargs)) as generation:
+                self._prefill(prompt)
+                for chunk in generation:
+                    if stopped.is_set():
+                        break
+                    chunks.put(chunk)
+        except BaseException as e:
+            chunks.put(e)
+        finally:
+            chunks.put(None)
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        # the generation holds the lock from its first to its last token on a thread of its own and hands each chunk over as
+        # it's produced. the consumer gets the tokens as they're generated without ever holding the lock, so a slow consumer
+        # doesn't keep the model locked, and one which stops reading or fails stops the generation at the next token
+        chunks: queue.Queue = queue.Queue()
+        stopped = threading.Event()
+        threading.Thread(target=self._generate_chunks, args=(prompt, stop, kwargs, chunks, stopped), name="llama-stream", daemon=True).start()
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    return
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                if run_manager is not None:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        finally:
+            stopped.set()
+
+@dataclass
+class ModelStats:
+    model_path: str
+    load_seconds: float
+    rss_bytes: int
+
+class ModelRegistry:
+    def __init__(self, loader: Callable[..., SharedLlamaCpp] = SharedLlamaCpp):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.loader = loader
+        self._models: Dict[str, SharedLlamaCpp] = {}
+        self._stats: Dict[str, ModelStats] = {}
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get_llm(self, model_path: str, **load_kwargs) -> SharedLlamaCpp:
+        model = self._models.get(model_path)
+        if model is not None:
+            return model
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(model_path, threading.Lock())
+
+        with load_lock:
+            model = self._models.get(model_path)
+            if model is None:
+                rss_before = current_rss_bytes()
+                start = timer()
+                model = self.loader(model_path=model_path, **load_kwargs)
+                end = timer()
+                stats = ModelStats(model_path=model_path, load_seconds=end - start, rss_bytes=max(current_rss_bytes() - rss_before, 0))
+                self._stats[model_path] = stats
+                self._models[model_path] = model
+                metrics.observe("model_load", stats.load_seconds, model=os.path.basename(model_path))
+                self.logger.info(f"loaded {os.path.basename(model_path)} in {stats.load_seconds:.3f} seconds, resident memory +{stats.rss_bytes / 2**20:.1f} MiB")
+        return model
+
+    def is_loaded(self, model_path: str) -> bool:
+        return model_path in self._models
+
+    def get_stats(self, model_path: str) -> Optional[ModelStats]:
+        return self._stats.get(model_path)
+
+    def stats(self) -> List[ModelStats]:
+        return list(self._stats.values())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+            self._stats.clear()
+            self._load_locks.clear()
+
+    def samples(self) -> list:
+        samples = []
+        for stats in self.stats():
+            labels = {"model": os.path.basename(stats.model_path)}
+            samples.append(("load_seconds", labels, stats.load_seconds))
+            samples.append(("resident_bytes", labels, stats.rss_bytes))
+            model = self._models.get(stats.model_path)
+            if isinstance(model, SharedLlamaCpp):
+                for template, counters in model.prefixes.stats().items():
+                    for key, value in counters.items():
+                        samples.append((f"prompt_{key}", {**labels, "template": template}, value))
+        return samples
+
+model_registry = ModelRegistry()
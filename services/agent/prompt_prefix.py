@@ -0,0 +1,100 @@
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain.prompts import PromptTemplate
+
+def static_prefix(prompt: PromptTemplate) -> str:
+    # the text a template renders before its first variable, identical for every call
+    marker = "\x00"
+    return prompt.format(**{name: marker for name in prompt.input_variables}).split(marker, 1)[0]
+
+def common_prefix_length(a: Sequence[int], b: Sequence[int]) -> int:
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+@dataclass
+class _Prefix:
+    name: str
+    text: str
+    tokens: Optional[List[int]] = None
+    state: Any = None
+
+class PrefixStateCache:
+    # llama.cpp skips only the prompt tokens still in its context, which the previous call of another template has usually
+    # overwritten. the evaluated static prefix of each template is saved once and restored before its calls instead,
+    # so only the variable suffix is evaluated
+    def __init__(self):
+        self._prefixes: Dict[str, _Prefix] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def supports(client: Any) -> bool:
+        return all(hasattr(client, name) for name in ("tokenize", "eval", "reset", "save_state", "load_state", "input_ids"))
+
+    def register(self, name: str, text: str) -> None:
+        with self._lock:
+            prefix = self._prefixes.get(name)
+            if prefix is None or prefix.text != text:
+                self._prefixes[name] = _Prefix(name, text)
+
+    def match(self, prompt: str) -> Optional[str]:
+        best = None
+        for prefix in list(self._prefixes.values()):
+            if prefix.text and prompt.startswith(prefix.text) and (best is None or len(prefix.text) > len(best.text)):
+                best = prefix
+        return best.name if best is not None else None
+
+    def _count(self, template: Optional[str], **counts) -> None:
+        with self._lock:
+            counters = self._counters.setdefault(template or "none", {
+                "calls": 0, "tokens": 0, "reused_tokens": 0, "evaluated_tokens": 0, "prefix_builds": 0, "prefix_restores": 0,
+            })
+            for key, value in counts.items():
+                counters[key] += value
+
+    def _restore(self, client: Any, prefix: _Prefix, tokens: List[int]) -> int:
+        # returns how many prefix tokens had to be evaluated to build the state
+        if prefix.tokens is None:
+            # the last token of the prefix may merge with the start of the suffix when the whole prompt is tokenized
+            prefix.tokens = list(client.tokenize(prefix.text.encode("utf-8")))[:-1]
+        if not prefix.tokens or tokens[:len(prefix.tokens)] != prefix.tokens:
+            return 0
+        if common_prefix_length(client.input_ids[:client.n_tokens], prefix.tokens) == len(prefix.tokens):
+            return 0
+        if prefix.state is None:
+            client.reset()
+            client.eval(prefix.tokens)
+            prefix.state = client.save_state()
+            self._count(prefix.name, prefix_builds=1)
+            return len(prefix.tokens)
+        client.load_state(prefix.state)
+        self._count(prefix.name, prefix_restores=1)
+        return 0
+
+    def prefill(self, client: Any, prompt: str, template: Optional[str] = None) -> int:
+        # callers hold the model lock. evaluates the prompt up to its last token, which llama.cpp evaluates itself
+        # to sample from its logits, and returns how many tokens were reused
+        tokens = list(client.tokenize(prompt.encode("utf-8")))
+        prefix = self._prefixes.get(template) if template is not None else None
+        built = self._restore(client, prefix, tokens) if prefix is not None else 0
+
+        reused = common_prefix_length(client.input_ids[:client.n_tokens], tokens[:-1])
+        if reused == 0:
+            client.reset()
+        else:
+            client.n_tokens = reused
+        if len(tokens) - 1 > reused:
+            client.eval(tokens[reused:-1])
+        reused -= built
+        self._count(template, calls=1, tokens=len(tokens), reused_tokens=reused, evaluated_tokens=len(tokens) - reused)
+        return reused
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {template: dict(counters) for template, counters in self._counters.items()}
@@ -0,0 +1,120 @@
+import logging
+import os
+import random
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional
+
+class RephraseCache:
+    def __init__(self, rephrase: Callable[[str], Optional[str]], pool_size: int = 5, max_messages: int = 256):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.rephrase = rephrase
+        self.pool_size = pool_size
+        self.max_messages = max_messages
+        self._pools: OrderedDict[str, List[str]] = OrderedDict()
+        self._pinned = set()
+        self._lock = threading.Lock()
+        # the rephrasing model is shared, so variants are generated one at a time
+        self._generate_lock = threading.Lock()
+        self._warmup_thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _generate(self, message: str) -> Optional[str]:
+        with self._generate_lock:
+            try:
+                return self.rephrase(message)
+            except Exception as e:
+                self.logger.warning(f"couldn't rephrase {message}: {e}")
+                return None
+
+    def _add(self, message: str, variant: str) -> None:
+        with self._lock:
+            pool = self._pools.setdefault(message, [])
+            self._pools.move_to_end(message)
+            if variant not in pool and len(pool) < self.pool_size:
+                pool.append(variant)
+            self._evict()
+
+    def _evict(self) -> None:
+        # canned messages are pinned, only dynamic messages are evicted in LRU order
+        evictable = len(self._pools) - len(self._pinned)
+        for message in list(self._pools.keys()):
+            if evictable <= self.max_messages:
+                break
+            if message in self._pinned:
+                continue
+            del self._pools[message]
+            self.evictions += 1
+            evictable -= 1
+
+    def _fill(self, messages: List[str]) -> None:
+        # round robin so every message gets a first variant as early as possible
+        for _ in range(self.pool_size):
+            for message in messages:
+                if len(self._pools.get(message, [])) >= self.pool_size:
+                    continue
+                variant = self._generate(message)
+                if variant is not None:
+                    self._add(message, variant)
+        self.logger.debug(f"rephrase pools warmed for {len(messages)} messages")
+
+    def _warm_up(self, messages: List[str]) -> None:
+        try:
+            self._fill(messages)
+        finally:
+            _warming.discard(self)
+
+    def warm(self, messages: Iterable[str], background: bool = True) -> None:
+        messages = list(messages)
+        with self._lock:
+            self._pinned.update(messages)
+        if not background:
+            self._fill(messages)
+            return
+        _warming.add(self)
+        self._warmup_thread = threading.Thread(target=self._warm_up, args=(messages,), name="rephrase-warmup", daemon=True)
+        self._warmup_thread.start()
+
+    def wait_warm(self, timeout: Optional[float] = None) -> bool:
+        if self._warmup_thread is None:
+            return True
+        self._warmup_thread.join(timeout)
+        return not self._warmup_thread.is_alive()
+
+    def get(self, message: str) -> str:
+        with self._lock:
+            pool = self._pools.get(message)
+            if pool:
+                self._pools.move_to_end(message)
+                self.hits += 1
+                return random.choice(pool)
+            self.misses += 1
+
+        variant = self._generate(message)
+        if variant is None:
+            return message
+        self._add(message, variant)
+        return variant
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "messages": len(self._pools),
+                "variants": sum(len(pool) for pool in self._pools.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+# caches whose background warm-up is running. a pre-fork server must not fork while warm-up holds the model lock,
+# children would inherit it locked, so forks wait for them; one hook for all caches, forks without warm-ups don't wait
+_warming: "weakref.WeakSet[RephraseCache]" = weakref.WeakSet()
+
+def _wait_warm_before_fork() -> None:
+    for cache in list(_warming):
+        cache.wait_warm()
+
+os.register_at_fork(before=_wait_warm_before_fork)
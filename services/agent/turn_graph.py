@@ -0,0 +1,198 @@
+import logging
+import threading
+from concurrent.futures import Executor
+from contextlib import ExitStack, nullcontext
+from timeit import default_timer as timer
+from typing import Any, Callable, ContextManager, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from services.metrics import TurnRecorder, metrics
+
+class Node:
+    def __init__(self, name: str, fn: Callable, args: tuple, after: Sequence["Node"], speculative: bool):
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.after = list(after)
+        self.speculative = speculative
+        # whether the node was started before the turn knew it needed it, kept once the turn asks for it
+        self.speculated = speculative
+        self.used = False
+        self.cancelled = False
+        self.started = False
+        # when the node could start: when it was added, or when its result was asked for if nodes run lazily
+        self.requested = 0.0
+        # when the turn got hold of its result
+        self.consumed: Optional[float] = None
+        self.start = 0.0
+        self.end = 0.0
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+        self.callbacks: List[Callable[[], None]] = []
+
+class TurnGraphStats:
+    def __init__(self):
+        self.speculative = 0
+        self.speculative_used = 0
+        self.speculative_discarded = 0
+        self.cancelled = 0
+        self._lock = threading.Lock()
+
+    def count(self, **counts) -> None:
+        with self._lock:
+            for key, value in counts.items():
+                setattr(self, key, getattr(self, key) + value)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "speculative": self.speculative,
+                "speculative_used": self.speculative_used,
+                "speculative_discarded": self.speculative_discarded,
+                "cancelled": self.cancelled,
+            }
+
+class TurnGraph:
+    # the stages of one turn as a small dependency graph. a node is submitted to the worker pool once the nodes it
+    # runs after are done, so independent stages overlap. speculative nodes are started before the turn knows it needs
+    # them and are cancelled, or their result dropped, when it doesn't. without an executor nodes run lazily on the
+    # calling thread when their result is asked for, exactly like sequential code
+    def __init__(self, executor: Optional[Executor] = None, context: Optional[Callable[[], ContextManager]] = None,
+                 stats: Optional[TurnGraphStats] = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.executor = executor
+        self.context = context
+        self.stats = stats
+        self.turn: Optional[TurnRecorder] = metrics.current_turn
+        self._nodes: Dict[Hashable, Node] = {}
+        self._lock = threading.Lock()
+        self._start = timer()
+
+    def add(self, name: str, fn: Callable, *args, after: Sequence[Node] = (), key: Optional[Hashable] = None, speculative: bool = False) -> Node:
+        # fn is called with args followed by the results of the nodes it runs after. adding a node under an existing key
+        # returns the node already added, which stops being speculative when the turn asks for it for sure
+        key = name if key is None else key
+        with self._lock:
+            node = self._nodes.get(key)
+            if node is not None:
+                if node.speculative and not speculative:
+                    node.speculative = False
+                    node.used = True
+                return node
+            node = self._nodes[key] = Node(name, fn, args, after, speculative)
+            node.requested = timer() - self._start
+        if speculative and self.stats is not None:
+            self.stats.count(speculative=1)
+        if self.executor is not None:
+            self._schedule(node)
+        return node
+
+    def _schedule(self, node: Node) -> None:
+        pending = [dependency for dependency in node.after if not dependency.done.is_set()]
+        if not pending:
+            self.executor.submit(self._run, node)
+            return
+        remaining = [len(pending)]
+        lock = threading.Lock()
+
+        def ready():
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            self.executor.submit(self._run, node)
+
+        for dependency in pending:
+            self._when_done(dependency, ready)
+
+    def _when_done(self, node: Node, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if not node.done.is_set():
+                node.callbacks.append(callback)
+                return
+        callback()
+
+    def _run(self, node: Node) -> None:
+        with self._lock:
+            if node.cancelled or node.started:
+                return
+            node.started = True
+        failed = next((dependency for dependency in node.after if dependency.error is not None), None)
+        node.start = timer() - self._start
+        if failed is not None:
+            node.error = failed.error
+        else:
+            try:
+                with ExitStack() as stack:
+                    stack.enter_context(metrics.attach(self.turn))
+                    stack.enter_context(self.context() if self.context is not None else nullcontext())
+                    node.result = node.fn(*node.args, *(dependency.result for dependency in node.after))
+            except BaseException as e:
+                node.error = e
+        node.end = timer() - self._start
+        self._finish(node)
+
+    def _finish(self, node: Node) -> None:
+        with self._lock:
+            node.done.set()
+            callbacks, node.callbacks = node.callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def result(self, node: Node) -> Any:
+        if self.executor is None:
+            for dependency in node.after:
+                self.result(dependency)
+            if not node.started:
+                node.requested = timer() - self._start
+            self._run(node)
+        node.done.wait()
+        node.used = True
+        if node.consumed is None:
+            node.consumed = timer() - self._start
+        if node.error is not None:
+            raise node.error
+        return node.result
+
+    def cancel(self, node: Optional[Node]) -> None:
+        # a node which hasn't started never runs, a running one is left to finish and its result is dropped
+        if node is None:
+            return
+        with self._lock:
+            if node.cancelled or node.used:
+                return
+            node.cancelled = True
+            never_started = not node.started
+        if self.stats is not None:
+            self.stats.count(cancelled=1)
+        # dependents are cancelled first, so finishing the node can't submit them
+        for dependent in list(self._nodes.values()):
+            if node in dependent.after:
+                self.cancel(dependent)
+        if never_started:
+            self._finish(node)
+
+    def critical_path(self) -> Tuple[List[str], float]:
+        # walks back from the consumed node which finished last through whichever predecessor finished last: a node it
+        # ran after, or one whose result the turn had consumed before it could start, which held up the turn's code adding it
+        used = [node for node in self._nodes.values() if node.used]
+        node = max(used, key=lambda node: node.end, default=None)
+        path, seconds = [], 0.0
+        while node is not None:
+            path.append(node.name)
+            seconds += node.end - node.start
+            predecessors = node.after + [other for other in used if other.consumed is not None and other.consumed <= node.requested]
+            node = max(predecessors, key=lambda other: other.end, default=None)
+        return path[::-1], seconds
+
+    def close(self) -> None:
+        # called at the end of the turn: drops the speculation nobody used and records the critical path
+        for node in list(self._nodes.values()):
+            if node.speculative and not node.used:
+                self.cancel(node)
+            if node.speculated and self.stats is not None:
+                self.stats.count(**{"speculative_used" if node.used else "speculative_discarded": 1})
+        path, seconds = self.critical_path()
+        if path and self.turn is not None:
+            self.turn.record("critical_path", seconds, {"path": ">".join(path)})
+        self.logger.debug(f"turn critical path {' > '.join(path) or '-'} took {seconds:.6f} seconds")
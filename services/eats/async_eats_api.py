@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+from models.order import Order
+from services.eats.eats_api import EatsAPI
+
+@dataclass
+class MenuFanOut:
+    menus: Dict[str, List[dict]] = field(default_factory=dict)
+    # store_id -> reason, venues which timed out or failed are skipped rather than failing the whole search
+    failed: Dict[str, str] = field(default_factory=dict)
+
+class AsyncEatsAPI(ABC):
+    async def get_venues(self) -> List[dict]:
+        # like EatsAPI.get_venues, APIs which can't list their venues list none
+        return []
+
+    @abstractmethod
+    async def get_nearby_venues(self, address: str, radius: float) -> List[dict]:
+        pass
+
+    @abstractmethod
+    async def get_menu(self, store_id: str) -> List[dict]:
+        pass
+
+    async def get_menu_version(self, store_id: str) -> Optional[str]:
+        return None
+
+    @abstractmethod
+    async def book_order(self, order_details: Order) -> str:
+        pass
+
+    @abstractmethod
+    async def check_order(self, order_id: str) -> dict:
+        pass
+
+    async def fan_out_menus(self, store_ids: Iterable[str], concurrency: int = 16, timeout: Optional[float] = 5.0) -> MenuFanOut:
+        semaphore = asyncio.Semaphore(concurrency)
+        result = MenuFanOut()
+
+        async def fetch(store_id: str) -> None:
+            async with semaphore:
+                try:
+                    result.menus[store_id] = await asyncio.wait_for(self.get_menu(store_id), timeout)
+                except asyncio.TimeoutError:
+                    result.failed[store_id] = f"timed out after {timeout} seconds"
+                except Exception as e:
+                    result.failed[store_id] = repr(e)
+
+        await asyncio.gather(*(fetch(store_id) for store_id in dict.fromkeys(store_ids)))
+        return result
+
+    async def aclose(self) -> None:
+        pass
+
+class BlockingEatsAPI(EatsAPI):
+    # runs an AsyncEatsAPI on a background event loop for the synchronous agent and WSGI resources
+    def __init__(self, async_api: AsyncEatsAPI, concurrency: int = 16, timeout: Optional[float] = 5.0):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.async_api = async_api
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        # the loop thread doesn't survive a fork, so each worker process starts its own
+        with self._lock:
+            if self._loop is None or self._loop_pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._loop_pid = os.getpid()
+                threading.Thread(target=self._loop.run_forever, name="eats-api-loop", daemon=True).start()
+            return self._loop
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop()).result()
+
+    def get_venues(self) -> List[dict]:
+        return self._run(self.async_api.get_venues())
+
+    def get_nearby_venues(self, address: str, radius: float) -> List[dict]:
+        return self._run(self.async_api.get_nearby_venues(address, radius))
+
+    def get_menu(self, store_id: str) -> List[dict]:
+        return self._run(asyncio.wait_for(self.async_api.get_menu(store_id), self.timeout))
+
+    def get_menus(self, store_ids: Iterable[str]) -> Dict[str, List[dict]]:
+        result = self._run(self.async_api.fan_out_menus(store_ids, self.concurrency, self.timeout))
+        if result.failed:
+            self.logger.warning(f"couldn't fetch {len(result.failed)} menus: {result.failed}")
+        return result.menus
+
+    def get_menu_version(self, store_id: str) -> Optional[str]:
+        return self._run(self.async_api.get_menu_version(store_id))
+
+    def book_order(self, order: Order) -> str:
+        return self._run(self.async_api.book_order(order))
+
+    def check_order(self, order_id: str) -> dict:
+        return self._run(self.async_api.check_order(order_id))
+
+    def close(self) -> None:
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is not None and self._loop_pid == os.getpid():
+            asyncio.run_coroutine_threadsafe(self.async_api.aclose(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
@@ -0,0 +1,198 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+from models.order import Order
+from services.eats.eats_api import EatsAPI
+
+MenuListener = Callable[[str, List[dict]], None]
+
+@dataclass
+class _Entry:
+    value: Any
+    expires_at: float
+    version: Optional[str] = None
+
+class _Flight:
+    # a fetch in progress, concurrent requests for the same key wait for it instead of fetching again
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+class CachedEatsAPI(EatsAPI):
+    # caches menus and venue lookups of any EatsAPI with a TTL and LRU eviction, and tells listeners when a menu changed
+    def __init__(self, eats_api: EatsAPI, menu_ttl: float = 300.0, venues_ttl: float = 60.0, max_entries: int = 4096,
+                 clock: Callable[[], float] = time.monotonic):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.eats_api = eats_api
+        self.menu_ttl = menu_ttl
+        self.venues_ttl = venues_ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._listeners: List[MenuListener] = []
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "coalesced": 0, "revalidated": 0, "evictions": 0, "changes": 0}
+
+    def add_menu_listener(self, listener: MenuListener) -> None:
+        self._listeners.append(listener)
+
+    def invalidate(self, store_id: Optional[str] = None) -> None:
+        with self._lock:
+            if store_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(("menu", store_id), None)
+
+    def _begin(self, key: Hashable) -> Tuple[Optional[_Entry], _Flight, bool]:
+        # returns a fresh entry, or the flight to wait for or to lead along with the stale entry to revalidate
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > self.clock():
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return entry, None, False
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._counters["coalesced"] += 1
+                return None, flight, False
+            flight = self._flights[key] = _Flight()
+            self._counters["misses"] += 1
+            return entry, flight, True
+
+    def _finish(self, key: Hashable, flight: _Flight, value: Any = None, error: Optional[BaseException] = None) -> None:
+        flight.value, flight.error = value, error
+        with self._lock:
+            self._flights.pop(key, None)
+        flight.done.set()
+
+    def _store(self, key: Hashable, value: Any, ttl: float, version: Optional[str] = None) -> None:
+        with self._lock:
+            self._entries[key] = _Entry(value, self.clock() + ttl, version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def _cached(self, key: Hashable, ttl: float, load: Callable[[], Any]) -> Any:
+        entry, flight, leader = self._begin(key)
+        if flight is None:
+            return entry.value
+        if not leader:
+            return flight.wait()
+        try:
+            value = load()
+        except BaseException as e:
+            self._finish(key, flight, error=e)
+            raise
+        self._store(key, value, ttl)
+        self._finish(key, flight, value)
+        return value
+
+    def get_venues(self) -> List[dict]:
+        return self._cached(("venues",), self.venues_ttl, self.eats_api.get_venues)
+
+    def get_nearby_venues(self, address: str, radius: float) -> List[dict]:
+        return self._cached(("nearby", address, radius), self.venues_ttl, lambda: self.eats_api.get_nearby_venues(address, radius))
+
+    def _revalidate(self, store_id: str, stale: Optional[_Entry]) -> Tuple[bool, Optional[str]]:
+        if stale is None:
+            return False, None
+        version = self.eats_api.get_menu_version(store_id)
+        if version is not None and version == stale.version:
+            self._store(("menu", store_id), stale.value, self.menu_ttl, version)
+            with self._lock:
+                self._counters["revalidated"] += 1
+            return True, version
+        return False, version
+
+    def _fetched(self, store_id: str, menu: List[dict], stale: Optional[_Entry], version: Optional[str]) -> None:
+        if version is None:
+            version = self.eats_api.get_menu_version(store_id)
+        self._store(("menu", store_id), menu, self.menu_ttl, version)
+        # a first fetch has nothing to differ from, only a refetched menu which changed is a change
+        if stale is not None and stale.value != menu:
+            self._notify(store_id, menu)
+
+    def _notify(self, store_id: str, menu: List[dict]) -> None:
+        with self._lock:
+            self._counters["changes"] += 1
+        for listener in self._listeners:
+            try:
+                listener(store_id, menu)
+            except Exception as e:
+                self.logger.warning(f"menu listener failed for venue {store_id}: {e}")
+
+    def get_menu(self, store_id: str) -> List[dict]:
+        return self.get_menus([store_id])[store_id]
+
+    def get_menus(self, store_ids: Iterable[str]) -> Dict[str, List[dict]]:
+        menus, waiting, leading = {}, {}, {}
+        for store_id in dict.fromkeys(store_ids):
+            entry, flight, leader = self._begin(("menu", store_id))
+            if flight is None:
+                menus[store_id] = entry.value
+            elif leader:
+                leading[store_id] = (entry, flight)
+            else:
+                waiting[store_id] = flight
+
+        # stale entries whose version didn't change are kept, the rest are fetched in one batch
+        to_fetch = {}
+        for store_id, (stale, flight) in leading.items():
+            try:
+                revalidated, version = self._revalidate(store_id, stale)
+            except Exception as e:
+                self.logger.warning(f"couldn't revalidate menu of venue {store_id}: {e}")
+                revalidated, version = False, None
+            if revalidated:
+                menus[store_id] = stale.value
+                self._finish(("menu", store_id), flight, stale.value)
+            else:
+                to_fetch[store_id] = (stale, flight, version)
+
+        if to_fetch:
+            try:
+                fetched = self.eats_api.get_menus(list(to_fetch))
+            except BaseException as e:
+                for store_id, (_, flight, _) in to_fetch.items():
+                    self._finish(("menu", store_id), flight, error=e)
+                raise
+            for store_id, (stale, flight, version) in to_fetch.items():
+                if store_id in fetched:
+                    self._fetched(store_id, fetched[store_id], stale, version)
+                    menus[store_id] = fetched[store_id]
+                    self._finish(("menu", store_id), flight, fetched[store_id])
+                else:
+                    self._finish(("menu", store_id), flight, error=KeyError(store_id))
+
+        for store_id, flight in waiting.items():
+            try:
+                menus[store_id] = flight.wait()
+            except KeyError:
+                # the venue failed for the request leading the fetch too, it is left out like in EatsAPI.get_menus
+                pass
+        return menus
+
+    def get_menu_version(self, store_id: str) -> Optional[str]:
+        return self.eats_api.get_menu_version(store_id)
+
+    def book_order(self, order: Order) -> str:
+        return self.eats_api.book_order(order)
+
+    def check_order(self, order_id: str) -> dict:
+        return self.eats_api.check_order(order_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), **self._counters}
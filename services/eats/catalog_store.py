@@ -0,0 +1,313 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+from collections.abc import Sequence
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from models.order import MenuItem
+from services.paths import atomic_write, cache_dir as user_cache_dir
+
+class StringTable:
+    # interned strings as one utf-8 buffer and their offsets, decoded only when asked for
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        if i < 0:
+            return None
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+# optional item fields, a bit of each item's field mask is set when the item has the field
+OPTIONAL_FIELDS = ("title", "subtitle", "ingredients", "price", "category")
+
+class _Interner:
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.encoded: List[bytes] = []
+
+    def __call__(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        i = self.ids.get(value)
+        if i is None:
+            i = self.ids[value] = len(self.encoded)
+            self.encoded.append(value.encode("utf-8"))
+        return i
+
+    def build(self) -> Tuple[np.ndarray, np.ndarray]:
+        offsets = np.zeros(len(self.encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in self.encoded], out=offsets[1:])
+        return np.frombuffer(b"".join(self.encoded), dtype=np.uint8), offsets
+
+class CatalogBuilder:
+    # collects venues and items into columns, menus are added one venue at a time so a streamed catalog never sits in memory as dicts
+    def __init__(self):
+        self.strings = _Interner()
+        self.venues: List[dict] = []
+        self.venue_positions: Dict[str, int] = {}
+        self.columns: Dict[str, List] = {name: [] for name in ("item_ids", "titles", "subtitles", "categories", "prices", "venues", "fields")}
+        self.ingredient_counts: List[int] = []
+        self.ingredients: List[int] = []
+
+    def _venue(self, store_id: str) -> int:
+        position = self.venue_positions.get(store_id)
+        if position is None:
+            position = self.venue_positions[store_id] = len(self.venue_positions)
+        return position
+
+    def add_venue(self, venue: dict, menu: Iterable[dict] = ()) -> None:
+        self.venues.append(venue)
+        venue_id = venue["store_id"]
+        self._venue(venue_id)
+        for item in menu:
+            self.add_item(item, venue_id)
+
+    def add_item(self, item: dict, venue_id: Optional[str] = None) -> None:
+        columns = self.columns
+        columns["item_ids"].append(self.strings(item["id"]))
+        columns["titles"].append(self.strings(item.get("title", "")))
+        columns["subtitles"].append(self.strings(item.get("subtitle", "")))
+        columns["categories"].append(self.strings(item.get("category")))
+        columns["prices"].append(item.get("price", np.inf))
+        columns["venues"].append(self._venue(venue_id or item["venue_id"]))
+        columns["fields"].append(sum(1 << bit for bit, name in enumerate(OPTIONAL_FIELDS) if name in item))
+        ingredients = item.get("ingredients") or []
+        self.ingredient_counts.append(len(ingredients))
+        self.ingredients.extend(self.strings(ingredient) for ingredient in ingredients)
+
+    def build(self) -> "CatalogStore":
+        columns = self.columns
+        arrays = {
+            "item_ids": np.asarray(columns["item_ids"], dtype=np.int32),
+            "titles": np.asarray(columns["titles"], dtype=np.int32),
+            "subtitles": np.asarray(columns["subtitles"], dtype=np.int32),
+            "categories": np.asarray(columns["categories"], dtype=np.int32),
+            "prices": np.asarray(columns["prices"], dtype=np.float64),
+            "venues": np.asarray(columns["venues"], dtype=np.int32),
+            "fields": np.asarray(columns["fields"], dtype=np.uint8),
+            "ingredients": np.asarray(self.ingredients, dtype=np.int32),
+            "venue_ids": np.asarray([self.strings(store_id) for store_id in self.venue_positions], dtype=np.int32),
+        }
+        ingredient_offsets = np.zeros(len(self.ingredient_counts) + 1, dtype=np.int64)
+        np.cumsum(self.ingredient_counts, out=ingredient_offsets[1:])
+        arrays["ingredient_offsets"] = ingredient_offsets
+
+        # rows of each venue's menu, in catalog order
+        order = np.argsort(arrays["venues"], kind="stable").astype(np.int64)
+        menu_offsets = np.zeros(len(self.venue_positions) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(arrays["venues"], minlength=len(self.venue_positions)), out=menu_offsets[1:])
+        arrays["menu_rows"], arrays["menu_offsets"] = order, menu_offsets
+
+        arrays["strings"], arrays["string_offsets"] = self.strings.build()
+        arrays["venues_json"] = np.frombuffer(json.dumps(self.venues).encode("utf-8"), dtype=np.uint8)
+        return CatalogStore(arrays)
+
+class CatalogItems(Sequence):
+    # the catalog's items as a read-only sequence of dicts, each built only when it is accessed
+    def __init__(self, catalog: "CatalogStore"):
+        self.catalog = catalog
+
+    def __len__(self) -> int:
+        return len(self.catalog)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self.catalog.item_dict(i) for i in range(*row.indices(len(self)))]
+        return self.catalog.item_dict(int(row))
+
+    @property
+    def prices(self) -> np.ndarray:
+        return self.catalog.arrays["prices"]
+
+    def encoded(self, field: str) -> Tuple[np.ndarray, List[str]]:
+        # codes into a sorted vocabulary like MenuIndex._encode, -1 where the item has no value
+        return self.catalog.encoded(field)
+
+class CatalogStore:
+    # menu items in typed columns with interned strings and CSR ingredient lists, compiled to one binary file
+    # which is memory-mapped, so it opens in milliseconds whatever its size and forked workers share its pages
+    FILENAME = "catalog.bin"
+    MAGIC = b"LLAMAEATS-CATALOG-1\n"
+    ALIGNMENT = 64
+
+    def __init__(self, arrays: Dict[str, np.ndarray], digest: Optional[str] = None):
+        self.arrays = arrays
+        self.digest = digest or self._digest(arrays)
+        self.strings = StringTable(arrays["strings"], arrays["string_offsets"])
+        self._venues: Optional[List[dict]] = None
+        self._venue_positions: Optional[Dict[str, int]] = None
+
+    @staticmethod
+    def _digest(arrays: Dict[str, np.ndarray]) -> str:
+        digest = hashlib.sha1()
+        for name in sorted(arrays):
+            digest.update(name.encode("utf-8"))
+            digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+        return digest.hexdigest()
+
+    @classmethod
+    def from_menus(cls, venues: Iterable[dict], menus: Dict[str, List[dict]]) -> "CatalogStore":
+        builder = CatalogBuilder()
+        for venue in venues:
+            builder.add_venue(venue, menus.get(venue["store_id"], []))
+        # menus of venues missing from the venue list stay reachable by store id
+        for store_id, menu in menus.items():
+            if store_id not in builder.venue_positions:
+                for item in menu:
+                    builder.add_item(item, store_id)
+        return builder.build()
+
+    @classmethod
+    def from_items(cls, items: Iterable[dict]) -> "CatalogStore":
+        # items carrying their venue_id, e.g. those of the menu index
+        builder = CatalogBuilder()
+        for item in items:
+            builder.add_item(item)
+        return builder.build()
+
+    @classmethod
+    def from_directory(cls, data_dir: str) -> "CatalogStore":
+        with open(os.path.join(data_dir, "venues.json")) as f:
+            venues = json.load(f)
+        with open(os.path.join(data_dir, "menus.json")) as f:
+            menus = json.load(f)
+        return cls.from_menus(venues, menus)
+
+    def save(self, path: pathlib.Path) -> None:
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        sections, offset = {}, 0
+        for name, array in self.arrays.items():
+            offset = -(-offset // self.ALIGNMENT) * self.ALIGNMENT
+            sections[name] = [array.dtype.str, offset, len(array)]
+            offset += array.nbytes
+        header = json.dumps({"digest": self.digest, "sections": sections}).encode("utf-8")
+        start = len(self.MAGIC) + 8 + len(header)
+        start = -(-start // self.ALIGNMENT) * self.ALIGNMENT
+
+        with atomic_write(path) as f:
+            f.write(self.MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            for name, array in self.arrays.items():
+                f.write(b"\0" * (start + sections[name][1] - f.tell()))
+                f.write(np.ascontiguousarray(array).tobytes())
+
+    @classmethod
+    def open(cls, path: pathlib.Path) -> "CatalogStore":
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        if data[:len(cls.MAGIC)].tobytes() != cls.MAGIC:
+            raise ValueError(f"{path} is not a catalog file")
+        header_length = int.from_bytes(data[len(cls.MAGIC):len(cls.MAGIC) + 8].tobytes(), "little")
+        header_start = len(cls.MAGIC) + 8
+        header = json.loads(data[header_start:header_start + header_length].tobytes())
+        start = -(-(header_start + header_length) // cls.ALIGNMENT) * cls.ALIGNMENT
+        arrays = {}
+        for name, (dtype, offset, count) in header["sections"].items():
+            dtype = np.dtype(dtype)
+            arrays[name] = np.frombuffer(data, dtype=dtype, count=count, offset=start + offset)
+        return cls(arrays, header["digest"])
+
+    @classmethod
+    def cache_path(cls, data_dir: str, cache_dir: Optional[pathlib.Path] = None) -> pathlib.Path:
+        # keyed by the source files, so a changed catalog is compiled again; kept in the user cache directory by default
+        cache_dir = pathlib.Path(cache_dir or user_cache_dir("catalog"))
+        key = hashlib.sha1(os.path.abspath(data_dir).encode("utf-8"))
+        for filename in ("venues.json", "menus.json"):
+            stat = os.stat(os.path.join(data_dir, filename))
+            key.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+        return cache_dir / f"{key.hexdigest()}.bin"
+
+    @classmethod
+    def load_or_compile(cls, data_dir: str, cache_dir: Optional[pathlib.Path] = None) -> "CatalogStore":
+        logger = logging.getLogger(cls.__name__)
+        compiled = pathlib.Path(data_dir) / cls.FILENAME
+        if compiled.exists():
+            return cls.open(compiled)
+        path = cls.cache_path(data_dir, cache_dir)
+        if path.exists():
+            try:
+                return cls.open(path)
+            except Exception as e:
+                logger.warning(f"couldn't open compiled catalog {path}: {e}")
+        catalog = cls.from_directory(data_dir)
+        try:
+            catalog.save(path)
+            logger.debug(f"compiled catalog of {len(catalog)} items from {data_dir} to {path}")
+        except OSError as e:
+            logger.warning(f"couldn't save compiled catalog to {path}: {e}")
+        return catalog
+
+    def __len__(self) -> int:
+        return len(self.arrays["item_ids"])
+
+    @property
+    def venues(self) -> List[dict]:
+        if self._venues is None:
+            self._venues = json.loads(self.arrays["venues_json"].tobytes() or b"[]")
+        return self._venues
+
+    @property
+    def venue_ids(self) -> List[str]:
+        return [self.strings[i] for i in self.arrays["venue_ids"]]
+
+    def _venue_position(self, store_id: str) -> Optional[int]:
+        if self._venue_positions is None:
+            self._venue_positions = {store_id: position for position, store_id in enumerate(self.venue_ids)}
+        return self._venue_positions.get(store_id)
+
+    def menu_rows(self, store_id: str) -> np.ndarray:
+        position = self._venue_position(store_id)
+        if position is None:
+            raise KeyError(store_id)
+        offsets = self.arrays["menu_offsets"]
+        return self.arrays["menu_rows"][offsets[position]:offsets[position + 1]]
+
+    def menu(self, store_id: str) -> List[dict]:
+        return [self.item_dict(int(row), with_venue=False) for row in self.menu_rows(store_id)]
+
+    def item_dict(self, row: int, with_venue: bool = True) -> dict:
+        arrays, strings = self.arrays, self.strings
+        offsets = arrays["ingredient_offsets"]
+        fields = int(arrays["fields"][row])
+        # fields the item didn't have are left out, so items read back equal the ones compiled
+        item = {"id": strings[arrays["item_ids"][row]]}
+        if fields & 1:
+            item["title"] = strings[arrays["titles"][row]]
+        if fields & 2:
+            item["subtitle"] = strings[arrays["subtitles"][row]]
+        if fields & 4:
+            item["ingredients"] = [strings[i] for i in arrays["ingredients"][offsets[row]:offsets[row + 1]]]
+        if fields & 8:
+            item["price"] = float(arrays["prices"][row])
+        if fields & 16:
+            item["category"] = strings[arrays["categories"][row]]
+        if with_venue:
+            item["venue_id"] = strings[arrays["venue_ids"][arrays["venues"][row]]]
+        return item
+
+    def item(self, row: int) -> MenuItem:
+        # the builder keeps items as they came, including those missing fields, so they are validated here
+        return MenuItem(**self.item_dict(row))
+
+    def items(self) -> CatalogItems:
+        return CatalogItems(self)
+
+    def encoded(self, field: str) -> Tuple[np.ndarray, List[str]]:
+        string_ids = self.arrays["categories"] if field == "category" else self.arrays["venue_ids"][self.arrays["venues"]]
+        present = string_ids[string_ids >= 0]
+        unique = np.unique(present)
+        values = [self.strings[i] for i in unique]
+        order = sorted(range(len(values)), key=values.__getitem__)
+        # string id -> position in the sorted vocabulary
+        lookup = np.full(len(self.strings) + 1, -1, dtype=np.int32)
+        lookup[unique[order]] = np.arange(len(order), dtype=np.int32)
+        return lookup[string_ids], [values[i] for i in order]
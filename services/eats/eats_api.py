@@ -1,8 +1,13 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Dict, Iterable, List, Optional
 from models.order import Order
 
 class EatsAPI(ABC):
+    def get_venues(self) -> List[dict]:
+        # every venue, the menu index is built from their menus up front. APIs which can only find venues near an address
+        # list none, their venues' menus are then indexed as the venues are first found
+        return []
+
     @abstractmethod
     def get_nearby_venues(self, address: str, radius: float) -> List[dict]:
         pass
@@ -11,10 +16,18 @@ class EatsAPI(ABC):
     def get_menu(self, store_id: str) -> List[dict]:
         pass
 
+    def get_menus(self, store_ids: Iterable[str]) -> Dict[str, List[dict]]:
+        # implementations backed by a remote service fetch these concurrently, venues which failed are left out
+        return {store_id: self.get_menu(store_id) for store_id in store_ids}
+
+    def get_menu_version(self, store_id: str) -> Optional[str]:
+        # a cheap version or ETag of the menu, lets caches revalidate instead of refetching; None when unsupported
+        return None
+
     @abstractmethod
     def book_order(self, order_details: Order) -> str:
         pass
 
     @abstractmethod
     def check_order(self, order_id: str) -> dict:
-        pass
\ No newline at end of file
+        pass
@@ -1,14 +1,37 @@
+import argparse
 import json
+import math
+import os
+import pathlib
 import random
+import sys
 import uuid
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
 
-def generate_food_description(dish_info):
+if __name__ == "__main__":
+    # run as a script, python services/eats/fill_api.py, the repository root isn't on the path
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from services.eats.catalog_store import CatalogStore
+from services.eats.geo import haversine_km
+
+DAYS_OF_WEEK = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+# 321 W 54th Street, NY 10019, the delivery address used throughout the examples
+CENTER = (40.7655, -73.9870)
+TIMEZONE = "America/New_York"
+KM_PER_DEGREE = 111.32
+
+def random_id(rng: random.Random) -> str:
+    # drawn from the seeded generator so the same seed reproduces the same catalog
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+def generate_food_description(dish_info, rng: random.Random = random):
     cooking_methods = ["Grilled", "Baked", "Fried", "Sautéed", "Roasted", "Slow-cooked", "Charred", "Steamed"]
     adjectives = ["Delicious", "Savory", "Hearty", "Mouthwatering", "Aromatic", "Flavorful", "Indulgent", "Exquisite"]
 
     # Randomly select ingredients
-    random_ingredients = random.sample(dish_info['ingredients'], min(len(dish_info['ingredients']), 2))
-    single_ingredient = random.choice(dish_info['ingredients'])
+    random_ingredients = rng.sample(dish_info['ingredients'], min(len(dish_info['ingredients']), 2))
+    single_ingredient = rng.choice(dish_info['ingredients'])
 
     # Generate ingredient phrases dynamically
     ingredient_phrases = [
@@ -18,20 +41,20 @@ def generate_food_description(dish_info):
         f"elevated with {single_ingredient}",
     ]
 
-    cooking_method = random.choice(cooking_methods)
-    adjective = random.choice(adjectives)
-    ingredient_phrase = random.choice(ingredient_phrases)
+    cooking_method = rng.choice(cooking_methods)
+    adjective = rng.choice(adjectives)
+    ingredient_phrase = rng.choice(ingredient_phrases)
 
     return f"{adjective} {cooking_method} {dish_info['name']}, {ingredient_phrase}, served to perfection."
 
-def generate_restaurant_name():
+def generate_restaurant_name(rng: random.Random = random):
     adjectives = ["Cozy", "Spicy", "Golden", "Delicious", "Rustic", "Elegant", "Savory", "Tasty", "Vibrant", "Lush"]
     cuisines = ["Italian", "Mexican", "Thai", "Chinese", "French", "Japanese", "Mediterranean", "Indian", "Korean", "American"]
     themes = ["Grill", "Bistro", "Cafe", "Kitchen", "Diner", "Tavern", "House", "Bar", "Eatery", "Oven"]
 
-    adjective = random.choice(adjectives)
-    cuisine = random.choice(cuisines)
-    theme = random.choice(themes)
+    adjective = rng.choice(adjectives)
+    cuisine = rng.choice(cuisines)
+    theme = rng.choice(themes)
 
     return f"{adjective} {cuisine} {theme}"
 
@@ -125,62 +148,126 @@ categories_with_dishes_ingredients = {
     ]
 }
 
-def generate_random_venue(i):
-    days_of_week = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
-    num_days = random.randint(1, len(days_of_week))
-    selected_days = random.sample(days_of_week, num_days)
+def generate_service_availability(rng: random.Random = random) -> List[dict]:
+    num_days = rng.randint(1, len(DAYS_OF_WEEK))
+    selected_days = rng.sample(DAYS_OF_WEEK, num_days)
 
     service_availability = []
     for day in selected_days:
-        start_hour = random.randint(8, 12)
-        end_hour = random.randint(start_hour + 1, 23)
+        kind = rng.random()
+        if kind < 0.15:
+            # late night venues close after midnight
+            periods = [(rng.randint(17, 20), rng.randint(0, 3))]
+        elif kind < 0.35:
+            # closed between lunch and dinner
+            periods = [(rng.randint(11, 12), rng.randint(14, 15)), (rng.randint(17, 18), rng.randint(21, 23))]
+        else:
+            start_hour = rng.randint(8, 12)
+            periods = [(start_hour, rng.randint(start_hour + 1, 23))]
         service_availability.append({
             "day_of_week": day,
             "time_periods": [{
                 "start_time": f"{start_hour:02d}:00",
                 "end_time": f"{end_hour:02d}:00"
-            }]
+            } for start_hour, end_hour in periods]
         })
+    return service_availability
+
+def generate_location(rng: random.Random = random, center: Tuple[float, float] = CENTER, radius_km: float = 10.0) -> dict:
+    # uniform over the disc around the center
+    distance = radius_km * math.sqrt(rng.random())
+    bearing = rng.uniform(0, 2 * math.pi)
+    lat = center[0] + distance * math.cos(bearing) / KM_PER_DEGREE
+    lon = center[1] + distance * math.sin(bearing) / (KM_PER_DEGREE * math.cos(math.radians(center[0])))
+    return {"lat": round(lat, 6), "lon": round(lon, 6)}
 
+def generate_random_venue(i, rng: random.Random = random, categories: Optional[Sequence[str]] = None, center: Tuple[float, float] = CENTER,
+                          radius_km: float = 10.0, hours: bool = True, timezone: str = TIMEZONE):
+    categories = list(categories or categories_with_dishes_ingredients.keys())
+    location = generate_location(rng, center, radius_km)
     venue = {
-        "store_id": str(uuid.uuid4()),
-        "name": generate_restaurant_name(),
-        "address": f"{random.randint(1, 1000)} Main St., City{random.randint(1, 10)}",
-        "category_ids": random.sample(list(categories_with_dishes_ingredients.keys()), k=random.randint(1, 3)),
-        "proximity": round(random.uniform(0.1, 10.0), 2),
-        "service_availability": service_availability
+        "store_id": random_id(rng),
+        "name": generate_restaurant_name(rng),
+        "address": f"{rng.randint(1, 1000)} Main St., City{rng.randint(1, 10)}",
+        "category_ids": rng.sample(categories, k=rng.randint(1, min(3, len(categories)))),
+        "location": location,
+        "proximity": round(haversine_km(center, (location["lat"], location["lon"])), 2),
     }
+    if hours:
+        # venues without service availability are always open, the hours are local to the venue's timezone
+        venue["timezone"] = timezone
+        venue["service_availability"] = generate_service_availability(rng)
     return venue
 
+def generate_menu(venue: dict, num_items: int, rng: random.Random = random) -> List[dict]:
+    dishes = [(category, dish_info) for category in venue["category_ids"] for dish_info in categories_with_dishes_ingredients[category]]
+    if num_items <= len(dishes):
+        chosen = rng.sample(dishes, num_items)
+    else:
+        # large menus repeat dishes, each with its own description and price
+        chosen = dishes + rng.choices(dishes, k=num_items - len(dishes))
+
+    menu_items = []
+    for category, dish_info in chosen:
+        menu_items.append({
+            "id": random_id(rng),
+            "title": dish_info["name"],
+            "subtitle": generate_food_description(dish_info, rng),
+            "ingredients": dish_info["ingredients"],
+            "price": round(rng.uniform(5.99, 29.99), 2),
+            "category": category
+        })
+    return menu_items
+
+def generate_catalog(num_venues: int = 100, items_per_venue: Tuple[int, int] = (1, 30), seed: Optional[int] = None,
+                     categories: Optional[Sequence[str]] = None, center: Tuple[float, float] = CENTER, radius_km: float = 10.0,
+                     hours: bool = True, timezone: str = TIMEZONE) -> Iterator[Tuple[dict, List[dict]]]:
+    rng = random.Random(seed)
+    for i in range(num_venues):
+        venue = generate_random_venue(i, rng, categories, center, radius_km, hours, timezone)
+        yield venue, generate_menu(venue, rng.randint(*items_per_venue), rng)
+
+def write_catalog(catalog: Iterable[Tuple[dict, List[dict]]], directory: pathlib.Path) -> Tuple[int, int]:
+    # venues.json and menus.json are written as the catalog is generated, so catalogs of millions of items never sit in memory
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    # a catalog compiled from the previous files would shadow the new ones
+    (directory / CatalogStore.FILENAME).unlink(missing_ok=True)
+    num_venues, num_items = 0, 0
+    with open(directory / "venues.json", "w") as venues_file, open(directory / "menus.json", "w") as menus_file:
+        venues_file.write("[")
+        menus_file.write("{")
+        for venue, menu in catalog:
+            separator = "," if num_venues else ""
+            venues_file.write(f"{separator}\n  {json.dumps(venue)}")
+            menus_file.write(f"{separator}\n  {json.dumps(venue['store_id'])}: {json.dumps(menu)}")
+            num_venues += 1
+            num_items += len(menu)
+        venues_file.write("\n]\n")
+        menus_file.write("\n}\n")
+    return num_venues, num_items
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generates a synthetic catalog of venues and menus")
+    parser.add_argument("--output", default="tmp/catalog", help="directory venues.json and menus.json are written to")
+    parser.add_argument("--venues", type=int, default=100)
+    parser.add_argument("--min-items", type=int, default=1, help="fewest menu items per venue")
+    parser.add_argument("--max-items", type=int, default=30, help="most menu items per venue")
+    parser.add_argument("--categories", nargs="+", choices=list(categories_with_dishes_ingredients), default=None)
+    parser.add_argument("--radius", type=float, default=10.0, help="km around the center venues are placed in")
+    parser.add_argument("--center", type=float, nargs=2, default=CENTER, metavar=("LAT", "LON"))
+    parser.add_argument("--timezone", default=TIMEZONE, help="timezone of the venues' opening hours")
+    parser.add_argument("--no-hours", action="store_true", help="leave out service availability, venues are then always open")
+    parser.add_argument("--compile", action="store_true", help="also compile the catalog to the memory-mapped catalog.bin MockEatsAPI opens")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    venues = []
-    for i in range(1, 101):
-        venue = generate_random_venue(i)
-        venues.append(venue)
-
-    with open("venues.json","w") as file:
-        json.dump(venues,file ,indent=2)
-
-    menus = {}
-    for venue in venues:
-        store_id = venue["store_id"]
-        menu_items = []
-        for category in venue["category_ids"]:
-            dishes = random.sample(range(1, len(categories_with_dishes_ingredients[category])), random.randint(1, len(categories_with_dishes_ingredients[category]) - 1))
-
-            for i in dishes:
-                dish_info = categories_with_dishes_ingredients[category][i]
-                item = {
-                    "id" : str(uuid.uuid4()),
-                    "title" : dish_info["name"],
-                    "subtitle" : generate_food_description(dish_info),
-                    "ingredients": dish_info["ingredients"],
-                    "price" : round(random.uniform(5.99 ,29.99),2),
-                    "category": category
-                }
-            menu_items.append(item)
-            menus[store_id] = menu_items
-
-    # Save menus data to menus.json
-    with open("menus.json","w") as file:
-        json.dump(menus,file ,indent=2)
\ No newline at end of file
+    args = parse_args()
+    catalog = generate_catalog(args.venues, (args.min_items, args.max_items), args.seed, args.categories, tuple(args.center), args.radius, not args.no_hours,
+                               args.timezone)
+    num_venues, num_items = write_catalog(catalog, pathlib.Path(args.output))
+    print(f"wrote {num_venues} venues with {num_items} menu items to {args.output}")
+    if args.compile:
+        CatalogStore.from_directory(args.output).save(pathlib.Path(args.output) / CatalogStore.FILENAME)
+        print(f"compiled the catalog to {pathlib.Path(args.output) / CatalogStore.FILENAME}")
@@ -0,0 +1,115 @@
+import json
+import logging
+import math
+import pathlib
+import re
+from collections import defaultdict
+from typing import Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+Coordinates = Tuple[float, float]
+Key = TypeVar("Key", bound=Hashable)
+
+POSTCODE_PATTERN = re.compile(r"\b(\d{5})(?:-\d{4})?\b")
+
+def haversine_km(a: Coordinates, b: Coordinates) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+class Gazetteer:
+    # offline geocoder resolving an address by its postcode, or else by the most specific place name it mentions
+    def __init__(self, postcodes: Dict[str, Coordinates], places: Dict[str, Coordinates]):
+        self.postcodes = {code: tuple(coordinates) for code, coordinates in postcodes.items()}
+        self.places = {name.lower(): tuple(coordinates) for name, coordinates in places.items()}
+        # longer names first so "new york" wins over "york"
+        names = sorted(self.places, key=len, reverse=True)
+        self._place_pattern = re.compile(r"\b(" + "|".join(re.escape(name) for name in names) + r")\b") if names else None
+
+    @staticmethod
+    def default_path() -> pathlib.Path:
+        return pathlib.Path(__file__).parent.parent.parent / "data/gazetteer.json"
+
+    @classmethod
+    def load(cls, path: Optional[pathlib.Path] = None) -> "Gazetteer":
+        with open(path or cls.default_path()) as f:
+            data = json.load(f)
+        return cls(data.get("postcodes", {}), data.get("places", {}))
+
+    def resolve(self, address: str) -> Optional[Coordinates]:
+        for postcode in reversed(POSTCODE_PATTERN.findall(address)):
+            if postcode in self.postcodes:
+                return self.postcodes[postcode]
+        if self._place_pattern is not None:
+            # the last place mentioned is usually the city, after the street
+            matches = self._place_pattern.findall(address.lower())
+            if matches:
+                return self.places[matches[-1]]
+        return None
+
+class GeoIndex(Generic[Key]):
+    # uniform grid over latitude and longitude, a radius query only scans the cells overlapping the radius' bounding box
+    def __init__(self, cell_km: float = 1.0):
+        self.cell_degrees = cell_km / KM_PER_DEGREE
+        self._cells: Dict[Tuple[int, int], List[Tuple[Key, Coordinates]]] = defaultdict(list)
+        self._size = 0
+
+    def _cell(self, coordinates: Coordinates) -> Tuple[int, int]:
+        return math.floor(coordinates[0] / self.cell_degrees), math.floor(coordinates[1] / self.cell_degrees)
+
+    def add(self, key: Key, coordinates: Coordinates) -> None:
+        self._cells[self._cell(coordinates)].append((key, coordinates))
+        self._size += 1
+
+    def __len__(self) -> int:
+        return self._size
+
+    def query(self, coordinates: Coordinates, radius_km: float) -> List[Tuple[Key, float]]:
+        lat, lon = coordinates
+        lat_degrees = radius_km / KM_PER_DEGREE
+        # a degree of longitude shrinks towards the poles
+        lon_degrees = min(radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6)), 180.0)
+        min_row, min_column = self._cell((lat - lat_degrees, lon - lon_degrees))
+        max_row, max_column = self._cell((lat + lat_degrees, lon + lon_degrees))
+
+        results = []
+        for row in range(min_row, max_row + 1):
+            for column in range(min_column, max_column + 1):
+                for key, point in self._cells.get((row, column), ()):
+                    distance = haversine_km(coordinates, point)
+                    if distance <= radius_km:
+                        results.append((key, distance))
+        results.sort(key=lambda result: result[1])
+        return results
+
+class VenueLocator:
+    # radius queries over venues for EatsAPI implementations, venues are located by their "location" or geocoded from their address
+    def __init__(self, venues: List[dict], gazetteer: Optional[Gazetteer] = None, cell_km: float = 1.0):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.gazetteer = gazetteer or Gazetteer.load()
+        self.venues = venues
+        self.index: GeoIndex[int] = GeoIndex(cell_km)
+        unresolved = 0
+        for i, venue in enumerate(venues):
+            coordinates = self.locate(venue)
+            if coordinates is None:
+                unresolved += 1
+                continue
+            self.index.add(i, coordinates)
+        if unresolved:
+            self.logger.warning(f"couldn't locate {unresolved} of {len(venues)} venues")
+
+    def locate(self, venue: dict) -> Optional[Coordinates]:
+        location = venue.get("location")
+        if location is not None:
+            return location["lat"], location["lon"]
+        return self.gazetteer.resolve(venue.get("address", ""))
+
+    def nearby(self, address: str, radius_km: float) -> Optional[List[dict]]:
+        coordinates = self.gazetteer.resolve(address)
+        if coordinates is None:
+            return None
+        # copies, nearest first, with the proximity to the address in km
+        return [{**self.venues[i], "proximity": round(distance, 2)} for i, distance in self.index.query(coordinates, radius_km)]
@@ -0,0 +1,61 @@
+import os
+from typing import List, Optional
+
+import httpx
+
+from models.order import Order
+from services.eats.async_eats_api import AsyncEatsAPI
+
+class HttpEatsAPI(AsyncEatsAPI):
+    # a pooled client for an Eats backend exposing /venues, /venues/nearby, /venues/{id}/menu and /orders
+    def __init__(self, base_url: str, timeout: float = 5.0, max_connections: int = 32, max_keepalive_connections: int = 16):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_pid: Optional[int] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # created on first use inside the running loop, and again in a forked worker
+        if self._client is None or self._client_pid != os.getpid():
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+            self._client_pid = os.getpid()
+        return self._client
+
+    async def _get(self, path: str, **params):
+        response = await self.client.get(path, params=params or None)
+        response.raise_for_status()
+        return response.json()
+
+    async def get_venues(self) -> List[dict]:
+        return await self._get("/venues")
+
+    async def get_nearby_venues(self, address: str, radius: float) -> List[dict]:
+        return await self._get("/venues/nearby", address=address, radius=radius)
+
+    async def get_menu(self, store_id: str) -> List[dict]:
+        return await self._get(f"/venues/{store_id}/menu")
+
+    async def get_menu_version(self, store_id: str) -> Optional[str]:
+        response = await self.client.head(f"/venues/{store_id}/menu")
+        if response.is_error:
+            return None
+        return response.headers.get("etag")
+
+    async def book_order(self, order: Order) -> str:
+        response = await self.client.post("/orders", json=order.model_dump())
+        response.raise_for_status()
+        return response.json()["order_id"]
+
+    async def check_order(self, order_id: str) -> dict:
+        response = await self.client.get(f"/orders/{order_id}")
+        if response.status_code == 404:
+            return {"status": "not found"}
+        response.raise_for_status()
+        return response.json()
+
+    async def aclose(self) -> None:
+        if self._client is not None and self._client_pid == os.getpid():
+            await self._client.aclose()
+        self._client = None
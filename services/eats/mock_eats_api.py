@@ -1,43 +1,45 @@
-import json
-import os
-from typing import List
+import logging
+from typing import List, Optional
 import uuid
 from models.order import Order, OrderDetails
+from services.eats.catalog_store import CatalogStore
 from services.eats.eats_api import EatsAPI
+from services.eats.geo import Gazetteer, VenueLocator
+from stores.order_journal import OrderJournal
 
 class MockEatsAPI(EatsAPI):
-    def __init__(self):
-        # Load mock data from JSON files
-        with open("data/venues.json") as f:
-            self.venues = json.load(f)
-        with open("data/menus.json") as f:
-            self.menus = json.load(f)
-        if os.path.exists("tmp/orders.json"):
-            with open("tmp/orders.json") as f:
-                self.orders = json.load(f)
-        else:
-            self.orders = {}
+    def __init__(self, order_journal: Optional[OrderJournal] = None, gazetteer: Optional[Gazetteer] = None, data_dir: str = "data",
+                 catalog_cache_dir: Optional[str] = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        # mock data from JSON files, e.g. a catalog written by fill_api, compiled once to a memory-mapped catalog
+        self.catalog = CatalogStore.load_or_compile(data_dir, catalog_cache_dir)
+        self.venues = self.catalog.venues
+        self.order_journal = order_journal or OrderJournal()
+        self.venue_locator = VenueLocator(self.venues, gazetteer)
 
-    def get_nearby_venues(self, address: str, radius: float) -> List[dict]:
+    def get_venues(self) -> List[dict]:
         return self.venues
 
+    def get_nearby_venues(self, address: str, radius: float) -> List[dict]:
+        venues = self.venue_locator.nearby(address, radius)
+        if venues is None:
+            self.logger.warning(f"couldn't locate address {address}, falling back to all venues")
+            return self.venues
+        return venues
+
     def get_menu(self, store_id: str) -> List[dict]:
-        return self.menus[store_id]
+        return self.catalog.menu(store_id)
 
     def book_order(self, order: Order) -> str:
         order_id = str(uuid.uuid4())
-        self.orders[order_id] = {
+        self.order_journal.append(order_id, {
             "status": "accepted",
             "items": [item.model_dump() for item in order.order_details.items],
             "address": order.order_details.address,
             "total_price": order.order_details.total_price,
             "payment_details": order.payment_details.model_dump(),
-        }
-        
-        with open("tmp/orders.json", "w") as f:
-            json.dump(self.orders, f, indent=2)
-        
+        })
         return order_id
 
     def check_order(self, order_id: str) -> dict:
-        return self.orders.get(order_id, {"status": "not found"})
\ No newline at end of file
+        return self.order_journal.get(order_id) or {"status": "not found"}
\ No newline at end of file
@@ -0,0 +1,106 @@
+import logging
+from datetime import datetime, timezone, tzinfo
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+DAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+def utc_now() -> datetime:
+    # an aware time, each venue's opening hours are checked in its own timezone
+    return datetime.now(timezone.utc)
+
+def parse_time(value: str) -> int:
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+def day_periods(availability: List[dict]) -> Iterator[Tuple[int, int, int]]:
+    # (day, start minute, end minute) of each period, periods past midnight are split into the next day
+    for day in availability:
+        offset = DAYS.index(day["day_of_week"].lower()) * MINUTES_PER_DAY
+        for period in day["time_periods"]:
+            start = offset + parse_time(period["start_time"])
+            end = offset + parse_time(period["end_time"])
+            if end <= start:
+                # closes after midnight, into the next day
+                end += MINUTES_PER_DAY
+            while start < end:
+                day_start = start - start % MINUTES_PER_DAY
+                # sunday night continues on monday morning
+                yield day_start // MINUTES_PER_DAY % 7, start - day_start, min(end, day_start + MINUTES_PER_DAY) - day_start
+                start = day_start + MINUTES_PER_DAY
+
+class OpenHoursIndex:
+    # the venues' open periods split at midnight, grouped by timezone and day of the week and sorted by venue within a group.
+    # the venues open at a given time are found by comparing one day of periods per timezone, a venue's periods by binary search.
+    # aware times are converted to each venue's timezone, naive times are taken as the venues' local time
+    def __init__(self, venues: List[dict], default_timezone: Optional[str] = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.store_ids = [venue["store_id"] for venue in venues]
+        self._positions = {store_id: i for i, store_id in enumerate(self.store_ids)}
+        # venues without a timezone are in default_timezone, or the server's when there's none
+        zone_names: Dict[Optional[str], int] = {}
+        self._venue_zones = np.zeros(len(venues), dtype=np.int32)
+        self._always_open = np.zeros(len(venues), dtype=bool)
+        groups, starts, ends, rows = [], [], [], []
+        for i, venue in enumerate(venues):
+            zone = self._venue_zones[i] = zone_names.setdefault(venue.get("timezone") or default_timezone, len(zone_names))
+            availability = venue.get("service_availability")
+            if not availability:
+                # venues without opening hours are never filtered out
+                self._always_open[i] = True
+                continue
+            for day, start, end in day_periods(availability):
+                groups.append(zone * 7 + day)
+                starts.append(start)
+                ends.append(end)
+                rows.append(i)
+
+        self._zones: List[Optional[tzinfo]] = [ZoneInfo(name) if name else None for name in zone_names]
+        order = np.lexsort((np.asarray(rows, dtype=np.int32), np.asarray(groups, dtype=np.int32)))
+        self._starts = np.asarray(starts, dtype=np.int16)[order]
+        self._ends = np.asarray(ends, dtype=np.int16)[order]
+        self._rows = np.asarray(rows, dtype=np.int32)[order]
+        self._offsets = np.zeros(len(self._zones) * 7 + 1, dtype=np.int64)
+        np.cumsum(np.bincount(np.asarray(groups, dtype=np.int64), minlength=len(self._zones) * 7), out=self._offsets[1:])
+
+    def __len__(self) -> int:
+        return len(self.store_ids)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self._starts, self._ends, self._rows, self._offsets, self._venue_zones, self._always_open))
+
+    def _group(self, zone: int, at: datetime) -> Tuple[int, int, int]:
+        # the periods of the venues in the zone on the local day of at, and the local minute
+        if at.tzinfo is not None:
+            at = at.astimezone(self._zones[zone])
+        group = zone * 7 + at.weekday()
+        return self._offsets[group], self._offsets[group + 1], at.hour * 60 + at.minute
+
+    def is_open(self, store_id: str, at: datetime) -> bool:
+        i = self._positions.get(store_id)
+        if i is None or self._always_open[i]:
+            return True
+        lo, hi, minute = self._group(self._venue_zones[i], at)
+        first = lo + np.searchsorted(self._rows[lo:hi], i, side="left")
+        last = lo + np.searchsorted(self._rows[lo:hi], i, side="right")
+        return bool(np.any((self._starts[first:last] <= minute) & (minute < self._ends[first:last])))
+
+    def open_mask(self, at: datetime) -> np.ndarray:
+        mask = self._always_open.copy()
+        for zone in range(len(self._zones)):
+            lo, hi, minute = self._group(zone, at)
+            is_open = (self._starts[lo:hi] <= minute) & (minute < self._ends[lo:hi])
+            mask[self._rows[lo:hi][is_open]] = True
+        return mask
+
+    def open_store_ids(self, at: datetime, store_ids: Optional[Iterable[str]] = None) -> List[str]:
+        mask = self.open_mask(at)
+        if store_ids is None:
+            return [store_id for store_id, is_open in zip(self.store_ids, mask) if is_open]
+        # venues unknown to the index are kept, like venues without opening hours
+        return [store_id for store_id in store_ids if store_id not in self._positions or mask[self._positions[store_id]]]
@@ -1,30 +1,96 @@
-import json
 import logging
 import random
 import re
-from timeit import default_timer as timer
-from langchain_community.vectorstores import FAISS
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from datetime import datetime
+import numpy as np
 from pydantic import BaseModel
-from transformers.utils import is_torch_mps_available
-from langchain.globals import set_verbose
 from models.order import MenuItem, OrderDetails
-from services.agent.chains import Chains
+from services.agent.budget_parser import BudgetParser
 from services.agent.embeddings import AgentEmbeddings
+from services.agent.intent_classifier import IntentClassifier
+from services.agent.lexical_index import parse_preferences
+from services.agent.menu_index import MenuIndex
+from services.agent.rephrase_cache import RephraseCache
+from services.agent.turn_graph import Node, TurnGraph, TurnGraphStats
+from services.eats.cached_eats_api import CachedEatsAPI
 from services.eats.eats_api import EatsAPI
-from sklearn.metrics.pairwise import cosine_similarity
-from langchain.docstore.document import Document
-from typing import Optional
+from services.eats.open_hours import OpenHoursIndex, utc_now
+from services.metrics import metrics
+from typing import TYPE_CHECKING, Callable, ContextManager, List, Optional, Tuple
 
 from enum import Enum
 
 from stores.userstore import UserStore
 
+if TYPE_CHECKING:
+    # langchain is only imported once the chains are created, so importing the agent stays cheap
+    from services.agent.chains import Chains
+
 class IntentEnum(Enum):
     GENERAL_QUESTION = "The user is asking a general question not related to ordering food."
     PROVIDE_ADDRESS = "The user is providing their delivery address or location for their food order."
     PROVIDE_PREFERENCES = "The user is providing their preferred cuisine, type of restaurants or ingredients for their order."
     PROVIDE_BUDGET = "The user is specifying a exact or approximate budget limit or numerical amount they are willing to pay or spend on their food order."
 
+INTENT_EXAMPLES = {
+    IntentEnum.GENERAL_QUESTION: [
+        "What's the weather like today?",
+        "Who are you?",
+        "Tell me a joke.",
+        "How does this app work?",
+        "What is the capital of France?",
+        "Can you help me with my homework?",
+    ],
+    IntentEnum.PROVIDE_ADDRESS: [
+        "delivery address is 321 W 54th Street, Apt 2E, New York, NY 10019",
+        "Deliver to 12 Main St., Springfield",
+        "My address is 1600 Pennsylvania Avenue NW, Washington, DC 20500",
+        "I live at 742 Evergreen Terrace",
+        "Send it to 55 Broadway, apartment 4B, New York",
+        "221B Baker Street, London",
+    ],
+    IntentEnum.PROVIDE_PREFERENCES: [
+        "What are some good Italian restaurants nearby?",
+        "something with calamari",
+        "I'd like sushi tonight",
+        "I want a burger with bacon and cheddar",
+        "I'm craving pizza with mushrooms",
+        "Something vegetarian with avocado, no pork",
+        "I feel like pasta with pesto",
+    ],
+    IntentEnum.PROVIDE_BUDGET: [
+        "limit the order under 20$",
+        "My budget is 30 dollars",
+        "no more than 25 bucks",
+        "around 40",
+        "I can spend up to $15",
+        "keep it cheap, about twenty dollars",
+        "15",
+    ],
+}
+
+# "embedding" matches a free text intent description to the IntentEnum descriptions, "label" constrains the model to reply with a label
+INTENT_MODES = ("embedding", "label")
+
+REQUEST_ADDRESS_REPLY = "Please provide your address."
+REQUEST_PREFERENCE_REPLY = "Please provide your food preference."
+REQUEST_BUDGET_REPLY = "Please provide your budget."
+NO_MATCH_REPLY = "Sorry, I couldn't find a dish that matches your preference and budget."
+REQUEST_PAYMENT_REPLY = "I'll order for you the preferred dish. Please provide payment details - they will sent directly to the payment provider and will not be stored."
+NOT_UNDERSTOOD_REPLY = "Sorry, I didn't understand your intent. Could you please rephrase?"
+
+CANNED_REPLIES = [
+    REQUEST_ADDRESS_REPLY,
+    REQUEST_PREFERENCE_REPLY,
+    REQUEST_BUDGET_REPLY,
+    NO_MATCH_REPLY,
+    REQUEST_PAYMENT_REPLY,
+    NOT_UNDERSTOOD_REPLY,
+]
+
 class ResponseStatus(Enum):
     ANSWER = "answer"
     ERROR = "error"
@@ -39,10 +105,63 @@ class Response(BaseModel):
     response: str
     order: Optional[OrderDetails] = None
 
+EventListener = Callable[[str, dict], None]
+
+class QuotedReply:
+    # picks the reply out of the rephrasing model's output as it streams: only the text inside the first quotes is
+    # passed on, without the preamble, the quotes, the whitespace around the reply or anything after it
+    def __init__(self, emit: Callable[[str], None]):
+        self.emit = emit
+        self.text = ""
+        self.closed = False
+        self._quote: Optional[str] = None
+        self._previous = ""
+        # whitespace, or a quote that may be an apostrophe, held back until the next character
+        self._pending = ""
+        self._apostrophe = False
+
+    def feed(self, token: str) -> None:
+        out = []
+        for char in token:
+            if self.closed:
+                break
+            if self._quote is None:
+                # a quote after a letter is an apostrophe ("here's"), not the opening quote
+                if char in "'\"" and self._previous != "\\" and not self._previous.isalnum():
+                    self._quote = char
+            elif self._apostrophe:
+                # a single quote between letters ("I'll") is an apostrophe, otherwise it closed the reply
+                self._apostrophe = False
+                if char.isalnum():
+                    out.append(self._pending + char)
+                    self._pending = ""
+                else:
+                    self.closed = True
+            elif char == self._quote and self._previous != "\\":
+                if char == "'" and self._previous.isalnum():
+                    self._apostrophe = True
+                    self._pending += char
+                else:
+                    self.closed = True
+            elif char.isspace():
+                if self.text or out:
+                    self._pending += char
+            else:
+                out.append(self._pending + char)
+                self._pending = ""
+            self._previous = char
+        if out:
+            chunk = "".join(out)
+            self.text += chunk
+            self.emit(chunk)
+
 class OrderingAgent:
-    def __init__(self, eats_api: EatsAPI, chains: Chains, embeddings: AgentEmbeddings, user_store: UserStore):
+    def __init__(self, eats_api: EatsAPI, chains: "Chains", embeddings: AgentEmbeddings, user_store: UserStore, menu_index: Optional[MenuIndex] = None, rephrase_cache: Optional[RephraseCache] = None, intent_threshold: float = 0.1,
+                 open_hours: Optional[OpenHoursIndex] = None, clock: Callable[[], datetime] = utc_now, intent_mode: str = "embedding",
+                 stage_workers: int = 4):
         self.logger = logging.getLogger(self.__class__.__name__)
         self.logger.setLevel(logging.DEBUG)
+        from langchain.globals import set_verbose
         set_verbose(False)
 
         ch = logging.StreamHandler()
@@ -51,20 +170,76 @@ class OrderingAgent:
         ch.setFormatter(formatter)
         self.logger.addHandler(ch)
 
-        if is_torch_mps_available():
-            self.logger.debug("MPS is available and being used.")
-        else:
-            self.logger.warning("MPS is not available or not being used.")
-        
+        if intent_mode not in INTENT_MODES:
+            raise ValueError(f"unknown intent mode {intent_mode}, expected one of {INTENT_MODES}")
+
         self.eats_api = eats_api
         self.user_store = user_store
         self.chains = chains
+        self.intent_mode = intent_mode
         self.embeddings = embeddings.get_embeddings()
-        self.enum_embeddings = self.embeddings.embed_documents([e.value for e in IntentEnum])
+        # the intent descriptions are embedded when the LLM fallback first needs them
+        self._enum_vectors: Optional[np.ndarray] = None
+        self.budget_parser = BudgetParser()
+        self.intent_classifier = IntentClassifier(self.embeddings, INTENT_EXAMPLES, threshold=intent_threshold)
         self.answer_chain = self.chains.create_answer_chain()
+        self.intent_chain = self.chains.create_intent_chain({intent.name: intent.value for intent in IntentEnum}) if intent_mode == "label" else None
+        # an empty index is falsy, e.g. of an eats api listing no venues, so it's compared to None
+        self.menu_index = menu_index if menu_index is not None else MenuIndex.load_or_build(eats_api, self.embeddings)
+        self.open_hours = open_hours if open_hours is not None else OpenHoursIndex(eats_api.get_venues())
+        # with a menu cache, menus which changed since the index was built are re-embedded incrementally
+        self.menu_cache = eats_api if isinstance(eats_api, CachedEatsAPI) else None
+        if self.menu_cache is not None:
+            self.menu_cache.add_menu_listener(self._on_menu_changed)
+        self.clock = clock
+        self.rephrase_cache = rephrase_cache or RephraseCache(self._rephrase)
+        # per request state of the turn being handled, e.g. the listener of a streaming request
+        self._turn = threading.local()
+        # independent stages of a turn run concurrently on a pool shared by all requests, 0 runs them one after another
+        self.stage_executor = ThreadPoolExecutor(max_workers=stage_workers, thread_name_prefix="stage") if stage_workers > 0 else None
+        self.turn_graph_stats = TurnGraphStats()
+        self.rephrase_cache.warm(CANNED_REPLIES)
 
-    def _reply(self, answer) -> str:        
-        candidate = self.answer_chain.invoke({"answer": answer})
+    def _on_menu_changed(self, store_id: str, menu: List[dict]) -> None:
+        added, removed = self.menu_index.update_venue(store_id, menu, self.embeddings)
+        if added or removed:
+            self.logger.debug(f"menu of venue {store_id} changed: {added} items embedded, {removed} removed")
+
+    def _emit(self, event: str, **data) -> None:
+        listener = getattr(self._turn, "listener", None)
+        if listener is not None:
+            listener(event, data)
+
+    def _reply(self, answer) -> str:
+        self._turn.streamed = False
+        with metrics.timer("reply_rephrase"):
+            reply = self.rephrase_cache.get(answer)
+        if not self._turn.streamed:
+            # served from the cache, so the whole reply is a single token
+            self._emit("token", text=reply)
+        return reply
+
+    def _rephrase(self, answer) -> Optional[str]:
+        listener = getattr(self._turn, "listener", None)
+        if listener is None:
+            candidate = self.answer_chain.invoke({"answer": answer})
+        else:
+            # only the reply inside the model's quotes is streamed, and it's the reply given
+            reply = QuotedReply(lambda text: listener("token", {"text": text}))
+            tokens = []
+            # the rest of the generation is dropped once the reply is closed, closing the stream stops it
+            with closing(self.answer_chain.stream({"answer": answer})) as stream:
+                for token in stream:
+                    tokens.append(token)
+                    reply.feed(token)
+                    if reply.closed:
+                        break
+            self.logger.debug(f"\ncandidate answer: {''.join(tokens)}")
+            self._turn.streamed = bool(reply.text)
+            if not reply.text:
+                self.logger.warning(f"\ncouldn't rephrase the answer {answer} using candidate answer: {''.join(tokens)}")
+                return None
+            return reply.text
         self.logger.debug(f"\ncandidate answer: {candidate}")
         
         parts = candidate.split('->')
@@ -78,7 +253,7 @@ class OrderingAgent:
         valid_matches = [match[0].strip() for match in matches if match[0].strip()]
         if not valid_matches:
             self.logger.warning(f"\ncouldn't rephrase the answer {answer} using candidate answer: {candidate}")
-            return answer
+            return None
         
         return random.choice(valid_matches)
     
@@ -88,66 +263,123 @@ class OrderingAgent:
             return int(match.group())
         else:
             return None
-        
-    def _search_menu_and_order(self, user_id: str) -> Response:
+
+    def _parse_budget(self, budget_input: str) -> Optional[float]:
+        with metrics.timer("budget_parser"):
+            budget_amount = self.budget_parser.parse(budget_input)
+        self.logger.debug(f'budget_parser() result: {budget_amount}, hit rate: {self.budget_parser.hit_rate():.2f}')
+        if budget_amount is None:
+            math_chain = self.chains.create_math_chain()
+            with metrics.timer("math_chain") as stage:
+                budget_result = math_chain.invoke({'input_text': budget_input})
+            self.logger.debug(f'math_chain() executed in {stage.seconds:.6f} seconds with result: {budget_result}')
+            budget_amount = self._parse_budget_amount(budget_result)
+        return budget_amount
+
+    def _open_venue_ids(self, address: str) -> List[str]:
+        with metrics.timer("venue_fetch"):
+            venues = self.eats_api.get_nearby_venues(
+                address=address,
+                radius=5.0
+            )
+        with metrics.timer("open_hours_filter"):
+            venue_ids = self.open_hours.open_store_ids(self.clock(), [venue["store_id"] for venue in venues])
+        if self.menu_cache is not None:
+            with metrics.timer("menu_refresh"):
+                self.menu_cache.get_menus(venue_ids)
+        # venues the eats api didn't list when the index was built
+        missing = [venue_id for venue_id in venue_ids if not self.menu_index.has_venue(venue_id)]
+        if missing:
+            with metrics.timer("menu_fetch"):
+                menus = self.eats_api.get_menus(missing)
+            for store_id, menu in menus.items():
+                self._on_menu_changed(store_id, menu)
+        return venue_ids
+
+    def _embed_preferences(self, preferences: Tuple[str, ...]) -> Tuple[str, List[str], List[float]]:
+        combined_preferences = " ".join(preferences)
+        # negated ingredients ("no pork") are excluded rather than ranked, so they are kept out of the query
+        query_text, excluded = parse_preferences(combined_preferences)
+        self.logger.debug(f"\npreference: {combined_preferences} excluded: {excluded}")
+        with metrics.timer("preference_embedding"):
+            preference_embedding = self.embeddings.embed_query(query_text or combined_preferences)
+        return query_text, excluded, preference_embedding
+
+    def _search(self, budget: float, venue_ids: List[str], query: Tuple[str, List[str], List[float]]) -> list:
+        query_text, excluded, preference_embedding = query
+        # a category named in the preferences, e.g. "italian", restricts the search to it
+        categories = [category for category in self.menu_index.categories if re.search(rf"\b{re.escape(category)}\b", query_text, re.IGNORECASE)]
+        with metrics.timer("index_search"):
+            return self.menu_index.hybrid_search(preference_embedding, query_text, k=5, max_price=budget, venue_ids=venue_ids,
+                                                 categories=categories or None, excluded=excluded)
+
+    def _venues_node(self, graph: TurnGraph, address: str, speculative: bool = False) -> Node:
+        return graph.add("venues", self._open_venue_ids, address, key=("venues", address), speculative=speculative)
+
+    def _query_node(self, graph: TurnGraph, preferences: List[str], speculative: bool = False) -> Node:
+        return graph.add("preference_embedding", self._embed_preferences, tuple(preferences), key=("preference_embedding", tuple(preferences)),
+                         speculative=speculative)
+
+    def _prepare_search(self, graph: TurnGraph, user_id: str, preference: Optional[str] = None) -> None:
+        # starts the search inputs known so far, _search_menu_and_order picks them up and the rest is dropped with the turn
+        if self.user_store.has_address(user_id):
+            self._venues_node(graph, self.user_store.get_address(user_id), speculative=True)
+        preferences = self.user_store.get_preferences(user_id)
+        if preference is not None:
+            preferences.append(preference)
+        if preferences:
+            self._query_node(graph, preferences, speculative=True)
+
+    def _search_menu_and_order(self, graph: TurnGraph, user_id: str) -> Response:
         if not self.user_store.has_address(user_id):
-            return Response(status=ResponseStatus.REQUEST_ADDRESS, response=self._reply("Please provide your address."))
+            return Response(status=ResponseStatus.REQUEST_ADDRESS, response=self._reply(REQUEST_ADDRESS_REPLY))
         
         if not self.user_store.has_preferences(user_id):
-            return Response(status=ResponseStatus.REQUEST_PREFERENCE, response=self._reply("Please provide your food preference."))
+            return Response(status=ResponseStatus.REQUEST_PREFERENCE, response=self._reply(REQUEST_PREFERENCE_REPLY))
 
         if not self.user_store.has_budget(user_id):
-            return Response(status=ResponseStatus.REQUEST_BUDGET, response=self._reply("Please provide your budget."))
+            return Response(status=ResponseStatus.REQUEST_BUDGET, response=self._reply(REQUEST_BUDGET_REPLY))
         
         user_address = self.user_store.get_address(user_id)
         preferences = self.user_store.get_preferences(user_id)
         budget = self.user_store.get_budget(user_id)
 
-        venues = self.eats_api.get_nearby_venues(
-            address=user_address,
-            radius=5.0
-        )
+        # the venues and the preference embedding are independent, the search runs once both are ready
+        venues = self._venues_node(graph, user_address)
+        query = self._query_node(graph, preferences)
+        search = graph.add("index_search", self._search, budget, after=(venues, query))
+        # the payment request doesn't depend on the search, so it is rephrased meanwhile. a streamed reply can't be
+        # taken back, so it is only prepared ahead without a listener
+        reply = None
+        if getattr(self._turn, "listener", None) is None:
+            reply = graph.add("reply", self._reply, REQUEST_PAYMENT_REPLY, speculative=True)
 
-        # Create a temporary in-memory vector store for menu items
-        menu_items = []
-        for venue in venues:
-            menu = self.eats_api.get_menu(venue["store_id"])
-            for item in menu:
-                item["venue_id"] = venue["store_id"]
-                menu_items.append(Document(page_content=json.dumps(item), metadata=item))
-
-        menu_store = FAISS.from_documents(menu_items, self.embeddings)
-        
-        combined_preferences = " ".join(preferences)
-        self.logger.debug(f"\npreference: {combined_preferences}")
-        preference_embedding = self.embeddings.embed_query(combined_preferences)
-        docs_and_scores = menu_store.similarity_search_with_score_by_vector(preference_embedding, k=5, filter=lambda metadata: metadata.get('price', float('inf')) <= budget)
+        venue_ids = graph.result(venues)
+        self._emit("status", stage="searching_menu", venues=len(venue_ids))
+        items_and_scores = graph.result(search)
 
         top_item = None
-        if docs_and_scores:
-            sorted_results = sorted(docs_and_scores, key=lambda x: x[1])
-            for doc, score in sorted_results:
-                menu_item = MenuItem(**doc.metadata)
-                self.logger.debug(f"\nscore: {score} item: {menu_item.title} ingredients: {menu_item.ingredients}")
-            
-            top_item = MenuItem(**(sorted_results[0][0]).metadata)
+        if items_and_scores:
+            # fused scores, higher is better
+            sorted_results = sorted(items_and_scores, key=lambda x: x[1], reverse=True)
+            for item, score in sorted_results:
+                self.logger.debug(f"\nscore: {score:.3f} item: {item.get('title')} ingredients: {item.get('ingredients')}")
+            # only the returned item is validated into a model
+            top_item = MenuItem(**sorted_results[0][0])
         
         if top_item is None:
+            graph.cancel(reply)
             self.user_store.clear_preferences(user_id)
             self.user_store.clear_budget(user_id)
-            return Response(status=ResponseStatus.ERROR, response=self._reply("Sorry, I couldn't find a dish that matches your preference and budget."))
+            return Response(status=ResponseStatus.ERROR, response=self._reply(NO_MATCH_REPLY))
         
         self.logger.debug(f'selected item: {top_item}')
         order = OrderDetails(items=[top_item], total_price=top_item.price, address=user_address)
         self.user_store.set_order(user_id, order)
-        return Response(status=ResponseStatus.REQUEST_PAYMENT_DETAILS, response=self._reply(f"I'll order for you the preferred dish. Please provide payment details - they will sent directly to the payment provider and will not be stored."), order=order)
-
-    def handle_input(self, user_id: str, input_text: str) -> Response:
-        self.logger.debug(f'handle_input for {user_id} {input_text}')
-
-        qa_chain = self.chains.create_qa_chain(user_id)
+        response = graph.result(reply) if reply is not None else self._reply(REQUEST_PAYMENT_REPLY)
+        return Response(status=ResponseStatus.REQUEST_PAYMENT_DETAILS, response=response, order=order)
 
-        # Extract user's intent from input
+    def _build_context(self, user_id: str) -> str:
         context = "\n"
         if self.user_store.has_preferences(user_id):
             context += f"User preference is provided.\n"
@@ -165,26 +397,96 @@ class OrderingAgent:
             context += f"User hasn't provided yet budget, so I don't know the order budget.\n"
             if self.user_store.has_preferences(user_id) and self.user_store.has_address(user_id):
                 context += f"Most likely the user's intent will be to provide budget or limit to the order, any number should be considered as order limit.\n"
-        
+        return context
+
+    @property
+    def enum_vectors(self) -> np.ndarray:
+        # unit vectors of the IntentEnum descriptions, so a dot product is the cosine similarity
+        if self._enum_vectors is None:
+            vectors = np.asarray(self.embeddings.embed_documents([e.value for e in IntentEnum]), dtype=np.float32)
+            self._enum_vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return self._enum_vectors
+
+    def _detect_intent_with_llm(self, user_id: str, input_text: str, qa_chain) -> IntentEnum:
+        context = self._build_context(user_id)
         self.logger.debug(f'context for {user_id} is {context}')
+        if self.intent_mode == "label":
+            return self._detect_intent_label(input_text, context)
         
-        start = timer()
         self.logger.debug(f'intent_chain() invoked')
-        intent_description = qa_chain.invoke({
-            "question": input_text,
-            "context": context
-        })
-        end = timer()
-        self.logger.debug(f'intent_chain() executed in {end - start:.6f} seconds with intent: {intent_description}')
+        with metrics.timer("intent_llm") as stage:
+            intent_description = qa_chain.invoke({
+                "question": input_text,
+                "context": context
+            })
+        self.logger.debug(f'intent_chain() executed in {stage.seconds:.6f} seconds with intent: {intent_description}')
 
         # Compare intent with enum descriptions using embeddings
-        start = timer()
-        intent_embeddings = self.embeddings.embed_documents([intent_description])
-        similarities = cosine_similarity(intent_embeddings, self.enum_embeddings)
-        intent_index = similarities.argmax()
-        intent = IntentEnum(list(IntentEnum)[intent_index])
-        end = timer()
-        self.logger.debug(f'intent_embeddings() executed in {end - start:.6f} seconds with intent: {intent}')
+        with metrics.timer("intent_embedding") as stage:
+            intent_vector = np.asarray(self.embeddings.embed_documents([intent_description])[0], dtype=np.float32)
+            similarities = self.enum_vectors @ (intent_vector / max(np.linalg.norm(intent_vector), 1e-12))
+            intent_index = similarities.argmax()
+            intent = IntentEnum(list(IntentEnum)[intent_index])
+        self.logger.debug(f'intent_embeddings() executed in {stage.seconds:.6f} seconds with intent: {intent}')
+        return intent
+
+    def _detect_intent_label(self, input_text: str, context: str) -> IntentEnum:
+        with metrics.timer("intent_llm", mode="label") as stage:
+            label = self.intent_chain.invoke({
+                "question": input_text,
+                "context": context
+            }).strip()
+        self.logger.debug(f'intent_chain() executed in {stage.seconds:.6f} seconds with label: {label}')
+        try:
+            return IntentEnum[label]
+        except KeyError:
+            # only reachable when the grammar isn't enforced, e.g. by an older llama.cpp
+            self.logger.warning(f"intent chain replied {label!r} instead of a label, treating it as a general question")
+            return IntentEnum.GENERAL_QUESTION
+
+    def _turn_context(self) -> Callable[[], ContextManager]:
+        # stages running on the worker pool stream to the listener of the request they work for
+        listener = getattr(self._turn, "listener", None)
+
+        @contextmanager
+        def context():
+            previous = getattr(self._turn, "listener", None)
+            self._turn.listener = listener
+            try:
+                yield
+            finally:
+                self._turn.listener = previous
+        return context
+
+    def handle_input(self, user_id: str, input_text: str, listener: Optional[EventListener] = None) -> Response:
+        self._turn.listener = listener
+        try:
+            with metrics.turn(intent="unknown"):
+                graph = TurnGraph(self.stage_executor, self._turn_context(), self.turn_graph_stats)
+                try:
+                    return self._handle_input(graph, user_id, input_text)
+                finally:
+                    graph.close()
+        finally:
+            self._turn.listener = None
+
+    def _handle_input(self, graph: TurnGraph, user_id: str, input_text: str) -> Response:
+        self.logger.debug(f'handle_input for {user_id} {input_text}')
+
+        qa_chain = self.chains.create_qa_chain(user_id)
+
+        # Extract user's intent from input, the LLM is only consulted when the fast path isn't confident
+        with metrics.timer("intent_fast_path") as stage:
+            intent = self.intent_classifier.predict(input_text)
+        self.logger.debug(f'intent_classifier() executed in {stage.seconds:.6f} seconds with intent: {intent}')
+        if intent is None:
+            # while the LLM decides, the search inputs are prepared speculatively for the input as a preference and as
+            # an address or budget
+            self._prepare_search(graph, user_id)
+            self._prepare_search(graph, user_id, input_text)
+            intent = graph.result(graph.add("intent_llm", self._detect_intent_with_llm, user_id, input_text, qa_chain))
+        metrics.current_turn.set_labels(intent=intent.name)
+        self._emit("status", stage="intent_detected", intent=intent.name)
 
         # Handle different intents
         if intent == IntentEnum.GENERAL_QUESTION:
@@ -193,29 +495,26 @@ class OrderingAgent:
 
         elif intent == IntentEnum.PROVIDE_BUDGET:
             if not self.user_store.has_budget(user_id):
-                budget_input = input_text
-                math_chain = self.chains.create_math_chain()
-                start = timer()
-                budget_result = math_chain.invoke({'input_text': budget_input})
-                end = timer()
-                self.logger.debug(f'math_chain() executed in {end - start:.6f} seconds with result: {budget_result}')
-                budget_amount = self._parse_budget_amount(budget_result)
+                budget = graph.add("budget", self._parse_budget, input_text)
+                # the search inputs don't depend on the budget, they are prepared while it is parsed
+                self._prepare_search(graph, user_id)
+                budget_amount = graph.result(budget)
                 if budget_amount is not None:
                     self.user_store.set_budget(user_id, budget_amount)
                     self.logger.debug(f'user {user_id} assigned with budget: {budget_amount}')
                 else:
-                    return Response(status=ResponseStatus.ERROR, response=self._reply("Sorry, I didn't understand your intent. Could you please rephrase?"))
-            return self._search_menu_and_order(user_id)
+                    return Response(status=ResponseStatus.ERROR, response=self._reply(NOT_UNDERSTOOD_REPLY))
+            return self._search_menu_and_order(graph, user_id)
         
         elif intent == IntentEnum.PROVIDE_ADDRESS:
             if not self.user_store.has_address(user_id):
                 self.user_store.set_address(user_id, input_text)
                 self.logger.debug(f'user {user_id} assigned with address: {input_text}')        
-            return self._search_menu_and_order(user_id)
+            return self._search_menu_and_order(graph, user_id)
 
         elif intent == IntentEnum.PROVIDE_PREFERENCES:
             self.user_store.set_preference(user_id, input_text)
             self.logger.debug(f'user {user_id} assigned with preference: {input_text}')        
-            return self._search_menu_and_order(user_id)
+            return self._search_menu_and_order(graph, user_id)
         else:
-            return Response(status=ResponseStatus.ERROR, response=self._reply("Sorry, I didn't understand your intent. Could you please rephrase?"))
\ No newline at end of file
+            return Response(status=ResponseStatus.ERROR, response=self._reply(NOT_UNDERSTOOD_REPLY))
\ No newline at end of file
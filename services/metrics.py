@@ -0,0 +1,161 @@
+import threading
+from collections import deque
+from contextlib import contextmanager
+from timeit import default_timer as timer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Dict[str, str], float]
+Collector = Callable[[], Union[Dict[str, float], List[Sample]]]
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+class Histogram:
+    # quantiles are computed over a sliding window of the most recent observations
+    def __init__(self, window: int = 1024):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._samples.append(value)
+            self.sum += value
+            self.count += 1
+
+    def quantiles(self, quantiles=QUANTILES) -> List[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return [0.0 for _ in quantiles]
+        return [samples[min(int(q * len(samples)), len(samples) - 1)] for q in quantiles]
+
+class StageTimer:
+    def __init__(self):
+        self.seconds = 0.0
+
+class TurnRecorder:
+    # stage timings of one turn are buffered until labels known only at the end (e.g. intent) are set
+    def __init__(self):
+        self.stages: List[Tuple[str, float, Dict[str, str]]] = []
+        self.labels: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float, labels: Dict[str, str]) -> None:
+        with self._lock:
+            self.stages.append((stage, seconds, labels))
+
+    def set_labels(self, **labels) -> None:
+        self.labels.update({key: str(value) for key, value in labels.items()})
+
+class Metrics:
+    def __init__(self, namespace: str = "llama_eats", window: int = 1024):
+        self.namespace = namespace
+        self.window = window
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._collectors: Dict[str, Collector] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @staticmethod
+    def _labels(labels: Dict[str, str]) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def histogram(self, stage: str, **labels) -> Histogram:
+        key = (stage, self._labels(labels))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(self.window))
+        return histogram
+
+    def observe(self, stage: str, seconds: float, **labels) -> None:
+        self.histogram(stage, **labels).observe(seconds)
+
+    def histograms(self) -> List[Tuple[str, Dict[str, str], Histogram]]:
+        with self._lock:
+            return [(stage, dict(labels), histogram) for (stage, labels), histogram in sorted(self._histograms.items())]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+    @property
+    def current_turn(self) -> Optional[TurnRecorder]:
+        return getattr(self._local, "turn", None)
+
+    @contextmanager
+    def attach(self, turn: Optional[TurnRecorder]) -> Iterator[None]:
+        # lets worker threads record into the turn of the request they are working for
+        previous = self.current_turn
+        self._local.turn = turn
+        try:
+            yield
+        finally:
+            self._local.turn = previous
+
+    @contextmanager
+    def timer(self, stage: str, **labels) -> Iterator[StageTimer]:
+        stage_timer = StageTimer()
+        start = timer()
+        try:
+            yield stage_timer
+        finally:
+            stage_timer.seconds = timer() - start
+            turn = self.current_turn
+            if turn is not None:
+                turn.record(stage, stage_timer.seconds, labels)
+            else:
+                self.observe(stage, stage_timer.seconds, **labels)
+
+    @contextmanager
+    def turn(self, **labels) -> Iterator[TurnRecorder]:
+        turn = TurnRecorder()
+        turn.set_labels(**labels)
+        start = timer()
+        with self.attach(turn):
+            try:
+                yield turn
+            finally:
+                total = timer() - start
+                for stage, seconds, stage_labels in turn.stages:
+                    self.observe(stage, seconds, **{**turn.labels, **stage_labels})
+                self.observe("turn", total, **turn.labels)
+
+    def register_collector(self, name: str, collector: Collector) -> None:
+        with self._lock:
+            self._collectors[name] = collector
+
+    @staticmethod
+    def _format_labels(labels: Dict[str, str]) -> str:
+        if not labels:
+            return ""
+        escaped = []
+        for key, value in labels.items():
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            escaped.append(f'{key}="{value}"')
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self) -> str:
+        name = f"{self.namespace}_stage_seconds"
+        lines = [f"# HELP {name} Latency of each turn stage in seconds.", f"# TYPE {name} summary"]
+        with self._lock:
+            collectors = sorted(self._collectors.items())
+
+        for stage, labels, histogram in self.histograms():
+            labels = {"stage": stage, **labels}
+            for quantile, value in zip(QUANTILES, histogram.quantiles()):
+                lines.append(f"{name}{self._format_labels({**labels, 'quantile': str(quantile)})} {value:.6f}")
+            lines.append(f"{name}_sum{self._format_labels(labels)} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{self._format_labels(labels)} {histogram.count}")
+
+        for prefix, collector in collectors:
+            samples = collector()
+            if isinstance(samples, dict):
+                samples = [(key, {}, value) for key, value in samples.items()]
+            for sample_name, labels, value in samples:
+                lines.append(f"{self.namespace}_{prefix}_{sample_name}{self._format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
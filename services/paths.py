@@ -0,0 +1,50 @@
+import os
+import pathlib
+import shutil
+from contextlib import contextmanager
+from typing import IO, Iterator
+
+APP_NAME = "llama-eats"
+
+# runtime files live outside the source tree, LLAMA_EATS_HOME moves all of them, e.g. to a volume
+def state_dir(*parts: str) -> pathlib.Path:
+    # orders and other data kept across restarts
+    home = os.environ.get("LLAMA_EATS_HOME")
+    if home:
+        return pathlib.Path(home, "state", *parts)
+    base = os.environ.get("XDG_STATE_HOME") or pathlib.Path.home() / ".local/state"
+    return pathlib.Path(base, APP_NAME, *parts)
+
+def cache_dir(*parts: str) -> pathlib.Path:
+    # files derived from others, safe to delete
+    home = os.environ.get("LLAMA_EATS_HOME")
+    if home:
+        return pathlib.Path(home, "cache", *parts)
+    base = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    return pathlib.Path(base, APP_NAME, *parts)
+
+@contextmanager
+def atomic_write(path: pathlib.Path, mode: str = "wb") -> Iterator[IO]:
+    # the file is written under a temporary name and replaces path once synced, so readers, memory maps included, keep
+    # the old file or see the complete new one
+    path = pathlib.Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+def replace_directory(tmp_path: pathlib.Path, path: pathlib.Path) -> None:
+    # swaps a completely written directory in for path. the old files are unlinked, not overwritten, so memory maps of
+    # them stay valid; a crash between the two renames leaves no directory at path rather than a mix of both
+    old_path = path.with_name(f"{path.name}.{os.getpid()}.old")
+    shutil.rmtree(old_path, ignore_errors=True)
+    if path.exists():
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
@@ -0,0 +1,113 @@
+import logging
+import os
+import threading
+import weakref
+from timeit import default_timer as timer
+from typing import Callable, Dict, Optional
+
+from services.llm_service import OrderingAgent
+
+# "eager" loads the models before serving, "background" serves health checks while a warm-up thread loads them,
+# "lazy" loads them on the first request
+STARTUP_MODES = ("eager", "background", "lazy")
+
+# modules taking seconds to import, which importing main must not pull in
+HEAVY_MODULES = (
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "sklearn",
+    "faiss",
+    "llama_cpp",
+    "langchain.chains",
+    "langchain_community",
+    "langchain_huggingface",
+    "langchain_core.language_models",
+)
+
+class AgentLoader:
+    # builds the OrderingAgent, with the models and the menu index behind it, according to the startup mode
+    def __init__(self, factory: Callable[[], OrderingAgent], mode: str = "eager"):
+        if mode not in STARTUP_MODES:
+            raise ValueError(f"unknown startup mode {mode}, expected one of {STARTUP_MODES}")
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.factory = factory
+        self.mode = mode
+        self.load_seconds: Optional[float] = None
+        self._agent: Optional[OrderingAgent] = None
+        self._error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+        self._warmup_thread: Optional[threading.Thread] = None
+
+        if mode == "eager":
+            self.get()
+        elif mode == "background":
+            _loading.add(self)
+            self._warmup_thread = threading.Thread(target=self._warm_up, name="agent-warmup", daemon=True)
+            self._warmup_thread.start()
+
+    @classmethod
+    def loaded(cls, agent: OrderingAgent) -> "AgentLoader":
+        return cls(lambda: agent)
+
+    def _warm_up(self) -> None:
+        try:
+            self.get()
+        except Exception:
+            pass
+        finally:
+            _loading.discard(self)
+
+    def get(self) -> OrderingAgent:
+        # waits while another thread is loading, a failed load is reported to every caller
+        if self._agent is not None:
+            return self._agent
+        with self._lock:
+            if self._agent is None and self._error is None:
+                start = timer()
+                try:
+                    self._agent = self.factory()
+                except Exception as e:
+                    self.logger.exception("couldn't load the ordering agent")
+                    self._error = e
+                self.load_seconds = timer() - start
+                if self._agent is not None:
+                    self.logger.info(f"ordering agent loaded in {self.load_seconds:.3f} seconds")
+            if self._error is not None:
+                raise RuntimeError("the ordering agent failed to load") from self._error
+            return self._agent
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        if self._warmup_thread is not None:
+            self._warmup_thread.join(timeout)
+        return self.ready
+
+    @property
+    def ready(self) -> bool:
+        return self._agent is not None
+
+    @property
+    def failed(self) -> bool:
+        return self._error is not None
+
+    def status(self) -> Dict[str, object]:
+        status = "ready" if self.ready else "failed" if self.failed else "loading" if self.mode == "background" else "idle"
+        result = {"status": status, "startup": self.mode}
+        if self.load_seconds is not None:
+            result["load_seconds"] = round(self.load_seconds, 3)
+        if self._error is not None:
+            result["error"] = str(self._error)
+        return result
+
+    def stats(self) -> Dict[str, float]:
+        return {"ready": int(self.ready), "failed": int(self.failed), "load_seconds": self.load_seconds or 0.0}
+
+# loaders warming up in the background. a pre-fork server forks once the models are loaded, so the workers share them;
+# one hook for all loaders, forks once they're loaded don't wait
+_loading: "weakref.WeakSet[AgentLoader]" = weakref.WeakSet()
+
+def _wait_loaded_before_fork() -> None:
+    for loader in list(_loading):
+        loader.wait()
+
+os.register_at_fork(before=_wait_loaded_before_fork)
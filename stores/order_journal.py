@@ -0,0 +1,195 @@
+import fcntl
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from services.paths import state_dir
+
+FSYNC_ALWAYS = "always"
+FSYNC_INTERVAL = "interval"
+FSYNC_NEVER = "never"
+
+class OrderJournal:
+    # orders are appended one JSON line each to the journal and periodically compacted into the snapshot,
+    # which keeps the format of the orders.json file MockEatsAPI used to rewrite on every booking
+    def __init__(self, directory: Optional[str] = None, fsync: str = FSYNC_INTERVAL, fsync_interval: float = 1.0, compact_every: int = 10000,
+                 snapshot_name: str = "orders.json", journal_name: str = "orders.journal"):
+        if fsync not in (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER):
+            raise ValueError(f"unknown fsync policy {fsync}")
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        directory = str(directory or self.default_directory())
+        self.snapshot_path = os.path.join(directory, snapshot_name)
+        self.journal_path = os.path.join(directory, journal_name)
+        os.makedirs(directory, exist_ok=True)
+
+        self.orders: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        # writers in other processes are serialized through an flock on a separate lock file,
+        # the journal itself is replaced on compaction
+        self._lock_path = os.path.join(directory, journal_name + ".lock")
+        self._lock_file = open(self._lock_path, "a")
+        self._pid = os.getpid()
+        self._journal = None
+        self._inode = None
+        self._offset = 0
+        self._records = 0
+        self._last_fsync = time.monotonic()
+
+        with self._lock, self._file_lock():
+            self._reload()
+
+    @staticmethod
+    def default_directory() -> pathlib.Path:
+        # the orders hold payment details, they never go into the source tree
+        return state_dir("orders")
+
+    def _check_process(self) -> None:
+        # a journal opened before the server forks its workers shares the lock file's and the journal's open file descriptions
+        # with them, an flock on a shared description doesn't exclude the siblings, so each process reopens both
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._lock_file.close()
+        self._lock_file = open(self._lock_path, "a")
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        # makes _catch_up reload the snapshot and journal through the new descriptions
+        self._inode = None
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        self._check_process()
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _open_journal(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_path, "ab")
+        self._inode = os.fstat(self._journal.fileno()).st_ino
+        self._offset = 0
+        self._records = 0
+        self._corrupt: List[bytes] = []
+
+    def _reload(self) -> None:
+        self.orders = {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as f:
+                self.orders = json.load(f)
+        self._open_journal()
+        self._replay()
+        self.logger.debug(f"loaded {len(self.orders)} orders from {self.snapshot_path} and {self.journal_path}")
+
+    def _replay(self) -> None:
+        # applies records appended since the last replay, including those written by other processes
+        with open(self.journal_path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # a torn write from a crashed writer, it is overwritten by the next append
+                    break
+                self._offset += len(line)
+                try:
+                    record = json.loads(line)
+                    self.orders[record["id"]] = record["order"]
+                except (ValueError, KeyError, TypeError) as e:
+                    # a record mangled by a crash is skipped rather than keeping the server from starting,
+                    # compaction moves it to the .corrupt file
+                    self.logger.warning(f"skipping a corrupt record in {self.journal_path}: {e}")
+                    self._corrupt.append(line)
+                    continue
+                self._records += 1
+
+    def _catch_up(self) -> None:
+        try:
+            replaced = os.stat(self.journal_path).st_ino != self._inode
+        except FileNotFoundError:
+            replaced = True
+        if replaced:
+            # another process compacted the journal, start over from its snapshot
+            self._reload()
+        else:
+            self._replay()
+
+    def append(self, order_id: str, order: dict) -> None:
+        line = (json.dumps({"id": order_id, "order": order}) + "\n").encode("utf-8")
+        with self._lock:
+            with self._file_lock():
+                self._catch_up()
+                # drop a torn tail left by a crashed writer before appending
+                self._journal.truncate(self._offset)
+                self._journal.write(line)
+                self._journal.flush()
+                self._offset += len(line)
+                self._records += 1
+                self._sync()
+            self.orders[order_id] = order
+            # the journal is compacted once it outgrows the snapshot, keeping the amortized cost of a booking constant
+            if self.compact_every and self._records >= max(self.compact_every, len(self.orders) - self._records):
+                self._compact()
+
+    def _sync(self) -> None:
+        if self.fsync == FSYNC_ALWAYS:
+            os.fsync(self._journal.fileno())
+        elif self.fsync == FSYNC_INTERVAL and time.monotonic() - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._journal.fileno())
+            self._last_fsync = time.monotonic()
+
+    def _write_atomically(self, path: str, data: bytes) -> None:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _compact(self) -> None:
+        with self._file_lock():
+            self._catch_up()
+            self._write_atomically(self.snapshot_path, json.dumps(self.orders).encode("utf-8"))
+            if self._corrupt:
+                with open(f"{self.journal_path}.corrupt", "ab") as f:
+                    f.writelines(self._corrupt)
+            # a crash between the two replaces only replays records already in the snapshot
+            self._write_atomically(self.journal_path, b"")
+            self._open_journal()
+        self.logger.debug(f"compacted {len(self.orders)} orders into {self.snapshot_path}")
+
+    def compact(self) -> None:
+        with self._lock:
+            self._compact()
+
+    def get(self, order_id: str) -> Optional[dict]:
+        with self._lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                # the order may have been booked by another worker process
+                with self._file_lock():
+                    self._catch_up()
+                order = self.orders.get(order_id)
+            return order
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self.orders)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._journal is not None:
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+                self._journal.close()
+                self._journal = None
+            self._lock_file.close()
@@ -0,0 +1,119 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+class UserVectorStore:
+    # one matrix shared by every session, rows are partitioned by the owning user
+    FREE = -1
+
+    def __init__(self, embeddings: Embeddings, initial_capacity: int = 1024):
+        self.embeddings = embeddings
+        self.initial_capacity = initial_capacity
+        self._vectors: Optional[np.ndarray] = None
+        self._owners = np.full(initial_capacity, self.FREE, dtype=np.int32)
+        self._documents: List[Optional[Document]] = [None] * initial_capacity
+        self._free_rows: List[int] = list(range(initial_capacity - 1, -1, -1))
+        self._owner_ids: Dict[str, int] = {}
+        self._rows: Dict[int, List[int]] = {}
+        self._next_owner_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def dimension(self) -> Optional[int]:
+        # learned from the first vector actually written, there is no probe embedding
+        return None if self._vectors is None else self._vectors.shape[1]
+
+    def _grow(self) -> None:
+        capacity = len(self._owners)
+        self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+        self._owners = np.concatenate([self._owners, np.full(capacity, self.FREE, dtype=np.int32)])
+        self._documents.extend([None] * capacity)
+        self._free_rows.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def add_texts(self, user_id: str, texts: List[str], metadatas: Optional[List[dict]] = None) -> List[int]:
+        if not texts:
+            return []
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        metadatas = metadatas or [{} for _ in texts]
+
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((len(self._owners), vectors.shape[1]), dtype=np.float32)
+            owner_id = self._owner_ids.get(user_id)
+            if owner_id is None:
+                owner_id = self._next_owner_id
+                self._next_owner_id += 1
+                self._owner_ids[user_id] = owner_id
+                self._rows[owner_id] = []
+
+            rows = []
+            for vector, text, metadata in zip(vectors, texts, metadatas):
+                if not self._free_rows:
+                    self._grow()
+                row = self._free_rows.pop()
+                self._vectors[row] = vector
+                self._owners[row] = owner_id
+                self._documents[row] = Document(page_content=text, metadata=metadata)
+                rows.append(row)
+            self._rows[owner_id].extend(rows)
+            return rows
+
+    def similarity_search_with_score(self, user_id: str, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        with self._lock:
+            owner_id = self._owner_ids.get(user_id)
+            if owner_id is None:
+                return []
+            rows = np.asarray(self._rows[owner_id], dtype=np.intp)
+        query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+
+        with self._lock:
+            # rows may have been released while the query was embedded
+            rows = rows[self._owners[rows] == owner_id]
+            distances = ((self._vectors[rows] - query_vector) ** 2).sum(axis=1)
+            order = np.argsort(distances)[:k]
+            return [(self._documents[rows[i]], float(distances[i])) for i in order]
+
+    def count(self, user_id: str) -> int:
+        with self._lock:
+            owner_id = self._owner_ids.get(user_id)
+            return 0 if owner_id is None else len(self._rows[owner_id])
+
+    def remove_user(self, user_id: str) -> None:
+        with self._lock:
+            owner_id = self._owner_ids.pop(user_id, None)
+            if owner_id is None:
+                return
+            rows = self._rows.pop(owner_id)
+            self._owners[rows] = self.FREE
+            for row in rows:
+                self._documents[row] = None
+            self._free_rows.extend(rows)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len(self._owner_ids),
+                "rows": len(self._owners) - len(self._free_rows),
+                "capacity": len(self._owners),
+            }
+
+class UserVectors:
+    # a per-user view, creating one allocates nothing until texts are added
+    def __init__(self, store: UserVectorStore, user_id: str):
+        self.store = store
+        self.user_id = user_id
+
+    def add_texts(self, texts: List[str], metadatas: Optional[List[dict]] = None) -> List[int]:
+        return self.store.add_texts(self.user_id, texts, metadatas)
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        return self.store.similarity_search_with_score(self.user_id, query, k)
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k)]
+
+    def __len__(self) -> int:
+        return self.store.count(self.user_id)
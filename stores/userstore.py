@@ -1,79 +1,153 @@
-from typing import Dict, Optional, List
-
-import faiss
-from langchain_community.vectorstores import FAISS
-from langchain_core.embeddings import Embeddings
-from langchain_community.docstore.in_memory import InMemoryDocstore
-from llama_index_client import Document
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, List
 
 from models.order import MenuItem
 from services.agent.embeddings import AgentEmbeddings
+from stores.user_vectors import UserVectors, UserVectorStore
+
+class _Session:
+    __slots__ = ("data", "last_access")
+
+    def __init__(self, now: float):
+        self.data: Dict[str, Any] = {}
+        self.last_access = now
 
 class UserStore:
-    def __init__(self, embeddings: AgentEmbeddings):
-        self._store: Dict[str, Dict] = {}
-        self.user_vector_db: Dict[str, FAISS] = {}
+    def __init__(self, embeddings: AgentEmbeddings, max_sessions: int = 10000, ttl_seconds: float = 3600.0, shards: int = 16,
+                 clock: Callable[[], float] = time.monotonic):
         self.embeddings = embeddings.get_embeddings()
-    
-    def _ensure_user_exists(self, user_id: str):
-        if user_id not in self._store:
-            self._store[user_id] = {}
-    
-    def get_user_vector_db(self, user_id: str) -> FAISS:
-        if user_id not in self.user_vector_db:
-            index = faiss.IndexFlatL2(len(self.embeddings.embed_query("hello world")))
-            self.user_vector_db[user_id] = FAISS(
-                docstore=InMemoryDocstore(),
-                embedding_function=self.embeddings,
-                index_to_docstore_id={},
-                index=index
-            )
-        return self.user_vector_db[user_id]
-    
+        self.user_vectors = UserVectorStore(self.embeddings)
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        # sessions are sharded by user id, each shard is an LRU ordered by last access.
+        # the shard capacities add up to max_sessions, so there are never more shards than sessions
+        shards = max(1, min(shards, max_sessions))
+        self._shards: List[OrderedDict] = [OrderedDict() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._shard_capacities = [max_sessions // shards + (index < max_sessions % shards) for index in range(shards)]
+        self._evictions = [0] * shards
+        self._expirations = [0] * shards
+
+    def _shard_index(self, user_id: str) -> int:
+        return hash(user_id) % len(self._shards)
+
+    def _expire(self, index: int, now: float) -> None:
+        # the least recently used session is first, so expiry stops at the first live session
+        shard = self._shards[index]
+        while shard:
+            oldest = next(iter(shard.values()))
+            if now - oldest.last_access < self.ttl_seconds:
+                break
+            user_id, _ = shard.popitem(last=False)
+            self.user_vectors.remove_user(user_id)
+            self._expirations[index] += 1
+
+    def _evict(self, index: int) -> None:
+        shard = self._shards[index]
+        while len(shard) > self._shard_capacities[index]:
+            user_id, _ = shard.popitem(last=False)
+            self.user_vectors.remove_user(user_id)
+            self._evictions[index] += 1
+
+    @contextmanager
+    def _session(self, user_id: str, create: bool = False) -> Iterator[Optional[Dict[str, Any]]]:
+        index = self._shard_index(user_id)
+        with self._locks[index]:
+            now = self.clock()
+            self._expire(index, now)
+            shard = self._shards[index]
+            session = shard.get(user_id)
+            if session is None and create:
+                session = _Session(now)
+                shard[user_id] = session
+                self._evict(index)
+            if session is None:
+                yield None
+                return
+            session.last_access = now
+            shard.move_to_end(user_id)
+            yield session.data
+
+    def _get(self, user_id: str, key: str, default=None):
+        with self._session(user_id) as session:
+            return session.get(key, default) if session is not None else default
+
+    def _has(self, user_id: str, key: str) -> bool:
+        with self._session(user_id) as session:
+            return session is not None and key in session
+
+    def get_user_vector_db(self, user_id: str) -> UserVectors:
+        # vectors are only allocated in the shared store once the user writes to it,
+        # the session is created so they are released when it's evicted
+        with self._session(user_id, create=True):
+            return UserVectors(self.user_vectors, user_id)
+
     def set_address(self, user_id: str, address: str) -> None:
-        self._ensure_user_exists(user_id)
-        self._store[user_id]['address'] = address
-    
+        with self._session(user_id, create=True) as session:
+            session['address'] = address
+
     def set_budget(self, user_id: str, budget: float) -> None:
-        self._ensure_user_exists(user_id)
-        self._store[user_id]['budget'] = budget
-    
+        with self._session(user_id, create=True) as session:
+            session['budget'] = budget
+
     def set_preference(self, user_id: str, preference: str) -> None:
-        self._ensure_user_exists(user_id)
-        if 'preference' not in self._store[user_id]:
-            self._store[user_id]['preference'] = []
-        self._store[user_id]['preference'].append(preference)
-    
+        with self._session(user_id, create=True) as session:
+            session.setdefault('preference', []).append(preference)
+
     def set_order(self, user_id: str, order: MenuItem) -> None:
-        self._ensure_user_exists(user_id)
-        self._store[user_id]['order'] = order
-    
+        with self._session(user_id, create=True) as session:
+            session['order'] = order
+
     def get_address(self, user_id: str) -> Optional[str]:
-        return self._store.get(user_id, {}).get('address')
-    
+        return self._get(user_id, 'address')
+
     def get_budget(self, user_id: str) -> Optional[float]:
-        return self._store.get(user_id, {}).get('budget')
-    
+        return self._get(user_id, 'budget')
+
     def get_preferences(self, user_id: str) -> List[str]:
-        return self._store.get(user_id, {}).get('preference', [])
-    
+        return list(self._get(user_id, 'preference', []))
+
     def get_order(self, user_id: str) -> Optional[MenuItem]:
-        return self._store.get(user_id, {}).get('order')
-    
+        return self._get(user_id, 'order')
+
     def has_address(self, user_id: str) -> bool:
-        return 'address' in self._store.get(user_id, {})
-    
+        return self._has(user_id, 'address')
+
     def has_budget(self, user_id: str) -> bool:
-        return 'budget' in self._store.get(user_id, {})
-    
+        return self._has(user_id, 'budget')
+
     def has_preferences(self, user_id: str) -> bool:
-        preferences = self._store.get(user_id, {}).get('preference', [])
-        return len(preferences) > 0
-    
+        return len(self._get(user_id, 'preference', [])) > 0
+
     def clear_preferences(self, user_id: str) -> None:
-        if user_id in self._store and 'preference' in self._store[user_id]:
-            self._store[user_id]['preference'] = []
-    
+        with self._session(user_id) as session:
+            if session is not None and 'preference' in session:
+                session['preference'] = []
+
     def clear_budget(self, user_id: str) -> None:
-        if user_id in self._store and 'budget' in self._store[user_id]:
-            del self._store[user_id]['budget']
\ No newline at end of file
+        with self._session(user_id) as session:
+            if session is not None and 'budget' in session:
+                del session['budget']
+
+    def remove_user(self, user_id: str) -> None:
+        index = self._shard_index(user_id)
+        with self._locks[index]:
+            self._shards[index].pop(user_id, None)
+        self.user_vectors.remove_user(user_id)
+
+    def stats(self) -> dict:
+        size = 0
+        for index, shard in enumerate(self._shards):
+            with self._locks[index]:
+                self._expire(index, self.clock())
+                size += len(shard)
+        return {
+            "sessions": size,
+            "max_sessions": self.max_sessions,
+            "evictions": sum(self._evictions),
+            "expirations": sum(self._expirations),
+        }
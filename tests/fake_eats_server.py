@@ -0,0 +1,102 @@
+# fake_eats_server.py
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+class FakeEatsServer:
+    # a local Eats backend with configurable per-venue latency and failures
+    def __init__(self, venues, menus, latency=0.0, slow=(), failing=(), slow_latency=2.0):
+        self.venues = venues
+        self.menus = menus
+        self.latency = latency
+        self.slow = set(slow)
+        self.failing = set(failing)
+        self.slow_latency = slow_latency
+        self.orders = {}
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections = set()
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _track(self, handle):
+                with server._lock:
+                    server.requests += 1
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                    server.connections.add(self.client_address)
+                try:
+                    handle()
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def do_GET(self):
+                self._track(self._get)
+
+            def do_POST(self):
+                self._track(self._post)
+
+            def _get(self):
+                url = urlparse(self.path)
+                parts = url.path.strip("/").split("/")
+                time.sleep(server.latency)
+                if parts == ["venues"]:
+                    self._send(200, server.venues)
+                elif parts == ["venues", "nearby"]:
+                    query = parse_qs(url.query)
+                    self._send(200, server.venues if query.get("address") else [])
+                elif len(parts) == 3 and parts[0] == "venues" and parts[2] == "menu":
+                    store_id = parts[1]
+                    if store_id in server.slow:
+                        time.sleep(server.slow_latency)
+                    if store_id in server.failing:
+                        self._send(500, {"error": "boom"})
+                    elif store_id not in server.menus:
+                        self._send(404, {"error": "not found"})
+                    else:
+                        self._send(200, server.menus[store_id])
+                elif len(parts) == 2 and parts[0] == "orders":
+                    order = server.orders.get(parts[1])
+                    self._send(200, order) if order else self._send(404, {"status": "not found"})
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def _post(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                order_id = str(uuid.uuid4())
+                server.orders[order_id] = {"status": "accepted", **body["order_details"]}
+                self._send(200, {"order_id": order_id})
+
+        return Handler
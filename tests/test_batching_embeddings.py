@@ -0,0 +1,76 @@
+# test_batching_embeddings.py
+import threading
+import time
+import unittest
+from services.agent.batching_embeddings import BatchingEmbeddings, normalize_uncased
+
+class SlowEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        time.sleep(0.02)
+        return [[float(len(text)), float(text.count("a"))] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+class TestBatchingEmbeddings(unittest.TestCase):
+    def test_concurrent_calls_share_a_forward_pass(self):
+        model = SlowEmbeddings()
+        embeddings = BatchingEmbeddings(model, max_batch_size=64, max_wait=0.05)
+        results = {}
+
+        def embed(i):
+            results[i] = embeddings.embed_query(f"text {i}")
+
+        threads = [threading.Thread(target=embed, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results[3], [6.0, 0.0])
+        self.assertLess(len(model.calls), 5)
+        stats = embeddings.stats()
+        self.assertEqual(stats["batched_texts"], 20)
+        self.assertGreater(stats["mean_batch_size"], 4)
+
+    def test_cache_by_normalized_text(self):
+        model = SlowEmbeddings()
+        embeddings = BatchingEmbeddings(model, max_wait=0.0, cache_size=2, normalize=normalize_uncased)
+        first = embeddings.embed_query("Pasta  with basil")
+        self.assertEqual(embeddings.embed_query(" pasta with BASIL "), first)
+        self.assertEqual(embeddings.embed_documents(["pasta with basil", "pizza", "pizza"]), [first, [5.0, 1.0], [5.0, 1.0]])
+        # the key is normalized, the model is sent the text as it was given
+        self.assertEqual(model.calls, [["Pasta  with basil"], ["pizza"]])
+        self.assertEqual(embeddings.stats()["cache_hits"], 2)
+
+    def test_cased_texts_by_default(self):
+        model = SlowEmbeddings()
+        embeddings = BatchingEmbeddings(model, max_wait=0.0)
+        embeddings.embed_query("Pizza")
+        embeddings.embed_query("pizza")
+        embeddings.embed_documents([f"Item {i}" for i in range(100)])
+        self.assertEqual(model.calls[:2], [["Pizza"], ["pizza"]])
+        self.assertEqual(model.calls[2][0], "Item 0")
+
+    def test_bulk_calls_bypass_the_queue_and_cache(self):
+        model = SlowEmbeddings()
+        embeddings = BatchingEmbeddings(model, max_batch_size=4)
+        self.assertEqual(len(embeddings.embed_documents([f"item {i}" for i in range(10)])), 10)
+        self.assertEqual(len(model.calls), 1)
+        self.assertEqual(embeddings.stats()["cache_entries"], 0)
+
+    def test_errors_reach_the_caller(self):
+        class FailingEmbeddings:
+            def embed_documents(self, texts):
+                raise RuntimeError("model unavailable")
+
+        embeddings = BatchingEmbeddings(FailingEmbeddings(), max_wait=0.0)
+        with self.assertRaises(RuntimeError):
+            embeddings.embed_query("pizza")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+# test_budget_parser.py
+import unittest
+from services.agent.budget_parser import BudgetParser
+
+class TestBudgetParser(unittest.TestCase):
+    def setUp(self):
+        self.parser = BudgetParser()
+
+    def test_currency_amounts(self):
+        self.assertEqual(self.parser.parse("$20"), 20)
+        self.assertEqual(self.parser.parse("limit the order under 20$"), 20)
+        self.assertEqual(self.parser.parse("under 30 bucks"), 30)
+        self.assertEqual(self.parser.parse("My budget is 12.50 USD"), 12.5)
+        self.assertEqual(self.parser.parse("1,200 dollars"), 1200)
+
+    def test_number_words(self):
+        self.assertEqual(self.parser.parse("twenty dollars"), 20)
+        self.assertEqual(self.parser.parse("no more than thirty-five bucks"), 35)
+        self.assertEqual(self.parser.parse("a hundred"), 100)
+        self.assertEqual(self.parser.parse("one hundred and twenty"), 120)
+        self.assertEqual(self.parser.parse("twenty five hundred"), 2500)
+
+    def test_adjacent_number_words_not_summed(self):
+        self.assertIsNone(self.parser.parse("ten ten"))
+        self.assertIsNone(self.parser.parse("five twenty"))
+        self.assertIsNone(self.parser.parse("one hundred one hundred"))
+
+    def test_ordinals_and_addresses_not_budgets(self):
+        self.assertIsNone(self.parser.parse("my address is 5th ave"))
+        self.assertIsNone(self.parser.parse("321 W 54th Street"))
+        self.assertIsNone(self.parser.parse("the twenty-first"))
+        self.assertEqual(self.parser.parse("my 1st order, under $20"), 20)
+
+    def test_fractions_and_negative_amounts_rejected(self):
+        self.assertIsNone(self.parser.parse("half a hundred"))
+        self.assertIsNone(self.parser.parse("a third of 60"))
+        self.assertIsNone(self.parser.parse("1/2 of 40"))
+        self.assertIsNone(self.parser.parse("-5"))
+        self.assertIsNone(self.parser.parse("$-5"))
+        self.assertIsNone(self.parser.parse("minus 20 dollars"))
+
+    def test_ranges_take_maximum(self):
+        self.assertEqual(self.parser.parse("20-30"), 30)
+        self.assertEqual(self.parser.parse("between $15 and $25"), 25)
+        self.assertEqual(self.parser.parse("from 10 to 18 bucks"), 18)
+        self.assertEqual(self.parser.parse("$20 - $30"), 30)
+
+    def test_approximate_rounds_up(self):
+        self.assertEqual(self.parser.parse("around 45"), 50)
+        self.assertEqual(self.parser.parse("about 40 dollars"), 40)
+        self.assertEqual(self.parser.parse("roughly twenty two"), 30)
+        self.assertEqual(self.parser.parse("~17"), 20)
+
+    def test_unparseable_falls_back(self):
+        self.assertIsNone(self.parser.parse("as cheap as possible"))
+        self.assertIsNone(self.parser.parse("3 people, 12 each, plus 5 tip"))
+        self.assertIsNone(self.parser.parse("2 pizzas for 30"))
+
+    def test_hit_rate(self):
+        self.parser.parse("$20")
+        self.parser.parse("cheap please")
+        self.assertEqual(self.parser.stats(), {"hits": 1, "misses": 1})
+        self.assertEqual(self.parser.hit_rate(), 0.5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+# test_cached_eats_api.py
+import tempfile
+import threading
+import time
+import unittest
+import numpy as np
+from services.agent.menu_index import MenuIndex
+from services.eats.cached_eats_api import CachedEatsAPI
+from services.eats.eats_api import EatsAPI
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class CountingEatsAPI(EatsAPI):
+    def __init__(self, menus, latency=0.0):
+        self.menus = menus
+        self.versions = {store_id: "v1" for store_id in menus}
+        self.latency = latency
+        self.menu_fetches = 0
+        self._lock = threading.Lock()
+
+    def get_venues(self):
+        return [{"store_id": store_id} for store_id in self.menus]
+
+    def get_nearby_venues(self, address, radius):
+        return self.get_venues()
+
+    def get_menu(self, store_id):
+        time.sleep(self.latency)
+        with self._lock:
+            self.menu_fetches += 1
+        return self.menus[store_id]
+
+    def get_menu_version(self, store_id):
+        return self.versions.get(store_id)
+
+    def book_order(self, order):
+        return "order"
+
+    def check_order(self, order_id):
+        return {"status": "accepted"}
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+def item(id, title, price=10.0):
+    return {"id": id, "title": title, "subtitle": "", "ingredients": [title.lower()], "price": price, "category": "italian"}
+
+class TestCachedEatsAPI(unittest.TestCase):
+    def setUp(self):
+        self.api = CountingEatsAPI({"a": [item("1", "Lasagna")], "b": [item("2", "Risotto")]})
+        self.clock = FakeClock()
+        self.cache = CachedEatsAPI(self.api, menu_ttl=60, max_entries=2, clock=self.clock)
+
+    def test_ttl(self):
+        self.cache.get_menus(["a", "b"])
+        self.cache.get_menu("a")
+        self.assertEqual(self.api.menu_fetches, 2)
+
+        self.clock.now = 61
+        self.api.versions["a"] = "v2"
+        self.cache.get_menus(["a", "b"])
+        # "b" is revalidated by its unchanged version, only "a" is refetched
+        self.assertEqual(self.api.menu_fetches, 3)
+        self.assertEqual(self.cache.stats()["revalidated"], 1)
+
+    def test_only_changed_menus_notify(self):
+        changed = []
+        self.cache.add_menu_listener(lambda store_id, menu: changed.append(store_id))
+        self.cache.get_menus(["a", "b"])
+        self.assertEqual(changed, [])
+
+        # "b" has a new version but the same items
+        self.api.versions = {"a": "v2", "b": "v2"}
+        self.api.menus["a"] = [item("1", "Lasagna", price=12.0)]
+        self.clock.now = 61
+        self.cache.get_menus(["a", "b"])
+        self.assertEqual(changed, ["a"])
+        self.assertEqual(self.cache.stats()["changes"], 1)
+
+    def test_lru_eviction(self):
+        self.cache.get_nearby_venues("10019", 5.0)
+        self.cache.get_menus(["a", "b"])
+        self.assertEqual(self.cache.stats()["entries"], 2)
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_coalescing(self):
+        api = CountingEatsAPI({"a": [item("1", "Lasagna")]}, latency=0.2)
+        cache = CachedEatsAPI(api)
+        threads = [threading.Thread(target=cache.get_menu, args=("a",)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(api.menu_fetches, 1)
+        self.assertEqual(cache.stats()["coalesced"], 7)
+
+    def test_changed_menu_updates_index_incrementally(self):
+        embeddings = CountingEmbeddings()
+        menu_index = MenuIndex.build(self.cache, embeddings)
+        self.cache.add_menu_listener(lambda store_id, menu: menu_index.update_venue(store_id, menu, embeddings))
+        embeddings.embedded.clear()
+
+        self.api.menus["a"] = [item("1", "Lasagna", price=12.0), item("3", "Tiramisu")]
+        self.api.versions["a"] = "v2"
+        self.clock.now = 61
+        self.cache.get_menus(["a", "b"])
+
+        self.assertEqual(len(embeddings.embedded), 2)
+        self.assertEqual(len(menu_index), 3)
+        results = menu_index.search(np.zeros(2), k=10, venue_ids=["a"])
+        self.assertEqual(sorted((result["id"], result["price"]) for result, _ in results), [("1", 12.0), ("3", 10.0)])
+        self.assertEqual(menu_index.search(np.zeros(2), k=10, max_price=10.5, venue_ids=["a"])[0][0]["id"], "3")
+
+        # saving drops the tombstoned rows and matches the fingerprint of the refetched catalog
+        with tempfile.TemporaryDirectory() as path:
+            menu_index.save(path)
+            loaded = MenuIndex.load(path, mmap=False)
+        self.assertEqual(len(loaded.items), 3)
+        self.assertEqual(loaded.fingerprint, MenuIndex.compute_fingerprint(MenuIndex.collect_items(self.api)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import pathlib
+import tempfile
+import unittest
+
+import numpy as np
+from pydantic import ValidationError
+
+from models.order import MenuItem
+from services.agent.menu_index import MenuIndex
+from services.eats.catalog_store import CatalogStore
+from services.eats.fill_api import generate_catalog, write_catalog
+
+class TestCatalogStore(unittest.TestCase):
+    def setUp(self):
+        catalog = list(generate_catalog(25, (0, 12), seed=5))
+        self.venues = [venue for venue, _ in catalog]
+        self.menus = {venue["store_id"]: menu for venue, menu in catalog}
+        self.catalog = CatalogStore.from_menus(self.venues, self.menus)
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_menus_round_trip(self):
+        self.assertEqual(len(self.catalog), sum(len(menu) for menu in self.menus.values()))
+        self.assertEqual(self.catalog.venues, self.venues)
+        for store_id, menu in self.menus.items():
+            self.assertEqual(self.catalog.menu(store_id), menu)
+        with self.assertRaises(KeyError):
+            self.catalog.menu("unknown")
+
+    def test_saved_catalog_is_memory_mapped(self):
+        path = pathlib.Path(self.directory.name) / "catalog.bin"
+        self.catalog.save(path)
+        opened = CatalogStore.open(path)
+        self.assertIsInstance(opened.arrays["prices"].base, np.memmap)
+        self.assertEqual(opened.digest, self.catalog.digest)
+        self.assertEqual(list(opened.items()), list(self.catalog.items()))
+        store_id, menu = next((store_id, menu) for store_id, menu in self.menus.items() if menu)
+        self.assertEqual(opened.menu(store_id), menu)
+
+    def test_item_views(self):
+        items = self.catalog.items()
+        item = items[3]
+        self.assertEqual(self.catalog.item(3), MenuItem(**item))
+        self.assertIn(item["venue_id"], self.menus)
+        self.assertIn({key: value for key, value in item.items() if key != "venue_id"}, self.menus[item["venue_id"]])
+        self.assertEqual(items[2:4], [items[2], items[3]])
+
+    def test_items_keep_missing_fields(self):
+        items = [{"id": "1", "title": "Lasagna", "price": 12.5, "venue_id": "a"}, {"id": "2", "category": "sushi", "ingredients": [], "venue_id": "b"}]
+        catalog = CatalogStore.from_items(items)
+        self.assertEqual(list(catalog.items()), items)
+        with self.assertRaises(ValidationError):
+            catalog.item(0)
+
+    def test_encoded_like_menu_index(self):
+        items = self.catalog.items()
+        for field in ("category", "venue_id"):
+            codes, vocabulary = items.encoded(field)
+            expected_codes, expected_vocabulary = MenuIndex._encode([item.get(field) for item in items])
+            self.assertEqual(vocabulary, expected_vocabulary)
+            np.testing.assert_array_equal(codes, expected_codes)
+
+    def test_load_or_compile(self):
+        data_dir = os.path.join(self.directory.name, "data")
+        cache_dir = pathlib.Path(self.directory.name) / "cache"
+        write_catalog(zip(self.venues, self.menus.values()), data_dir)
+        compiled = CatalogStore.load_or_compile(data_dir, cache_dir)
+        self.assertEqual(compiled.digest, self.catalog.digest)
+        self.assertEqual(len(list(cache_dir.iterdir())), 1)
+        self.assertIsInstance(CatalogStore.load_or_compile(data_dir, cache_dir).arrays["prices"].base, np.memmap)
+
+        # a rewritten catalog is compiled again
+        write_catalog(generate_catalog(3, (1, 2), seed=6), data_dir)
+        self.assertNotEqual(CatalogStore.load_or_compile(data_dir, cache_dir).digest, compiled.digest)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,17 @@
+import unittest
+
+from services.agent.chains import choice_grammar
+from services.llm_service import IntentEnum
+
+class TestChoiceGrammar(unittest.TestCase):
+    def test_grammar_allows_only_intent_labels(self):
+        grammar = choice_grammar([intent.name for intent in IntentEnum])
+        self.assertTrue(grammar.startswith("root ::= "))
+        alternatives = grammar[len("root ::= "):].strip().split(" | ")
+        self.assertEqual(alternatives, [f'"{intent.name}"' for intent in IntentEnum])
+
+    def test_choices_are_escaped(self):
+        self.assertEqual(choice_grammar(['say "hi"', "x"]), 'root ::= "say \\"hi\\"" | "x"\n')
+
+if __name__ == "__main__":
+    unittest.main()
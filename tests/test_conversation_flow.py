@@ -0,0 +1,142 @@
+import json
+import tempfile
+import unittest
+import uuid
+
+from falcon import testing
+
+from main import create_app, load_agent
+from services.agent.rephrase_cache import RephraseCache
+from services.eats.eats_api import EatsAPI
+from services.eats.fill_api import generate_catalog, write_catalog
+from services.eats.mock_eats_api import MockEatsAPI
+from services.llm_service import QuotedReply, ResponseStatus
+from stores.order_journal import OrderJournal
+
+ADDRESS = "delivery address is 321 W 54th Street, Apt 2E, New York, NY 10019"
+CC_DETAILS = {"cc_number": "1231231", "cvv": "123", "expiry": "12/23"}
+
+class NearbyOnlyEatsAPI(EatsAPI):
+    # an eats api which can't list all of its venues, only those near an address
+    def __init__(self, eats_api: EatsAPI):
+        self.eats_api = eats_api
+
+    def get_nearby_venues(self, address: str, radius: float):
+        return self.eats_api.get_nearby_venues(address, radius)
+
+    def get_menu(self, store_id: str):
+        return self.eats_api.get_menu(store_id)
+
+    def book_order(self, order_details):
+        return self.eats_api.book_order(order_details)
+
+    def check_order(self, order_id: str):
+        return self.eats_api.check_order(order_id)
+
+class TestConversationFlow(unittest.TestCase):
+    # the whole flow against the scripted LLM and hashing embeddings, over a catalog of venues which are always open
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        write_catalog(generate_catalog(40, (10, 30), seed=11, categories=["italian", "sushi"], radius_km=4.0, hours=False), cls.directory.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.eats_api = MockEatsAPI(OrderJournal(f"{self.directory.name}/orders"), data_dir=self.directory.name,
+                                    catalog_cache_dir=self.directory.name)
+        self.client = testing.TestClient(create_app(self.eats_api, backend="fake", menu_index_path=f"{self.directory.name}/menu_index"))
+        self.user_id = str(uuid.uuid4())
+
+    def tearDown(self):
+        self.eats_api.order_journal.close()
+
+    def query(self, text: str, expected: ResponseStatus) -> dict:
+        resp = self.client.simulate_post("/query", cookies={"user_id": self.user_id}, json={"input": text})
+        self.assertEqual(resp.status_code, 200)
+        response = json.loads(resp.text)
+        self.assertEqual(response["status"], expected.value, response)
+        return response
+
+    def test_order_flow(self):
+        self.query("What are some good Italian restaurants nearby?", ResponseStatus.REQUEST_ADDRESS)
+        self.query(ADDRESS, ResponseStatus.REQUEST_BUDGET)
+        response = self.query("limit the order under 20$", ResponseStatus.REQUEST_PAYMENT_DETAILS)
+
+        order = response["order"]
+        self.assertEqual(len(order["items"]), 1)
+        self.assertLessEqual(order["total_price"], 20)
+        self.assertEqual(order["items"][0]["category"], "italian")
+
+        resp = self.client.simulate_post("/order", cookies={"user_id": self.user_id}, json={"order": order, "cc_details": CC_DETAILS})
+        self.assertEqual(resp.status_code, 200)
+
+    def test_ingredient_preference(self):
+        self.query("something with calamari", ResponseStatus.REQUEST_ADDRESS)
+        self.query(ADDRESS, ResponseStatus.REQUEST_BUDGET)
+        response = self.query("My budget is 30 dollars", ResponseStatus.REQUEST_PAYMENT_DETAILS)
+        self.assertIn("calamari", response["order"]["items"][0]["ingredients"])
+
+    def test_llm_fallback_in_both_intent_modes(self):
+        # too ambiguous for the fast path, so intent detection falls back to the scripted model
+        for intent_mode in ("embedding", "label"):
+            with self.subTest(intent_mode=intent_mode):
+                self.client = testing.TestClient(create_app(self.eats_api, intent_mode=intent_mode, backend="fake",
+                                                            menu_index_path=f"{self.directory.name}/menu_index"))
+                self.query("bring me food at 40 Wall Street for 20", ResponseStatus.REQUEST_PREFERENCE)
+                text = self.client.simulate_get("/metrics").text
+                self.assertIn("llama_eats_intent_path_fallback 1", text)
+                self.assertIn('stage="intent_llm"', text)
+
+    def test_eats_api_without_venue_list(self):
+        # the index starts empty and the menus of nearby venues are indexed as they're found
+        self.client = testing.TestClient(create_app(NearbyOnlyEatsAPI(self.eats_api), backend="fake",
+                                                    menu_index_path=f"{self.directory.name}/nearby_menu_index"))
+        self.query("What are some good Italian restaurants nearby?", ResponseStatus.REQUEST_ADDRESS)
+        self.query(ADDRESS, ResponseStatus.REQUEST_BUDGET)
+        response = self.query("limit the order under 20$", ResponseStatus.REQUEST_PAYMENT_DETAILS)
+        self.assertLessEqual(response["order"]["total_price"], 20)
+
+    def test_streamed_reply_is_the_response(self):
+        agent = load_agent(self.eats_api, backend="fake", menu_index_path=f"{self.directory.name}/menu_index")
+        # without warmed pools every reply is rephrased while the turn streams
+        agent.rephrase_cache = RephraseCache(agent._rephrase)
+        for text in ("What are some good Italian restaurants nearby?", ADDRESS, "limit the order under 20$"):
+            events = []
+            response = agent.handle_input(self.user_id, text, lambda event, data: events.append((event, data)))
+            tokens = [data["text"] for event, data in events if event == "token"]
+            self.assertGreater(len(tokens), 1)
+            self.assertEqual("".join(tokens), response.response)
+            self.assertNotIn('"', response.response)
+        self.assertEqual(response.status, ResponseStatus.REQUEST_PAYMENT_DETAILS)
+        self.assertEqual(agent.rephrase_cache.stats()["hits"], 0)
+
+class TestQuotedReply(unittest.TestCase):
+    def stream(self, tokens):
+        emitted = []
+        reply = QuotedReply(emitted.append)
+        for token in tokens:
+            reply.feed(token)
+            if reply.closed:
+                break
+        self.assertEqual("".join(emitted), reply.text)
+        return reply
+
+    def test_preamble_and_trailing_text_dropped(self):
+        reply = self.stream(["Here's", " the rephrased response ->", ' "', " I'll", " order it", ' for you."', " Hope", " it helps!"])
+        self.assertEqual(reply.text, "I'll order it for you.")
+        self.assertTrue(reply.closed)
+
+    def test_apostrophes_inside_single_quotes(self):
+        reply = self.stream(["Sure: '", "We'll", " find you", " a dish!'", " more"])
+        self.assertEqual(reply.text, "We'll find you a dish!")
+
+    def test_unquoted_output_streams_nothing(self):
+        reply = self.stream(["Please", " share your budget."])
+        self.assertEqual(reply.text, "")
+        self.assertFalse(reply.closed)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import json
+import pathlib
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from services.eats import fill_api
+from services.eats.fill_api import generate_catalog, write_catalog
+from services.eats.geo import haversine_km
+from services.eats.mock_eats_api import MockEatsAPI
+from services.eats.open_hours import OpenHoursIndex
+from stores.order_journal import OrderJournal
+
+class TestCatalogGenerator(unittest.TestCase):
+    def test_seeded(self):
+        first = list(generate_catalog(20, (1, 10), seed=7))
+        self.assertEqual(first, list(generate_catalog(20, (1, 10), seed=7)))
+        self.assertNotEqual(first, list(generate_catalog(20, (1, 10), seed=8)))
+
+    def test_menus(self):
+        for venue, menu in generate_catalog(50, (5, 80), seed=1, categories=["pizza", "sushi"], radius_km=3.0):
+            self.assertTrue(5 <= len(menu) <= 80)
+            self.assertEqual(len({item["id"] for item in menu}), len(menu))
+            self.assertTrue(set(item["category"] for item in menu) <= set(venue["category_ids"]) <= {"pizza", "sushi"})
+            location = venue["location"]
+            self.assertLessEqual(haversine_km((40.7655, -73.9870), (location["lat"], location["lon"])), 3.01)
+            self.assertIn("service_availability", venue)
+
+    def test_script_and_module_entry_points(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # from outside the repository, as a script by path and as a module from the root
+            root = pathlib.Path(fill_api.__file__).parents[2]
+            for command, cwd in (([sys.executable, fill_api.__file__], directory), ([sys.executable, "-m", "services.eats.fill_api"], root)):
+                output = pathlib.Path(directory, str(len(command)))
+                subprocess.run(command + ["--venues", "2", "--output", str(output), "--compile"], cwd=cwd, capture_output=True, check=True)
+                self.assertEqual(len(json.loads((output / "venues.json").read_text())), 2)
+                self.assertTrue((output / "catalog.bin").exists())
+
+    def test_written_catalog_serves_mock_api(self):
+        with tempfile.TemporaryDirectory() as directory:
+            num_venues, num_items = write_catalog(generate_catalog(30, (2, 20), seed=3), directory)
+            with open(f"{directory}/menus.json") as f:
+                self.assertEqual(sum(len(menu) for menu in json.load(f).values()), num_items)
+
+            eats_api = MockEatsAPI(OrderJournal(f"{directory}/orders"), data_dir=directory, catalog_cache_dir=directory)
+            self.assertEqual(len(eats_api.get_venues()), num_venues)
+            # overnight and split periods are understood by the open hours index
+            OpenHoursIndex(eats_api.get_venues())
+            self.assertTrue(eats_api.get_nearby_venues("321 W 54th Street, New York, NY 10019", 5.0))
+            eats_api.order_journal.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+# test_geo.py
+import json
+import random
+import unittest
+from services.eats.fill_api import CENTER
+from services.eats.geo import Gazetteer, GeoIndex, VenueLocator, haversine_km
+
+class TestGeo(unittest.TestCase):
+    def setUp(self):
+        self.gazetteer = Gazetteer(
+            postcodes={"10019": (40.7655, -73.9870), "11201": (40.6940, -73.9903)},
+            places={"new york": (40.7128, -74.0060), "city1": (40.7583, -73.9870), "city10": (40.6240, -74.0200)},
+        )
+
+    def test_resolve(self):
+        self.assertEqual(self.gazetteer.resolve("321 W 54th Street, Apt 2E, New York, NY 10019"), (40.7655, -73.9870))
+        self.assertEqual(self.gazetteer.resolve("somewhere in New York"), (40.7128, -74.0060))
+        self.assertEqual(self.gazetteer.resolve("924 Main St., City10"), (40.6240, -74.0200))
+        self.assertIsNone(self.gazetteer.resolve("221B Baker Street, London"))
+
+    def test_mock_cities_match_venue_proximity(self):
+        # the mock venues' proximity is their distance from the center, their cities lie within the range of it
+        gazetteer = Gazetteer.load()
+        with open("data/venues.json") as f:
+            venues = json.load(f)
+        cities = {gazetteer.resolve(venue["address"]) for venue in venues}
+        self.assertEqual(len(cities), 10)
+        for venue in venues:
+            city = venue["address"].rsplit(", ", 1)[-1].lower()
+            proximities = [other["proximity"] for other in venues if other["address"].lower().endswith(city)]
+            self.assertTrue(min(proximities) <= haversine_km(CENTER, gazetteer.places[city]) <= max(proximities))
+
+    def test_query_matches_brute_force(self):
+        rng = random.Random(7)
+        points = [(40.7 + rng.uniform(-0.3, 0.3), -74.0 + rng.uniform(-0.3, 0.3)) for _ in range(2000)]
+        index = GeoIndex(cell_km=0.7)
+        for i, point in enumerate(points):
+            index.add(i, point)
+
+        center = (40.7655, -73.9870)
+        results = index.query(center, 5.0)
+        expected = sorted(i for i, point in enumerate(points) if haversine_km(center, point) <= 5.0)
+        self.assertEqual(sorted(i for i, _ in results), expected)
+        distances = [distance for _, distance in results]
+        self.assertEqual(distances, sorted(distances))
+
+    def test_venue_locator(self):
+        venues = [
+            {"store_id": "near", "address": "154 Main St., City1"},
+            {"store_id": "far", "address": "907 Main St., City10"},
+            {"store_id": "located", "address": "unknown", "location": {"lat": 40.7660, "lon": -73.9880}},
+        ]
+        locator = VenueLocator(venues, self.gazetteer)
+        nearby = locator.nearby("321 W 54th Street, New York, NY 10019", 5.0)
+        self.assertEqual([venue["store_id"] for venue in nearby], ["located", "near"])
+        self.assertAlmostEqual(nearby[1]["proximity"], 0.8, places=1)
+        self.assertNotIn("proximity", venues[0])
+        self.assertIsNone(locator.nearby("221B Baker Street, London", 5.0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+# test_http_eats_api.py
+import time
+import unittest
+from models.order import CCDetails, MenuItem, Order, OrderDetails
+from services.eats.async_eats_api import BlockingEatsAPI
+from services.eats.http_eats_api import HttpEatsAPI
+from tests.fake_eats_server import FakeEatsServer
+
+VENUES = [{"store_id": f"store{i}", "name": f"Venue {i}", "address": f"{i} Main St., City1"} for i in range(20)]
+MENUS = {venue["store_id"]: [{"id": f"{venue['store_id']}-item", "title": "Pizza", "subtitle": "", "ingredients": ["basil"], "price": 10.0, "category": "pizza"}] for venue in VENUES}
+
+class TestHttpEatsAPI(unittest.IsolatedAsyncioTestCase):
+    async def test_bounded_concurrent_fan_out(self):
+        with FakeEatsServer(VENUES, MENUS, latency=0.05) as server:
+            api = HttpEatsAPI(server.url)
+            start = time.perf_counter()
+            result = await api.fan_out_menus([venue["store_id"] for venue in VENUES], concurrency=5)
+            elapsed = time.perf_counter() - start
+            await api.aclose()
+
+        self.assertEqual(len(result.menus), 20)
+        self.assertEqual(result.failed, {})
+        self.assertLessEqual(server.max_in_flight, 5)
+        # 4 waves of 5 requests, well below 20 sequential round trips
+        self.assertLess(elapsed, 20 * 0.05)
+        # keep-alive connections are reused across the waves
+        self.assertLessEqual(len(server.connections), 5)
+
+    async def test_partial_results(self):
+        with FakeEatsServer(VENUES, MENUS, slow=["store1"], failing=["store2"], slow_latency=1.0) as server:
+            api = HttpEatsAPI(server.url)
+            result = await api.fan_out_menus(["store0", "store1", "store2", "missing"], timeout=0.3)
+            await api.aclose()
+
+        self.assertEqual(list(result.menus), ["store0"])
+        self.assertIn("timed out", result.failed["store1"])
+        self.assertEqual(sorted(result.failed), ["missing", "store1", "store2"])
+
+    async def test_orders(self):
+        with FakeEatsServer(VENUES, MENUS) as server:
+            api = HttpEatsAPI(server.url)
+            item = MenuItem(venue_id="store0", **MENUS["store0"][0])
+            order = Order(order_details=OrderDetails(items=[item], address="1 Main St., City1", total_price=10.0),
+                          payment_details=CCDetails(cc_number="1231231", cvv="123", expiry="12/23"))
+            order_id = await api.book_order(order)
+            self.assertEqual((await api.check_order(order_id))["status"], "accepted")
+            self.assertEqual(await api.check_order("unknown"), {"status": "not found"})
+            await api.aclose()
+
+class TestBlockingEatsAPI(unittest.TestCase):
+    def test_get_menus(self):
+        with FakeEatsServer(VENUES, MENUS, failing=["store3"]) as server:
+            api = BlockingEatsAPI(HttpEatsAPI(server.url), concurrency=4)
+            self.assertEqual(len(api.get_venues()), 20)
+            menus = api.get_menus([venue["store_id"] for venue in VENUES])
+            self.assertEqual(api.get_menu("store0"), MENUS["store0"])
+            api.close()
+
+        self.assertEqual(len(menus), 19)
+        self.assertNotIn("store3", menus)
+
+if __name__ == '__main__':
+    unittest.main()
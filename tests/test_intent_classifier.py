@@ -0,0 +1,102 @@
+# test_intent_classifier.py
+import unittest
+from enum import Enum
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from services.agent.intent_classifier import IntentClassifier
+
+class Intent(Enum):
+    ADDRESS = "address"
+    BUDGET = "budget"
+    QUESTION = "question"
+
+class FixedEmbeddings(Embeddings):
+    # hand-made vectors, so the similarities and margins are known
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+def margin_of(vector):
+    # cosine similarities to the unit axes of the first two intents
+    vector = np.asarray(vector, dtype=np.float32)
+    similarities = vector / np.linalg.norm(vector)
+    return float(similarities[0] - similarities[1])
+
+class TestIntentClassifier(unittest.TestCase):
+    def setUp(self):
+        self.embeddings = FixedEmbeddings({
+            "my address is": [1.0, 0.0, 0.0],
+            "deliver to": [0.8, 0.0, 0.6],
+            "my budget is": [0.0, 1.0, 0.0],
+            "what's the weather": [0.0, 0.0, 1.0],
+            "321 w 54th street": [1.0, 0.1, 0.0],
+            "54th street for 20": [1.0, 0.9, 0.0],
+            "around 20 near 54th": [1.0, 0.8, 0.0],
+            "deliver it": [0.8, 0.1, 0.6],
+            "ADDRESS, SCALED": [10.0, 1.0, 0.0],
+        })
+        examples = {
+            Intent.ADDRESS: ["my address is", "deliver to"],
+            Intent.BUDGET: ["my budget is"],
+            Intent.QUESTION: ["what's the weather"],
+        }
+        self.classifier = IntentClassifier(self.embeddings, examples, threshold=0.1)
+
+    def test_intent_scores_as_its_nearest_example(self):
+        scores = self.classifier.score("deliver it")
+        self.assertEqual([intent for intent, _ in scores], [Intent.ADDRESS, Intent.QUESTION, Intent.BUDGET])
+        # "deliver to" is nearer than "my address is"
+        self.assertAlmostEqual(scores[0][1], 1.0 / np.linalg.norm([0.8, 0.1, 0.6]), places=5)
+        # vectors are normalized, the query's length doesn't matter
+        self.assertEqual(self.classifier.classify("ADDRESS, SCALED")[0], Intent.ADDRESS)
+        self.assertAlmostEqual(self.classifier.classify("ADDRESS, SCALED")[1], self.classifier.classify("321 w 54th street")[1], places=5)
+
+    def test_margin_between_top_two(self):
+        intent, margin = self.classifier.classify("54th street for 20")
+        self.assertEqual(intent, Intent.ADDRESS)
+        self.assertAlmostEqual(margin, margin_of([1.0, 0.9, 0.0]), places=5)
+
+    def test_confident_margin_takes_fast_path(self):
+        self.assertGreater(margin_of([1.0, 0.1, 0.0]), 0.1)
+        self.assertEqual(self.classifier.predict("321 w 54th street"), Intent.ADDRESS)
+
+    def test_close_top_two_fall_back(self):
+        # the nearest intent is right, but the runner-up is too close to trust it
+        self.assertLess(margin_of([1.0, 0.9, 0.0]), 0.1)
+        self.assertIsNone(self.classifier.predict("54th street for 20"))
+
+    def test_threshold_on_both_sides(self):
+        margin = self.classifier.classify("around 20 near 54th")[1]
+        self.classifier.threshold = margin - 1e-3
+        self.assertEqual(self.classifier.predict("around 20 near 54th"), Intent.ADDRESS)
+        self.classifier.threshold = margin + 1e-3
+        self.assertIsNone(self.classifier.predict("around 20 near 54th"))
+
+    def test_single_intent_margin_is_its_score(self):
+        classifier = IntentClassifier(self.embeddings, {Intent.BUDGET: ["my budget is"]}, threshold=0.5)
+        intent, margin = classifier.classify("54th street for 20")
+        self.assertEqual(intent, Intent.BUDGET)
+        self.assertAlmostEqual(margin, 0.9 / np.linalg.norm([1.0, 0.9]), places=5)
+        self.assertEqual(classifier.predict("54th street for 20"), Intent.BUDGET)
+
+    def test_counters(self):
+        self.assertEqual(self.classifier.stats(), {"fast": 0, "fallback": 0})
+        self.classifier.predict("321 w 54th street")
+        self.classifier.predict("54th street for 20")
+        self.classifier.predict("deliver it")
+        # classify and score don't count, only the decisions of predict
+        self.classifier.classify("54th street for 20")
+        self.assertEqual(self.classifier.stats(), {"fast": 2, "fallback": 1})
+        # a copy, callers can't change the counters
+        self.classifier.stats()["fast"] = 10
+        self.assertEqual(self.classifier.stats()["fast"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+# test_lexical_index.py
+import tempfile
+import unittest
+import numpy as np
+from services.agent.lexical_index import LexicalIndex, parse_preferences, tokenize
+from services.agent.menu_index import MenuIndex
+
+ITEMS = [
+    {"id": "1", "venue_id": "a", "title": "Pulled Pork Sandwich", "subtitle": "Smoky and tender.", "ingredients": ["pulled pork", "coleslaw", "brioche bun"], "price": 11.0, "category": "burger"},
+    {"id": "2", "venue_id": "a", "title": "Margherita Pizza", "subtitle": "Classic.", "ingredients": ["basil", "mozzarella cheese", "tomato sauce"], "price": 12.0, "category": "pizza"},
+    {"id": "3", "venue_id": "b", "title": "Pesto Pasta", "subtitle": "Fresh basil pesto.", "ingredients": ["basil", "pine nuts", "garlic", "parmesan cheese"], "price": 14.0, "category": "italian"},
+    {"id": "4", "venue_id": "b", "title": "Fried Calamari", "subtitle": "Crispy rings.", "ingredients": ["calamari", "lemon", "garlic"], "price": 9.0, "category": "italian"},
+    {"id": "5", "venue_id": "b", "title": "Mushroom Risotto", "subtitle": "Creamy.", "ingredients": ["arborio rice", "mushrooms", "parmesan cheese"], "price": 15.0, "category": "italian"},
+]
+
+class TestLexicalIndex(unittest.TestCase):
+    def setUp(self):
+        self.lexical_index = LexicalIndex.from_items(ITEMS)
+
+    def test_parse_preferences(self):
+        self.assertEqual(parse_preferences("no pork, lots of basil"), ("lots of basil", ["pork"]))
+        self.assertEqual(parse_preferences("pasta without garlic and extra cheese"), ("pasta extra cheese", ["garlic"]))
+        self.assertEqual(parse_preferences("something gluten-free"), ("something", ["gluten"]))
+        self.assertEqual(parse_preferences("something with calamari"), ("something with calamari", []))
+
+    def test_tokenize_folds_plurals(self):
+        self.assertEqual(tokenize("Mushrooms and Tomatoes"), ["mushroom", "tomato"])
+
+    def test_bm25_ranking(self):
+        scores = self.lexical_index.scores("basil pesto")
+        self.assertEqual(int(np.argmax(scores)), 2)
+        self.assertEqual(scores[0], 0)
+        self.assertGreater(self.lexical_index.scores("mushroom")[4], 0)
+
+    def test_matching_excluded_phrases(self):
+        self.assertEqual(np.flatnonzero(self.lexical_index.matching(["pork"])).tolist(), [0])
+        self.assertEqual(np.flatnonzero(self.lexical_index.matching(["garlic", "pulled pork"])).tolist(), [0, 2, 3])
+
+    def test_append(self):
+        base = LexicalIndex.from_items(ITEMS[:3])
+        appended = base.append(ITEMS[3:])
+        self.assertEqual(appended.size, len(ITEMS))
+        self.assertEqual(int(np.argmax(appended.scores("mushroom"))), 4)
+        self.assertEqual(np.flatnonzero(appended.matching(["garlic"])).tolist(), np.flatnonzero(self.lexical_index.matching(["garlic"])).tolist())
+        # the index appended to still answers for its own rows only
+        self.assertEqual(len(base.scores("garlic")), 3)
+        self.assertEqual(np.flatnonzero(base.matching(["garlic"])).tolist(), [2])
+
+    def test_hybrid_search(self):
+        # vectors carry no signal, so the lexical scores decide
+        menu_index = MenuIndex(np.ones((len(ITEMS), 4), dtype=np.float32), ITEMS, MenuIndex.compute_fingerprint(ITEMS))
+        query, excluded = parse_preferences("no garlic, lots of basil")
+        results = menu_index.hybrid_search(np.ones(4), query, k=3, excluded=excluded)
+        self.assertEqual([item["id"] for item, _ in results][:1], ["2"])
+        self.assertNotIn("3", [item["id"] for item, _ in results])
+        self.assertEqual([score for _, score in results], sorted((score for _, score in results), reverse=True))
+
+        with tempfile.TemporaryDirectory() as path:
+            menu_index.save(path)
+            loaded = MenuIndex.load(path)
+            self.assertEqual(loaded.hybrid_search(np.ones(4), "calamari", k=1)[0][0]["id"], "4")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+# test_menu_index.py
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from services.agent.fake_backends import HashingEmbeddings
+from services.agent.lexical_index import LexicalIndex
+from services.agent.menu_index import AppendedItems, MenuIndex
+from services.eats.eats_api import EatsAPI
+
+class MenusEatsAPI(EatsAPI):
+    def __init__(self, menus):
+        self.menus = menus
+
+    def get_venues(self):
+        return [{"store_id": store_id} for store_id in self.menus]
+
+    def get_nearby_venues(self, address, radius):
+        return self.get_venues()
+
+    def get_menu(self, store_id):
+        return self.menus[store_id]
+
+    def book_order(self, order_details):
+        raise NotImplementedError
+
+    def check_order(self, order_id):
+        raise NotImplementedError
+
+class CountingEmbeddings(HashingEmbeddings):
+    def __init__(self):
+        super().__init__(dimensions=8)
+        self.documents = 0
+
+    def embed_documents(self, texts):
+        self.documents += len(texts)
+        return super().embed_documents(texts)
+
+class TestMenuIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.items = [{"id": str(i), "title": f"dish {i}", "price": 5.0 + i, "category": ["pizza", "italian", "sushi"][i % 3], "venue_id": f"venue{i % 4}"} for i in range(60)]
+        self.vectors = rng.rand(len(self.items), 8).astype(np.float32)
+        self.menu_index = MenuIndex(self.vectors, self.items, MenuIndex.compute_fingerprint(self.items))
+        # the expensive items are the closest to the query
+        self.query = self.vectors[-1]
+
+    def brute_force(self, k, predicate):
+        eligible = [i for i, item in enumerate(self.items) if predicate(item)]
+        distances = {i: float(((self.vectors[i] - self.query) ** 2).sum()) for i in eligible}
+        return sorted(eligible, key=distances.get)[:k]
+
+    def test_top_k_among_eligible_items(self):
+        results = self.menu_index.search(self.query, k=5, max_price=12, venue_ids=["venue1", "venue2"], categories=["italian", "sushi"])
+        expected = self.brute_force(5, lambda item: item["price"] <= 12 and item["venue_id"] in ("venue1", "venue2") and item["category"] in ("italian", "sushi"))
+        self.assertEqual([int(item["id"]) for item, _ in results], expected)
+        scores = [score for _, score in results]
+        self.assertEqual(scores, sorted(scores))
+
+    def test_tight_budget_still_finds_cheap_items(self):
+        results = self.menu_index.search(self.query, k=5, max_price=6)
+        self.assertEqual([item["id"] for item, _ in results], ["0", "1"])
+        self.assertEqual(self.menu_index.search(self.query, max_price=4), [])
+        self.assertEqual(self.menu_index.search(self.query, categories=["burger"]), [])
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as path:
+            self.menu_index.save(path)
+            loaded = MenuIndex.load(path)
+        self.assertEqual(loaded.fingerprint, self.menu_index.fingerprint)
+        self.assertEqual(loaded.search(self.query, k=3, categories=["pizza"]), self.menu_index.search(self.query, k=3, categories=["pizza"]))
+
+    def test_save_replaces_memory_mapped_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "menu_index")
+            self.menu_index.save(path)
+            previous = MenuIndex.load(path)
+            expected = previous.search(self.query, k=3)
+            items = [{**item, "title": f"meal {item['id']}"} for item in self.items[:30]]
+            MenuIndex(self.vectors[:30] * 2, items, MenuIndex.compute_fingerprint(items)).save(path)
+
+            # the old files were replaced rather than overwritten, so the index still mapping them reads them unchanged
+            self.assertEqual(previous.search(self.query, k=3), expected)
+            loaded = MenuIndex.load(path)
+            self.assertEqual(len(loaded.items), 30)
+            self.assertEqual(loaded.fingerprint, MenuIndex.compute_fingerprint(items))
+            self.assertEqual(os.listdir(directory), ["menu_index"])
+
+    def test_failed_save_keeps_previous_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "menu_index")
+            self.menu_index.save(path)
+            items = self.items[:30]
+            with mock.patch.object(LexicalIndex, "save", side_effect=OSError("disk full")):
+                with self.assertRaises(OSError):
+                    MenuIndex(self.vectors[:30], items, MenuIndex.compute_fingerprint(items)).save(path)
+            loaded = MenuIndex.load(path)
+            self.assertEqual(loaded.fingerprint, self.menu_index.fingerprint)
+            self.assertEqual(loaded.search(self.query, k=60), self.menu_index.search(self.query, k=60))
+            self.assertEqual(os.listdir(directory), ["menu_index"])
+
+    def test_load_or_build_rebuilds_stale_index(self):
+        menus = {"venue0": [{"id": "1", "title": "margherita pizza", "price": 9.0, "category": "pizza"}],
+                 "venue1": [{"id": "2", "title": "salmon nigiri", "price": 12.0, "category": "sushi"}]}
+        embeddings = CountingEmbeddings()
+        with tempfile.TemporaryDirectory() as path:
+            built = MenuIndex.load_or_build(MenusEatsAPI(menus), embeddings, path)
+            self.assertEqual(embeddings.documents, 2)
+            # the same catalog loads the saved index without embedding it again
+            loaded = MenuIndex.load_or_build(MenusEatsAPI(menus), embeddings, path)
+            self.assertEqual(embeddings.documents, 2)
+            self.assertEqual(loaded.fingerprint, built.fingerprint)
+
+            menus["venue1"].append({"id": "3", "title": "truffle risotto", "price": 15.0, "category": "italian"})
+            rebuilt = MenuIndex.load_or_build(MenusEatsAPI(menus), embeddings, path)
+            self.assertEqual(embeddings.documents, 5)
+            self.assertNotEqual(rebuilt.fingerprint, built.fingerprint)
+            # the index that was loaded before the rebuild replaced its files still reads its own items
+            self.assertEqual(sorted(item["id"] for item in loaded.items), ["1", "2"])
+            reloaded = MenuIndex.load(path)
+            self.assertEqual(reloaded.fingerprint, rebuilt.fingerprint)
+            self.assertEqual(reloaded.hybrid_search(np.zeros(8), "truffle", k=1)[0][0]["id"], "3")
+
+    def test_update_venue_appends(self):
+        embeddings = HashingEmbeddings(dimensions=8)
+        previous = self.menu_index._columns
+        menu = [item for item in self.items if item["venue_id"] == "venue1"]
+        changed = [{**menu[0], "title": "truffle risotto"}] + [{key: value for key, value in item.items() if key != "venue_id"} for item in menu[2:]]
+        self.assertEqual(self.menu_index.update_venue("venue1", changed, embeddings), (1, 2))
+        self.assertEqual(self.menu_index.update_venue("venue9", [{"id": "x", "title": "truffle fries", "price": 4.0, "category": "burger"}], embeddings), (1, 0))
+        self.assertEqual(self.menu_index.update_venue("venue9", [{"id": "x", "title": "truffle fries", "price": 4.0, "category": "burger"}], embeddings), (0, 0))
+
+        # the items are appended to a view of the original ones, which an earlier snapshot still reads unchanged
+        self.assertIsInstance(self.menu_index.items, AppendedItems)
+        self.assertIs(self.menu_index.items.base, self.items)
+        self.assertEqual(len(previous.items), 60)
+        self.assertEqual(len(self.menu_index), 60)
+        results = self.menu_index.hybrid_search(np.zeros(8), "truffle", k=3)
+        self.assertEqual(sorted(item["title"] for item, _ in results[:2]), ["truffle fries", "truffle risotto"])
+        self.assertEqual(self.menu_index.search(self.query, k=1, categories=["burger"])[0][0]["id"], "x")
+        self.assertNotIn(menu[1]["id"], [item["id"] for item, _ in self.menu_index.search(self.query, k=60, venue_ids=["venue1"])])
+
+        with tempfile.TemporaryDirectory() as path:
+            self.menu_index.save(path)
+            loaded = MenuIndex.load(path)
+        self.assertEqual(len(loaded.items), 60)
+        # saving rebuilds the BM25 statistics the appended rows approximated, the ranking stays
+        self.assertEqual([item for item, _ in loaded.hybrid_search(np.zeros(8), "truffle", k=2)], [item for item, _ in results[:2]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+# test_metrics.py
+import threading
+import unittest
+from services.metrics import Metrics
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics(window=100)
+
+    def test_quantiles(self):
+        for i in range(1, 101):
+            self.metrics.observe("index_search", i / 100)
+        histogram = self.metrics.histogram("index_search")
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.quantiles(), [0.51, 0.96, 1.0])
+
+    def test_turn_stages_labelled_with_intent(self):
+        with self.metrics.turn(intent="unknown") as turn:
+            with self.metrics.timer("intent_fast_path") as stage:
+                pass
+            turn.set_labels(intent="PROVIDE_BUDGET")
+            with self.metrics.timer("math_chain"):
+                pass
+        self.assertGreaterEqual(stage.seconds, 0)
+
+        self.assertEqual(self.metrics.histogram("intent_fast_path", intent="PROVIDE_BUDGET").count, 1)
+        self.assertEqual(self.metrics.histogram("math_chain", intent="PROVIDE_BUDGET").count, 1)
+        self.assertEqual(self.metrics.histogram("turn", intent="PROVIDE_BUDGET").count, 1)
+        self.assertEqual(self.metrics.histogram("math_chain", intent="unknown").count, 0)
+
+    def test_worker_threads_record_into_turn(self):
+        with self.metrics.turn(intent="PROVIDE_ADDRESS") as turn:
+            def work():
+                with self.metrics.attach(turn), self.metrics.timer("menu_search"):
+                    pass
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+        self.assertEqual(self.metrics.histogram("menu_search", intent="PROVIDE_ADDRESS").count, 1)
+
+    def test_render(self):
+        self.metrics.observe("book_order", 0.25)
+        self.metrics.register_collector("rephrase_cache", lambda: {"hits": 3})
+        self.metrics.register_collector("model", lambda: [("load_seconds", {"model": "llama-2-7b.Q6_K.gguf"}, 4.5)])
+
+        text = self.metrics.render()
+        self.assertIn('llama_eats_stage_seconds{stage="book_order",quantile="0.5"} 0.250000', text)
+        self.assertIn('llama_eats_stage_seconds_count{stage="book_order"} 1', text)
+        self.assertIn('llama_eats_rephrase_cache_hits 3', text)
+        self.assertIn('llama_eats_model_load_seconds{model="llama-2-7b.Q6_K.gguf"} 4.5', text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# test_model_registry.py
+import threading
+import time
+import unittest
+from unittest import mock
+
+from langchain_community.llms import LlamaCpp
+from langchain_core.outputs import GenerationChunk
+
+from services.agent.model_registry import ModelRegistry, SharedLlamaCpp
+
+def unloaded_model(model_path: str) -> SharedLlamaCpp:
+    # skips loading a GGUF file, generation is patched in by the tests
+    return SharedLlamaCpp.model_construct(model_path=model_path, client=None)
+
+class CountingLoader:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.loads = []
+        self._lock = threading.Lock()
+
+    def __call__(self, model_path: str, **kwargs) -> SharedLlamaCpp:
+        with self._lock:
+            self.loads.append(model_path)
+        time.sleep(self.seconds)
+        return unloaded_model(model_path)
+
+class TestModelRegistry(unittest.TestCase):
+    def test_concurrent_callers_load_once(self):
+        loader = CountingLoader(0.05)
+        registry = ModelRegistry(loader)
+        models = []
+        callers = [threading.Thread(target=lambda path=path: models.append(registry.get_llm(path))) for path in ["a.gguf", "b.gguf"] * 8]
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join()
+
+        self.assertEqual(sorted(loader.loads), ["a.gguf", "b.gguf"])
+        self.assertEqual(len({id(model) for model in models}), 2)
+        self.assertIn(registry.get_llm("a.gguf"), models)
+        self.assertEqual(len(loader.loads), 2)
+        self.assertTrue(registry.is_loaded("b.gguf"))
+        self.assertEqual(sorted(stats.model_path for stats in registry.stats()), ["a.gguf", "b.gguf"])
+
+class TestSharedLlamaCpp(unittest.TestCase):
+    def setUp(self):
+        self.model = unloaded_model("model.gguf")
+
+    def test_chunks_streamed_as_generated(self):
+        received = threading.Event()
+        waited = []
+
+        def generate(self, prompt, stop=None, run_manager=None, **kwargs):
+            yield GenerationChunk(text="first")
+            # the consumer gets the first chunk while the generation is still running
+            waited.append(received.wait(5))
+            yield GenerationChunk(text=" second")
+
+        with mock.patch.object(LlamaCpp, "_stream", generate):
+            stream = self.model._stream("prompt")
+            self.assertEqual(next(stream).text, "first")
+            received.set()
+            self.assertEqual([chunk.text for chunk in stream], [" second"])
+        self.assertEqual(waited, [True])
+
+    def test_closed_stream_releases_lock(self):
+        generated = []
+
+        def generate(self, prompt, stop=None, run_manager=None, **kwargs):
+            for i in range(100):
+                time.sleep(0.01)
+                generated.append(i)
+                yield GenerationChunk(text=str(i))
+
+        with mock.patch.object(LlamaCpp, "_stream", generate):
+            stream = self.model._stream("prompt")
+            next(stream)
+            stream.close()
+            acquired = []
+            other = threading.Thread(target=lambda: acquired.append(self.model.lock.acquire(timeout=5)) or self.model.lock.release())
+            other.start()
+            other.join()
+        self.assertEqual(acquired, [True])
+        self.assertLess(len(generated), 100)
+
+    def test_generation_errors_raised_to_consumer(self):
+        def generate(self, prompt, stop=None, run_manager=None, **kwargs):
+            yield GenerationChunk(text="first")
+            raise RuntimeError("decode failed")
+
+        with mock.patch.object(LlamaCpp, "_stream", generate):
+            stream = self.model._stream("prompt")
+            self.assertEqual(next(stream).text, "first")
+            with self.assertRaises(RuntimeError):
+                next(stream)
+        self.assertTrue(self.model.lock.acquire(timeout=5))
+        self.model.lock.release()
+
+if __name__ == '__main__':
+    unittest.main()
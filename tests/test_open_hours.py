@@ -0,0 +1,65 @@
+# test_open_hours.py
+import unittest
+from datetime import datetime, timezone
+from services.eats.open_hours import OpenHoursIndex
+
+def venue(store_id, *periods, **fields):
+    availability = {}
+    for day, start, end in periods:
+        availability.setdefault(day, []).append({"start_time": start, "end_time": end})
+    return {"store_id": store_id, "service_availability": [{"day_of_week": day, "time_periods": times} for day, times in availability.items()], **fields}
+
+# 2024-01-01 is a monday
+MONDAY = datetime(2024, 1, 1)
+
+class TestOpenHoursIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = OpenHoursIndex([
+            venue("lunch", ("monday", "11:00", "14:00"), ("tuesday", "11:00", "14:00")),
+            venue("late", ("friday", "18:00", "02:00")),
+            venue("weekend", ("sunday", "20:00", "01:30")),
+            {"store_id": "unknown"},
+        ])
+
+    def test_is_open(self):
+        self.assertTrue(self.index.is_open("lunch", MONDAY.replace(hour=11)))
+        self.assertTrue(self.index.is_open("lunch", MONDAY.replace(hour=13, minute=59)))
+        self.assertFalse(self.index.is_open("lunch", MONDAY.replace(hour=14)))
+        self.assertFalse(self.index.is_open("lunch", datetime(2024, 1, 3, 12)))
+
+    def test_overnight_periods(self):
+        self.assertTrue(self.index.is_open("late", datetime(2024, 1, 6, 1, 30)))
+        self.assertFalse(self.index.is_open("late", datetime(2024, 1, 6, 2, 0)))
+        # sunday night wraps into monday morning
+        self.assertTrue(self.index.is_open("weekend", MONDAY.replace(hour=1)))
+        self.assertFalse(self.index.is_open("weekend", MONDAY.replace(hour=2)))
+
+    def test_open_store_ids(self):
+        self.assertEqual(self.index.open_store_ids(MONDAY.replace(hour=12)), ["lunch", "unknown"])
+        self.assertEqual(self.index.open_store_ids(MONDAY.replace(hour=1), ["lunch", "weekend", "not indexed"]), ["weekend", "not indexed"])
+
+    def test_venue_timezones(self):
+        index = OpenHoursIndex([
+            venue("new york", ("monday", "11:00", "14:00"), timezone="America/New_York"),
+            venue("los angeles", ("monday", "11:00", "14:00"), timezone="America/Los_Angeles"),
+            venue("default", ("monday", "11:00", "14:00")),
+        ], default_timezone="Europe/Berlin")
+        # 12:00 in Berlin, 06:00 in New York and 03:00 in Los Angeles
+        at = datetime(2024, 1, 1, 11, tzinfo=timezone.utc)
+        self.assertEqual(index.open_store_ids(at), ["default"])
+        # 12:00 in New York and 09:00 in Los Angeles
+        self.assertEqual(index.open_store_ids(at.replace(hour=17)), ["new york"])
+        # 20:30 in Berlin, 14:30 in New York and 11:30 in Los Angeles
+        self.assertEqual(index.open_store_ids(at.replace(hour=19, minute=30)), ["los angeles"])
+        self.assertTrue(index.is_open("los angeles", at.replace(hour=20)))
+        self.assertFalse(index.is_open("new york", at.replace(hour=20)))
+
+    def test_size_proportional_to_periods(self):
+        venues = [venue(str(i), ("monday", "11:00", "14:00"), ("friday", "18:00", "02:00")) for i in range(10000)]
+        index = OpenHoursIndex(venues)
+        self.assertEqual(len(index.open_store_ids(datetime(2024, 1, 6, 1))), 10000)
+        # three periods of a few bytes per venue, a bitmap over the minutes of the week would take 12.6 MB
+        self.assertLess(index.nbytes, 10000 * 32)
+
+if __name__ == '__main__':
+    unittest.main()
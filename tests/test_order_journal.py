@@ -0,0 +1,113 @@
+# test_order_journal.py
+import json
+import multiprocessing
+import os
+import tempfile
+import unittest
+from stores.order_journal import OrderJournal
+
+def book_orders(directory, worker, count):
+    journal = OrderJournal(directory, fsync="never", compact_every=7)
+    for i in range(count):
+        journal.append(f"{worker}-{i}", {"status": "accepted", "total_price": i})
+    journal.close()
+
+def book_orders_inherited(journal, worker, count):
+    # the journal was opened by the parent before forking, as by a pre-fork server
+    for i in range(count):
+        journal.append(f"{worker}-{i}", {"status": "accepted", "total_price": i})
+    journal.close()
+
+class TestOrderJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_replay_after_restart(self):
+        journal = OrderJournal(self.directory, fsync="always")
+        journal.append("a", {"status": "accepted"})
+        journal.append("b", {"status": "accepted"})
+        journal.close()
+
+        journal = OrderJournal(self.directory)
+        self.assertEqual(journal.get("a"), {"status": "accepted"})
+        self.assertEqual(len(journal), 2)
+        journal.close()
+
+    def test_compaction_writes_snapshot(self):
+        journal = OrderJournal(self.directory, compact_every=3)
+        for i in range(4):
+            journal.append(str(i), {"total_price": i})
+        journal.close()
+
+        with open(os.path.join(self.directory, "orders.json")) as f:
+            self.assertEqual(len(json.load(f)), 3)
+        with open(os.path.join(self.directory, "orders.journal")) as f:
+            self.assertEqual(len(f.readlines()), 1)
+        self.assertEqual(len(OrderJournal(self.directory)), 4)
+
+    def test_legacy_snapshot_and_torn_write(self):
+        with open(os.path.join(self.directory, "orders.json"), "w") as f:
+            json.dump({"old": {"status": "accepted"}}, f, indent=2)
+        with open(os.path.join(self.directory, "orders.journal"), "w") as f:
+            f.write(json.dumps({"id": "new", "order": {"status": "accepted"}}) + "\n")
+            f.write('{"id": "torn", "ord')
+
+        journal = OrderJournal(self.directory)
+        self.assertEqual(len(journal), 2)
+        journal.append("next", {"status": "accepted"})
+        journal.close()
+        self.assertEqual(len(OrderJournal(self.directory)), 3)
+
+    def test_concurrent_writer_processes(self):
+        workers = [multiprocessing.Process(target=book_orders, args=(self.directory, worker, 50)) for worker in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        journal = OrderJournal(self.directory)
+        self.assertEqual(len(journal), 200)
+        self.assertEqual(journal.get("3-49"), {"status": "accepted", "total_price": 49})
+
+    def test_writers_forked_after_open(self):
+        journal = OrderJournal(self.directory, fsync="never", compact_every=0)
+        journal.append("parent", {"status": "accepted"})
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=book_orders_inherited, args=(journal, worker, 200)) for worker in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual([worker.exitcode for worker in workers], [0] * 4)
+        journal.close()
+
+        with open(os.path.join(self.directory, "orders.journal")) as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 801)
+        self.assertTrue(all(json.loads(line)["order"]["status"] == "accepted" for line in lines))
+        self.assertEqual(len(OrderJournal(self.directory)), 801)
+
+    def test_corrupt_record_quarantined(self):
+        with open(os.path.join(self.directory, "orders.journal"), "wb") as f:
+            f.write(json.dumps({"id": "a", "order": {"status": "accepted"}}).encode() + b"\n")
+            f.write(b'{"id": "b", "ord{"id": \xff\n')
+            f.write(json.dumps({"id": "c", "order": {"status": "accepted"}}).encode() + b"\n")
+
+        journal = OrderJournal(self.directory)
+        self.assertEqual(sorted(journal.orders), ["a", "c"])
+        journal.append("d", {"status": "accepted"})
+        journal.close()
+        journal = OrderJournal(self.directory)
+        self.assertEqual(len(journal), 3)
+        # compaction sets the record aside
+        journal.compact()
+        journal.close()
+        with open(os.path.join(self.directory, "orders.journal.corrupt"), "rb") as f:
+            self.assertEqual(f.read(), b'{"id": "b", "ord{"id": \xff\n')
+
+if __name__ == '__main__':
+    unittest.main()
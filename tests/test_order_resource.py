@@ -1,23 +1,35 @@
 # test_order_resource.py
+import asyncio
 import json
+import threading
 import unittest
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import falcon
+import falcon.asgi
 from falcon import testing
 from main import create_app
 from models.order import OrderDetails
+from resources.order_resource import AsyncOrderResource, OrderResource
 from services.agent.chains import Chains
 from services.agent.embeddings import AgentEmbeddings
 from services.llm_service import Response, ResponseStatus
 from services.eats.mock_eats_api import MockEatsAPI
+from server.backpressure import BackpressureMiddleware
 from stores.userstore import UserStore
 
+# a tuesday noon in new york, when the mock venues near the test address are open, an italian one with calamari included
+OPEN_TIME = datetime(2024, 1, 2, 12, tzinfo=ZoneInfo("America/New_York"))
+
 class TestOrderResource(unittest.TestCase):
     def setUp(self):
         mock_eats_api = MockEatsAPI()
         embeddings = AgentEmbeddings()
         user_store = UserStore(embeddings)
         chains = Chains(user_store)        
-        self.app = create_app(mock_eats_api, chains, embeddings, user_store)
+        self.app = create_app(mock_eats_api, chains, embeddings, user_store, clock=lambda: OPEN_TIME)
         self.client = testing.TestClient(self.app)
 
     def _test_order_req(self, user_id, order, cc_details):
@@ -143,4 +155,100 @@ class TestOrderResource(unittest.TestCase):
             "expiry": "12/23"
         }
 
-        self._test_order_req(user_id, order, cc_details)
\ No newline at end of file
+        self._test_order_req(user_id, order, cc_details)
+
+class StreamingAgent:
+    def handle_input(self, user_id, input_text, listener=None):
+        listener("status", {"stage": "intent_detected", "intent": "PROVIDE_ADDRESS"})
+        for token in ["Please ", "share ", "your ", "budget."]:
+            listener("token", {"text": token})
+        return Response(status=ResponseStatus.REQUEST_BUDGET, response="Please share your budget.")
+
+class EndlessAgent:
+    # streams tokens until its listener stops the turn
+    def __init__(self):
+        self.stopped = threading.Event()
+
+    def handle_input(self, user_id, input_text, listener=None):
+        try:
+            while True:
+                listener("token", {"text": "."})
+                self.stopped.wait(0.01)
+        finally:
+            self.stopped.set()
+
+def parse_events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+class TestQueryStream(unittest.TestCase):
+    def setUp(self):
+        app = falcon.App()
+        app.add_route('/query/stream', OrderResource(StreamingAgent(), None), suffix='query_stream')
+        self.client = testing.TestClient(app)
+
+    def test_query_stream(self):
+        resp = self.client.simulate_post('/query/stream', json={"input": "321 W 54th Street"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.headers["content-type"].startswith("text/event-stream"))
+        self.assertIn("user_id", resp.cookies)
+
+        events = parse_events(resp.text)
+        self.assertEqual(events[0], ("status", {"stage": "received"}))
+        self.assertEqual(events[1], ("status", {"stage": "intent_detected", "intent": "PROVIDE_ADDRESS"}))
+        tokens = "".join(data["text"] for event, data in events if event == "token")
+        self.assertEqual(tokens, "Please share your budget.")
+        self.assertEqual(events[-1][0], "response")
+        self.assertEqual(events[-1][1]["status"], ResponseStatus.REQUEST_BUDGET.value)
+
+    def test_query_stream_requires_input(self):
+        resp = self.client.simulate_post('/query/stream', json={})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_stream_holds_slot_until_closed(self):
+        agent = EndlessAgent()
+        backpressure = BackpressureMiddleware(1, 0, queue_timeout=0.01)
+        app = falcon.App(middleware=[backpressure])
+        app.add_route('/query/stream', OrderResource(agent, None), suffix='query_stream')
+        environ = testing.create_environ('/query/stream', method='POST', body=json.dumps({"input": "sushi"}),
+                                         headers={'Content-Type': 'application/json'})
+        body = app(environ, lambda status, headers: None)
+        self.assertIn(b"received", next(body))
+        self.assertIn(b"token", next(body))
+
+        # the streamed turn still executes, so the only slot is taken
+        self.assertEqual(testing.TestClient(app).simulate_post('/query/stream', json={"input": "pizza"}).status_code, 503)
+        # the client went away: the server closes the body, which frees the slot and stops the turn
+        body.close()
+        self.assertEqual(backpressure.stats()["pending"], 0)
+        self.assertTrue(agent.stopped.wait(5))
+
+class TestAsyncQueryStream(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.app = falcon.asgi.App()
+        self.app.add_route('/query/stream', AsyncOrderResource(OrderResource(StreamingAgent(), None, self.executor), self.executor),
+                           suffix='query_stream')
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_query_stream(self):
+        # the client stays connected until the app finishes the response, the simulated requests of the test client
+        # disconnect right after the request body
+        scope = testing.create_scope('/query/stream', method='POST', headers={'Content-Type': 'application/json'})
+        events = testing.ASGIResponseEventCollector()
+        asyncio.run(asyncio.wait_for(self.app(scope, testing.ASGIRequestEventEmitter(json.dumps({"input": "321 W 54th Street"})), events), 5))
+        self.assertEqual(events.status, 200)
+        self.assertIn(("content-type", "text/event-stream"), events.headers)
+
+        events = parse_events(b"".join(events.body_chunks).decode())
+        self.assertEqual(events[0], ("status", {"stage": "received"}))
+        self.assertEqual(events[1], ("status", {"stage": "intent_detected", "intent": "PROVIDE_ADDRESS"}))
+        tokens = "".join(data["text"] for event, data in events if event == "token")
+        self.assertEqual(tokens, "Please share your budget.")
+        self.assertEqual(events[-1][0], "response")
+        self.assertEqual(events[-1][1]["status"], ResponseStatus.REQUEST_BUDGET.value)
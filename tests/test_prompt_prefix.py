@@ -0,0 +1,76 @@
+import unittest
+
+from langchain.prompts import PromptTemplate
+
+from services.agent.prompt_prefix import PrefixStateCache, static_prefix
+
+class FakeLlama:
+    # word level tokens, keeps count of evaluated tokens like the llama.cpp context would
+    def __init__(self):
+        self.vocab = {}
+        self.input_ids = []
+        self.n_tokens = 0
+        self.evaluated = 0
+
+    def tokenize(self, text: bytes):
+        return [0] + [self.vocab.setdefault(word, len(self.vocab) + 1) for word in text.decode("utf-8").split()]
+
+    def reset(self):
+        self.n_tokens = 0
+
+    def eval(self, tokens):
+        self.input_ids = self.input_ids[:self.n_tokens] + list(tokens)
+        self.n_tokens = len(self.input_ids)
+        self.evaluated += len(tokens)
+
+    def save_state(self):
+        return list(self.input_ids[:self.n_tokens])
+
+    def load_state(self, state):
+        self.input_ids = list(state)
+        self.n_tokens = len(state)
+
+class TestPrefixStateCache(unittest.TestCase):
+    def setUp(self):
+        self.llm = FakeLlama()
+        self.cache = PrefixStateCache()
+        self.qa = PromptTemplate(template="You help with orders. Follow these rules carefully and briefly. Question: {question} Answer:",
+                                 input_variables=["question"])
+        self.answer = PromptTemplate(template="Rephrase this nicely for the customer please: {answer}", input_variables=["answer"])
+        self.cache.register("qa", static_prefix(self.qa))
+        self.cache.register("answer", static_prefix(self.answer))
+
+    def call(self, prompt: str) -> int:
+        self.cache.prefill(self.llm, prompt, self.cache.match(prompt))
+        # the last prompt token is evaluated by llama.cpp during generation
+        self.llm.eval(self.llm.tokenize(prompt.encode("utf-8"))[self.llm.n_tokens:])
+        return len(self.llm.tokenize(prompt.encode("utf-8")))
+
+    def test_static_prefix(self):
+        self.assertEqual(static_prefix(self.qa), "You help with orders. Follow these rules carefully and briefly. Question: ")
+        self.assertEqual(self.cache.match(self.qa.format(question="pizza?")), "qa")
+        self.assertIsNone(self.cache.match("something else"))
+
+    def test_only_suffix_evaluated_across_templates(self):
+        self.call(self.qa.format(question="is there pizza nearby"))
+        self.call(self.answer.format(answer="your order is booked"))
+
+        self.llm.evaluated = 0
+        self.call(self.qa.format(question="any sushi"))
+        # the answer call overwrote the context, the qa prefix is restored rather than evaluated again
+        self.assertEqual(self.llm.evaluated, len("Question: any sushi Answer:".split()))
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["qa"]["prefix_builds"], 1)
+        self.assertEqual(stats["qa"]["prefix_restores"], 1)
+        self.assertEqual(stats["qa"]["calls"], 2)
+        self.assertGreater(stats["qa"]["reused_tokens"], 0)
+        self.assertEqual(stats["qa"]["evaluated_tokens"], stats["qa"]["tokens"] - stats["qa"]["reused_tokens"])
+
+    def test_unregistered_prompt_evaluated_whole(self):
+        tokens = self.call("tell me a joke")
+        self.assertEqual(self.llm.evaluated, tokens)
+        self.assertEqual(self.cache.stats()["none"]["reused_tokens"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+# test_rephrase_cache.py
+import itertools
+import threading
+import unittest
+from services.agent import rephrase_cache
+from services.agent.rephrase_cache import RephraseCache
+
+class TestRephraseCache(unittest.TestCase):
+    def setUp(self):
+        self.counter = itertools.count()
+        self.calls = []
+
+        def rephrase(message):
+            self.calls.append(message)
+            return f"{message} #{next(self.counter)}"
+
+        self.cache = RephraseCache(rephrase, pool_size=3, max_messages=2)
+
+    def test_warm_fills_pools(self):
+        self.cache.warm(["Please provide your address."], background=False)
+        self.assertEqual(len(self.calls), 3)
+
+        replies = {self.cache.get("Please provide your address.") for _ in range(20)}
+        self.assertLessEqual(len(replies), 3)
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(self.cache.stats()["hits"], 20)
+
+    def test_background_warm(self):
+        self.cache.warm(["Please provide your budget."])
+        self.assertTrue(self.cache.wait_warm(timeout=5))
+        self.assertEqual(self.cache.stats()["variants"], 3)
+
+    def test_fork_waits_only_for_running_warm_up(self):
+        release = threading.Event()
+        idle = [RephraseCache(lambda message: message) for _ in range(20)]
+        blocked = RephraseCache(lambda message: release.wait(5) and message, pool_size=1)
+        blocked.warm(["Please provide your address."])
+        self.assertIn(blocked, set(rephrase_cache._warming))
+
+        # the before-fork hook waits for the running warm-up, which holds the model lock
+        before_fork = threading.Thread(target=rephrase_cache._wait_warm_before_fork)
+        before_fork.start()
+        before_fork.join(0.1)
+        self.assertTrue(before_fork.is_alive())
+        release.set()
+        before_fork.join(5)
+        self.assertFalse(before_fork.is_alive())
+        # finished warm-ups and caches that never warmed are not waited for
+        self.assertFalse({blocked, *idle} & set(rephrase_cache._warming))
+
+    def test_miss_generates_once(self):
+        first = self.cache.get("dynamic message")
+        second = self.cache.get("dynamic message")
+        self.assertEqual(first, second)
+        self.assertEqual(self.calls, ["dynamic message"])
+
+    def test_failed_rephrase_returns_original(self):
+        cache = RephraseCache(lambda message: None)
+        self.assertEqual(cache.get("Please provide your budget."), "Please provide your budget.")
+        self.assertEqual(cache.stats()["messages"], 0)
+
+    def test_dynamic_messages_evicted_but_canned_kept(self):
+        self.cache.warm(["canned"], background=False)
+        for i in range(5):
+            self.cache.get(f"dynamic {i}")
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["evictions"], 3)
+        self.assertEqual(stats["messages"], 3)
+
+        calls = len(self.calls)
+        self.cache.get("canned")
+        self.cache.get("dynamic 4")
+        self.assertEqual(len(self.calls), calls)
+        self.cache.get("dynamic 0")
+        self.assertEqual(len(self.calls), calls + 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import json
+import pathlib
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+import falcon
+from falcon import testing
+
+from main import create_app
+from resources.health_resource import HealthResource, ReadinessResource
+from services.eats.fill_api import generate_catalog, write_catalog
+from services.eats.mock_eats_api import MockEatsAPI
+from services import startup
+from services.startup import HEAVY_MODULES, AgentLoader
+from stores.order_journal import OrderJournal
+
+class TestAgentLoader(unittest.TestCase):
+    def client(self, agent_loader: AgentLoader) -> testing.TestClient:
+        app = falcon.App()
+        app.add_route('/healthz', HealthResource(agent_loader))
+        app.add_route('/readyz', ReadinessResource(agent_loader))
+        return testing.TestClient(app)
+
+    def test_background_warm_up(self):
+        release = threading.Event()
+        agent = object()
+        agent_loader = AgentLoader(lambda: release.wait(5) and agent, "background")
+        client = self.client(agent_loader)
+        # forks wait for the loader until the models are loaded
+        self.assertIn(agent_loader, set(startup._loading))
+
+        # alive but not ready while the models load
+        self.assertEqual(client.simulate_get('/healthz').status_code, 200)
+        resp = client.simulate_get('/readyz')
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp.json["status"], "loading")
+
+        release.set()
+        self.assertIs(agent_loader.get(), agent)
+        resp = client.simulate_get('/readyz')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json["status"], "ready")
+        agent_loader.wait(5)
+        self.assertNotIn(agent_loader, set(startup._loading))
+
+    def test_failed_load(self):
+        def fail():
+            raise FileNotFoundError("models/llama-2-7b.Q6_K.gguf")
+        agent_loader = AgentLoader(fail, "lazy")
+        with self.assertRaises(RuntimeError):
+            agent_loader.get()
+        client = self.client(agent_loader)
+        self.assertEqual(client.simulate_get('/healthz').status_code, 503)
+        self.assertIn("llama-2-7b", client.simulate_get('/readyz').json["error"])
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            AgentLoader(object, "later")
+
+class TestStartup(unittest.TestCase):
+    def test_import_main_avoids_heavy_modules(self):
+        # in a fresh interpreter, other tests have imported the model stack already
+        script = f"import json, sys, main; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+        output = subprocess.run([sys.executable, "-c", script], cwd=pathlib.Path(__file__).parent.parent, capture_output=True, text=True, check=True)
+        self.assertEqual(json.loads(output.stdout.strip().splitlines()[-1]), [])
+
+    def test_lazy_app_loads_on_first_query(self):
+        with tempfile.TemporaryDirectory() as directory:
+            write_catalog(generate_catalog(10, (5, 10), seed=2, hours=False), directory)
+            eats_api = MockEatsAPI(OrderJournal(f"{directory}/orders"), data_dir=directory, catalog_cache_dir=directory)
+            try:
+                client = testing.TestClient(create_app(eats_api, backend="fake", startup="lazy", menu_index_path=f"{directory}/menu_index"))
+                self.assertEqual(client.simulate_get('/healthz').status_code, 200)
+                self.assertEqual(client.simulate_get('/readyz').status_code, 503)
+                resp = client.simulate_post('/query', json={"input": "I'd like sushi tonight"})
+                self.assertEqual(resp.status_code, 200)
+                self.assertEqual(client.simulate_get('/readyz').status_code, 200)
+            finally:
+                eats_api.order_journal.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from services.agent.turn_graph import TurnGraph, TurnGraphStats
+from services.metrics import metrics
+
+class TestTurnGraph(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.stats = TurnGraphStats()
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    @staticmethod
+    def sleep(seconds: float, value):
+        time.sleep(seconds)
+        return value
+
+    def test_independent_nodes_overlap(self):
+        graph = TurnGraph(self.executor)
+        start = time.perf_counter()
+        a = graph.add("a", self.sleep, 0.2, 1)
+        b = graph.add("b", self.sleep, 0.2, 2)
+        total = graph.add("sum", lambda x, y: x + y, after=(a, b))
+        self.assertEqual(graph.result(total), 3)
+        self.assertLess(time.perf_counter() - start, 0.35)
+
+    def test_critical_path(self):
+        graph = TurnGraph(self.executor)
+        fast = graph.add("fast", self.sleep, 0.01, None)
+        slow = graph.add("slow", self.sleep, 0.1, None)
+        graph.result(graph.add("search", lambda *_: self.sleep(0.01, None), after=(fast, slow)))
+        path, seconds = graph.critical_path()
+        self.assertEqual(path, ["slow", "search"])
+        self.assertGreaterEqual(seconds, 0.11)
+
+    def test_critical_path_recorded_into_turn(self):
+        histogram = metrics.histogram("critical_path", intent="PROVIDE_BUDGET", path="budget>index_search")
+        count = histogram.count
+        with metrics.turn(intent="PROVIDE_BUDGET"):
+            graph = TurnGraph(self.executor)
+            budget = graph.add("budget", self.sleep, 0.0, 20)
+            graph.result(graph.add("index_search", lambda amount: amount, after=(budget,)))
+            graph.close()
+        self.assertEqual(histogram.count, count + 1)
+
+    def test_unneeded_speculation_cancelled(self):
+        release = threading.Event()
+        ran = []
+        graph = TurnGraph(self.executor, stats=self.stats)
+        blocked = graph.add("venues", lambda: release.wait(5), speculative=True)
+        graph.add("index_search", lambda _: ran.append("index_search"), after=(blocked,), speculative=True)
+        used = graph.add("embedding", self.sleep, 0.0, 1, speculative=True)
+        # asking for a speculative node for sure keeps it
+        self.assertIs(graph.add("embedding", self.sleep, 0.0, 2), used)
+        self.assertEqual(graph.result(used), 1)
+        graph.close()
+        release.set()
+        self.executor.shutdown()
+        self.assertEqual(ran, [])
+        self.assertEqual(self.stats.stats(), {"speculative": 3, "speculative_used": 1, "speculative_discarded": 2, "cancelled": 2})
+
+    def test_sequential_without_executor(self):
+        order = []
+        graph = TurnGraph(stats=self.stats)
+        graph.add("speculative", order.append, "speculative", speculative=True)
+        budget = graph.add("budget", lambda: order.append("budget") or 20)
+        search = graph.add("index_search", lambda amount: order.append("index_search") or amount, after=(budget,))
+        self.assertEqual(order, [])
+        self.assertEqual(graph.result(search), 20)
+        graph.close()
+        self.assertEqual(order, ["budget", "index_search"])
+        self.assertEqual(graph.critical_path()[0], ["budget", "index_search"])
+
+    def test_errors_reach_dependents(self):
+        def fail():
+            raise ValueError("no venues")
+        for graph in (TurnGraph(self.executor), TurnGraph()):
+            venues = graph.add("venues", fail)
+            search = graph.add("index_search", lambda venue_ids: venue_ids, after=(venues,))
+            with self.assertRaises(ValueError):
+                graph.result(search)
+
+if __name__ == "__main__":
+    unittest.main()
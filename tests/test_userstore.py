@@ -0,0 +1,139 @@
+# test_userstore.py
+import threading
+import unittest
+from stores.userstore import UserStore
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def _embed(self, text):
+        return [float(text.count(letter)) for letter in "abcdefgh"]
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self._embed(text)
+
+class FakeAgentEmbeddings:
+    def __init__(self):
+        self.embeddings = FakeEmbeddings()
+
+    def get_embeddings(self):
+        return self.embeddings
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestUserStore(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.user_store = UserStore(FakeAgentEmbeddings(), max_sessions=2, ttl_seconds=60, shards=1, clock=self.clock)
+
+    def test_get_set_has(self):
+        self.assertFalse(self.user_store.has_address("u1"))
+        self.assertIsNone(self.user_store.get_budget("u1"))
+        self.assertEqual(self.user_store.get_preferences("u1"), [])
+        self.assertEqual(self.user_store.stats()["sessions"], 0)
+
+        self.user_store.set_address("u1", "321 W 54th Street")
+        self.user_store.set_budget("u1", 20)
+        self.user_store.set_preference("u1", "italian")
+        self.user_store.set_preference("u1", "calamari")
+        self.assertTrue(self.user_store.has_address("u1"))
+        self.assertEqual(self.user_store.get_budget("u1"), 20)
+        self.assertEqual(self.user_store.get_preferences("u1"), ["italian", "calamari"])
+
+        self.user_store.clear_budget("u1")
+        self.user_store.clear_preferences("u1")
+        self.assertFalse(self.user_store.has_budget("u1"))
+        self.assertFalse(self.user_store.has_preferences("u1"))
+
+    def test_idle_sessions_expire(self):
+        self.user_store.set_address("u1", "address")
+        self.clock.now = 59
+        self.assertTrue(self.user_store.has_address("u1"))
+        self.clock.now = 118
+        self.assertTrue(self.user_store.has_address("u1"))
+        self.clock.now = 200
+        self.assertFalse(self.user_store.has_address("u1"))
+        self.assertEqual(self.user_store.stats()["expirations"], 1)
+
+    def test_least_recently_used_evicted(self):
+        self.user_store.set_address("u1", "a1")
+        self.user_store.set_address("u2", "a2")
+        self.user_store.get_address("u1")
+        self.user_store.set_address("u3", "a3")
+
+        self.assertTrue(self.user_store.has_address("u1"))
+        self.assertFalse(self.user_store.has_address("u2"))
+        self.assertTrue(self.user_store.has_address("u3"))
+        stats = self.user_store.stats()
+        self.assertEqual(stats["sessions"], 2)
+        self.assertEqual(stats["evictions"], 1)
+
+    def test_max_sessions_below_shards(self):
+        user_store = UserStore(FakeAgentEmbeddings(), max_sessions=3, shards=16)
+        for i in range(50):
+            user_store.set_address(f"u{i}", str(i))
+        stats = user_store.stats()
+        self.assertLessEqual(stats["sessions"], 3)
+        self.assertEqual(stats["sessions"] + stats["evictions"], 50)
+
+    def test_max_sessions_not_divisible_by_shards(self):
+        user_store = UserStore(FakeAgentEmbeddings(), max_sessions=20, shards=16)
+        for i in range(500):
+            user_store.set_address(f"u{i}", str(i))
+        self.assertLessEqual(user_store.stats()["sessions"], 20)
+
+    def test_concurrent_writers(self):
+        user_store = UserStore(FakeAgentEmbeddings())
+
+        def add_preferences():
+            for i in range(200):
+                user_store.set_preference("shared", str(i))
+
+        threads = [threading.Thread(target=add_preferences) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(user_store.get_preferences("shared")), 1600)
+
+    def test_user_vectors_allocated_lazily(self):
+        embeddings = self.user_store.embeddings
+        vector_db = self.user_store.get_user_vector_db("u1")
+        self.assertEqual(len(vector_db), 0)
+        self.assertEqual(embeddings.calls, 0)
+        self.assertIsNone(self.user_store.user_vectors.dimension)
+        self.assertEqual(vector_db.similarity_search("abc"), [])
+
+        vector_db.add_texts(["aaa", "bbb", "abab"])
+        self.user_store.get_user_vector_db("u2").add_texts(["aaaa"])
+        self.assertEqual(self.user_store.user_vectors.dimension, 8)
+
+        documents = vector_db.similarity_search("aaa", k=2)
+        self.assertEqual([document.page_content for document in documents], ["aaa", "abab"])
+
+    def test_user_vectors_released_with_session(self):
+        self.user_store.set_address("u1", "a1")
+        self.user_store.get_user_vector_db("u1").add_texts(["aaa", "bbb"])
+        self.assertEqual(self.user_store.user_vectors.stats()["rows"], 2)
+
+        self.clock.now = 100
+        self.user_store.stats()
+        self.assertEqual(self.user_store.user_vectors.stats(), {"users": 0, "rows": 0, "capacity": 1024})
+
+        self.user_store.set_address("u2", "a2")
+        self.user_store.get_user_vector_db("u2").add_texts(["ccc"])
+        self.assertEqual(self.user_store.user_vectors.stats()["rows"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
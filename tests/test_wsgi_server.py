@@ -0,0 +1,79 @@
+# test_wsgi_server.py
+import http.client
+import threading
+import time
+import unittest
+
+import falcon
+
+from server.backpressure import BackpressureMiddleware
+from server.wsgi import make_threaded_server, pool_threads
+
+class BlockingResource:
+    def __init__(self):
+        self.started = threading.Semaphore(0)
+        self.release = threading.Event()
+
+    def on_get(self, req, resp):
+        self.started.release()
+        self.release.wait(10)
+        resp.media = {"done": True}
+
+class HealthResource:
+    def on_get(self, req, resp):
+        resp.media = {"status": "ok"}
+
+class TestThreadPoolWSGIServer(unittest.TestCase):
+    def setUp(self):
+        self.blocking = BlockingResource()
+        app = falcon.App(middleware=[BackpressureMiddleware(max_concurrency=2, max_queue=2, queue_timeout=10)])
+        app.add_route("/blocking", self.blocking)
+        app.add_route("/healthz", HealthResource())
+        self.server = make_threaded_server("127.0.0.1", 0, app, pool_threads(0, 2, 2))
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.blocking.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, path: str) -> int:
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=15)
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+    def test_saturated_server_rejects_and_stays_healthy(self):
+        statuses = []
+        clients = [threading.Thread(target=lambda: statuses.append(self.get("/blocking"))) for _ in range(12)]
+        for client in clients:
+            client.start()
+        # two requests execute and two wait for a slot, the other eight are answered with 503 while they're blocked
+        for _ in range(2):
+            self.assertTrue(self.blocking.started.acquire(timeout=5))
+        deadline = time.monotonic() + 5
+        while len(statuses) < 8 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(statuses, [503] * 8)
+
+        start = time.monotonic()
+        self.assertEqual(self.get("/healthz"), 200)
+        self.assertLess(time.monotonic() - start, 1.0)
+
+        self.blocking.release.set()
+        for client in clients:
+            client.join(15)
+        self.assertEqual(sorted(statuses), [200] * 4 + [503] * 8)
+
+    def test_backlog_rejected_on_accept(self):
+        self.server.max_backlog = 0
+        self.assertEqual(self.get("/healthz"), 503)
+        self.assertEqual(self.server.rejected, 1)
+
+if __name__ == '__main__':
+    unittest.main()